@@ -10,6 +10,7 @@ set -m
 source /scripts/neo4j_init.sh
 chmod +x /scripts/neo4j_init.sh
 
+execute_cypher "/var/lib/neo4j/import/migrate_watch_providers.cypher" "Migrate Watch Provider Edges" 3
 execute_cypher "/var/lib/neo4j/import/constraints.cypher" "Create Index" 3
 execute_cypher "/var/lib/neo4j/import/nodes.cypher" "Create Nodes" 3
 
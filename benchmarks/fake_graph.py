@@ -0,0 +1,208 @@
+import pathlib
+import re
+import threading
+from collections import Counter, defaultdict
+from types import SimpleNamespace
+from typing import Dict, List
+
+SEED_SCRIPT = pathlib.Path(__file__).resolve().parent.parent / "kg_scripts" / "2_init_nodes.cypher"
+
+NODE_KEYS = {
+    "Movie": "movie_id",
+    "Collection": "collection_id",
+    "Company": "company_id",
+    "Person": "person_id",
+    "Genre": "genre_id",
+    "Language": "language_id",
+    "Country": "country_id",
+    "WatchProvider": "provider_id"
+}
+
+SEED_PATTERN = re.compile(r'MERGE \(n: ?(\w+) \{(\w+): ("[^"]*"|-?\d+)')
+LOOKUP_PATTERN = re.compile(r"^MATCH \(n: ?(\w+) \{(\w+): (.+?)\}\) RETURN n$")
+SCAN_PATTERN = re.compile(r"^MATCH \(n: ?(\w+)\) (?:WHERE n\.(\w+) IN \$(\w+).*)?RETURN n\.(\w+) AS (\w+)$")
+MERGE_PATTERN = re.compile(r"^MERGE \(n: ?(\w+) \{(\w+): \$(\w+)\}\)")
+UNWIND_MERGE_PATTERN = re.compile(r"^UNWIND \$(\w+) AS row MERGE \(n: ?(\w+) \{(\w+): row\.(\w+)\}\)")
+CREATE_PATTERN = re.compile(r"^CREATE \(n: ?(\w+) ")
+BATCH_EDGE_PATTERN = re.compile(
+    r"^UNWIND \$(\w+) AS row MATCH \(h: ?(\w+) \{(\w+): row\.head_id\}\)(?:, |-\[r: ?\w+\]->)\(t: ?(\w+) \{(\w+): row\.tail_id\}\).* AS matched$"
+)
+WRITE_PATTERN = re.compile(r"\b(CREATE|MERGE|SET|DELETE)\b")
+
+def collapse_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip()
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"(?<![\w$.])-?\d+(\.\d+)?\b", "?", collapse_query(query))
+
+def load_seed_nodes(path: pathlib.Path=SEED_SCRIPT) -> Dict:
+    nodes = defaultdict(set)
+
+    with open(path, "r") as fp:
+        for match in SEED_PATTERN.finditer(fp.read()):
+            node_label, _, value = match.groups()
+            nodes[node_label].add(value.strip('"') if value.startswith('"') else int(value))
+
+    return nodes
+
+def build_summary(
+    is_write: bool,
+    nodes_created: int
+) -> SimpleNamespace:
+    # relationship and property effects aren't tracked, so any write that isn't
+    # a node creation is reported as having updated something
+    counters = SimpleNamespace(
+        nodes_created=nodes_created,
+        nodes_deleted=0,
+        relationships_created=0,
+        relationships_deleted=0,
+        properties_set=0,
+        contains_updates=is_write
+    )
+    return SimpleNamespace(counters=counters, result_available_after=0, result_consumed_after=0)
+
+class FakeResult:
+    def __init__(
+        self,
+        records: List[Dict],
+        summary: SimpleNamespace=None
+    ):
+        self.records = records
+        self.summary = summary if summary != None else build_summary(False, 0)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def single(self):
+        return self.records[0] if self.records != [] else None
+
+    def data(self) -> List[Dict]:
+        return list(self.records)
+
+    def consume(self) -> SimpleNamespace:
+        return self.summary
+
+class FakeSession:
+    def __init__(
+        self,
+        driver
+    ):
+        self.driver = driver
+
+    def run(
+        self,
+        query: str,
+        parameters: Dict=None,
+        **kwargs
+    ) -> FakeResult:
+        return self.driver.execute(query, (parameters or {}) | kwargs)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class RecordingDriver:
+    # In-process Cypher sink. It records every statement by template and keeps
+    # just enough node state (ids per label) to answer the existence checks and
+    # reference lookups the ETL issues. Relationship reads return nothing.
+    def __init__(
+        self,
+        seed_nodes: Dict=None
+    ):
+        self.nodes = defaultdict(set)
+        for node_label, ids in (seed_nodes if seed_nodes != None else load_seed_nodes()).items():
+            self.nodes[node_label].update(ids)
+
+        self.statements = Counter()
+        self.writes = Counter()
+        self.lock = threading.Lock()
+
+    def session(self, **kwargs) -> FakeSession:
+        return FakeSession(self)
+
+    def close(self):
+        pass
+
+    def execute(
+        self,
+        query: str,
+        parameters: Dict
+    ) -> FakeResult:
+        query = collapse_query(query)
+        normalized = normalize_query(query)
+
+        is_write = WRITE_PATTERN.search(normalized) != None
+
+        with self.lock:
+            self.statements[normalized] += 1
+            if is_write:
+                self.writes[normalized] += 1
+
+            node_count = sum(len(ids) for ids in self.nodes.values())
+            records = self.apply(query, parameters)
+            nodes_created = sum(len(ids) for ids in self.nodes.values()) - node_count
+
+            return FakeResult(records, build_summary(is_write, nodes_created))
+
+    def apply(
+        self,
+        query: str,
+        parameters: Dict
+    ) -> List[Dict]:
+        match = LOOKUP_PATTERN.match(query)
+        if match != None:
+            node_label, _, value = match.groups()
+            value = value.strip('"\'') if value[0] in "\"'" else int(value)
+            return [{"n": {NODE_KEYS.get(node_label): value}}] if value in self.nodes[node_label] else []
+
+        match = SCAN_PATTERN.match(query)
+        if match != None:
+            node_label, _, ids_parameter, _, alias = match.groups()
+            ids = self.nodes[node_label]
+            if ids_parameter != None:
+                ids = ids & set(parameters[ids_parameter])
+            return [{alias: property_id} for property_id in ids]
+
+        match = UNWIND_MERGE_PATTERN.match(query)
+        if match != None:
+            rows_parameter, node_label, _, row_key = match.groups()
+            self.nodes[node_label].update(row[row_key] for row in parameters[rows_parameter])
+            return []
+
+        match = MERGE_PATTERN.match(query)
+        if match != None:
+            node_label, _, parameter = match.groups()
+            self.nodes[node_label].add(parameters[parameter])
+            return []
+
+        match = BATCH_EDGE_PATTERN.match(query)
+        if match != None:
+            # relationships aren't kept, so a row matches when both of its nodes exist
+            rows_parameter, head_label, _, tail_label, _ = match.groups()
+            matched = sum(
+                row["head_id"] in self.nodes[head_label] and row["tail_id"] in self.nodes[tail_label]
+                for row in parameters[rows_parameter]
+            )
+            return [{"matched": matched}]
+
+        match = CREATE_PATTERN.match(query)
+        if match != None:
+            node_label = match.group(1)
+            if NODE_KEYS.get(node_label) in parameters:
+                self.nodes[node_label].add(parameters[NODE_KEYS[node_label]])
+            return []
+
+        return []
+
+    def get_report(self) -> Dict:
+        return {
+            "statements": sum(self.statements.values()),
+            "write_statements": sum(self.writes.values()),
+            "statements_by_template": dict(self.statements.most_common()),
+            "nodes": {node_label: len(ids) for node_label, ids in self.nodes.items()}
+        }
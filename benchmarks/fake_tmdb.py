@@ -0,0 +1,141 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+ROUTES = [
+    (re.compile(r"^/3/discover/movie$"), "discover"),
+    (re.compile(r"^/3/movie/(\d+)/credits$"), "credits"),
+    (re.compile(r"^/3/movie/(\d+)/watch/providers$"), "watch providers"),
+    (re.compile(r"^/3/movie/(\d+)$"), "movie"),
+    (re.compile(r"^/3/collection/(\d+)$"), "collection"),
+    (re.compile(r"^/3/company/(\d+)$"), "company"),
+    (re.compile(r"^/3/person/(\d+)$"), "person")
+]
+
+class FakeTMDBServer:
+    # Local stand-in for api.themoviedb.org. Point the ETL at it with
+    # TMDB_API_URL=<server.url> before importing the flows.
+    def __init__(
+        self,
+        workload,
+        latency: float=0.0,
+        error_rate: float=0.0,
+        seed: int=0,
+        host: str="127.0.0.1",
+        port: int=0
+    ):
+        self.workload = workload
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = Counter()
+        self.throttled = Counter()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.build_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/3"
+
+    def build_handler(self):
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake_server.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def get_payload(
+        self,
+        endpoint: str,
+        entity_id: int,
+        query: dict
+    ):
+        if endpoint == "discover":
+            return self.workload.get_discover_page(int(query.get("page", ["1"])[0]))
+        if endpoint == "movie":
+            return self.workload.get_movie(entity_id)
+        if endpoint == "credits":
+            return self.workload.get_credits(entity_id)
+        if endpoint == "watch providers":
+            return self.workload.get_watch_providers(entity_id)
+        if endpoint == "collection":
+            return self.workload.get_collection(entity_id)
+        if endpoint == "company":
+            return self.workload.get_company(entity_id)
+
+        return self.workload.get_person(entity_id)
+
+    def handle(
+        self,
+        request: BaseHTTPRequestHandler
+    ):
+        parsed = urlparse(request.path)
+
+        for pattern, endpoint in ROUTES:
+            match = pattern.match(parsed.path)
+            if match != None:
+                break
+        else:
+            self.respond(request, 404, {"status_message": f"Unknown path {parsed.path}"})
+            return
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        with self.lock:
+            self.requests[endpoint] += 1
+            throttle = self.random.random() < self.error_rate
+            if throttle:
+                self.throttled[endpoint] += 1
+
+        if throttle:
+            self.respond(request, 429, {"status_code": 25, "status_message": "Request count over limit"}, {"Retry-After": "1"})
+            return
+
+        entity_id = int(match.group(1)) if match.groups() else None
+        self.respond(request, 200, self.get_payload(endpoint, entity_id, parse_qs(parsed.query)))
+
+    def respond(
+        self,
+        request: BaseHTTPRequestHandler,
+        status: int,
+        payload: dict,
+        headers: dict={}
+    ):
+        body = json.dumps(payload).encode()
+
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(body)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,400 @@
+import argparse
+import asyncio
+import copy
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+from bs4 import BeautifulSoup
+
+from benchmarks.synthetic import DEPARTMENT_JOBS
+from benchmarks.workload import FIXTURES_DIR
+
+SIZES = ["small", "typical", "pathological"]
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "microbench.json")
+
+class InstantAsyncio:
+    # Stands in for the asyncio module inside etl_task. The cleaners only await
+    # their pacing sleep, so with a sleep that never suspends the coroutine can
+    # be driven to completion without an event loop.
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+    @staticmethod
+    async def sleep(delay, result=None):
+        return result
+
+def run_coroutine(coroutine):
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+
+    coroutine.close()
+    raise RuntimeError("Transform suspended on something other than asyncio.sleep")
+
+def load_fixture(name: str) -> Dict:
+    with open(FIXTURES_DIR / name, "r") as fp:
+        return json.load(fp)
+
+def build_crew(size: int) -> List[Dict]:
+    departments = list(DEPARTMENT_JOBS)
+    crew = []
+    for person_id in range(1, size + 1):
+        department = departments[person_id % len(departments)]
+        crew.append({
+            "adult": False,
+            "gender": person_id % 4,
+            "id": person_id,
+            "known_for_department": department,
+            "name": f"Person {person_id}",
+            "credit_id": f"crew-{person_id}",
+            "department": department,
+            "job": DEPARTMENT_JOBS[department][person_id % len(DEPARTMENT_JOBS[department])]
+        })
+
+    return crew
+
+def build_cast(size: int) -> List[Dict]:
+    return [
+        {
+            "adult": False,
+            "gender": person_id % 4,
+            "id": person_id,
+            "known_for_department": "Acting",
+            "name": f"Person {person_id}",
+            "character": f"Character {person_id}",
+            "credit_id": f"cast-{person_id}",
+            "order": person_id - 1
+        } for person_id in range(1, size + 1)
+    ]
+
+def build_provider_map(
+    region_count: int,
+    providers_per_type: int
+) -> Dict:
+    regions = [f"{chr(65 + index // 26)}{chr(65 + index % 26)}" for index in range(region_count)]
+
+    return {
+        "id": 1,
+        "results": {
+            region: {"link": f"https://www.themoviedb.org/movie/1/watch?locale={region}"} | {
+                watch_type: [
+                    {"logo_path": None, "provider_id": provider_id, "provider_name": f"Provider {provider_id}", "display_priority": 0}
+                    for provider_id in range(offset, offset + providers_per_type)
+                ]
+                for offset, watch_type in enumerate(["buy", "rent", "flatrate"])
+            }
+            for region in regions
+        }
+    }
+
+def build_noise(size: int) -> str:
+    # unrelated markup that find() has to walk past, like the rest of a real page
+    return "".join(f'<div class="noise-{index % 50}"><span>{index}</span></div>' for index in range(size))
+
+def build_metacritic_section(
+    score: str,
+    counts: List[int],
+    noise: int=0
+) -> str:
+    total = max(sum(counts), 1)
+    sentiments = "".join(
+        f"<div>{count * 100 // total}% {label} {count} Reviews</div>"
+        for label, count in zip(["Positive", "Mixed", "Negative"], counts)
+    )
+
+    return (
+        '<div class="c-reviewsOverview_overviewDetails">'
+        f'{build_noise(noise)}<div class="c-siteReviewScore">{score}</div>'
+        f'<div class="c-reviewsStats">{sentiments}</div>'
+        '</div>'
+    )
+
+def build_imdb_page(noise: int) -> BeautifulSoup:
+    return BeautifulSoup(
+        f'<html><body>{build_noise(noise)}<div class="sc-3a4309f8-1 dOjKRs">'
+        '<span class="sc-d541859f-1 imUuxf">7.4</span><div class="sc-d541859f-3 dwhNqC">1.2M</div>'
+        '</div></body></html>',
+        "html.parser"
+    )
+
+def build_metacritic_page(noise: int) -> BeautifulSoup:
+    return BeautifulSoup(
+        f'<html><body>{build_noise(noise)}'
+        f'{build_metacritic_section("78", [40, 8, 2])}'
+        f'{build_metacritic_section("7.9", [900, 120, 45])}'
+        f'{build_metacritic_section("8.1", [1200, 200, 80])}'
+        '</body></html>',
+        "html.parser"
+    )
+
+def build_rotten_tomatoes_page(noise: int) -> BeautifulSoup:
+    return BeautifulSoup(
+        f'<html><body>{build_noise(noise)}<div class="media-scorecard">'
+        '<rt-text slot="criticsScore">92%</rt-text><rt-link slot="criticsReviews">312 Reviews</rt-link>'
+        '<rt-text slot="audienceScore">85%</rt-text><rt-link slot="audienceReviews">2,500+ Ratings</rt-link>'
+        '</div></body></html>',
+        "html.parser"
+    )
+
+def build_movie_inputs() -> Dict:
+    movie = load_fixture("movie_details_912649.json")
+    movie["external_ids"] = {"wikidata_id": None}
+
+    small = copy.deepcopy(movie)
+    small["credits"] = {"cast": movie["credits"]["cast"][:3], "crew": movie["credits"]["crew"][:3]}
+
+    pathological = copy.deepcopy(movie)
+    pathological["credits"] = {"cast": build_cast(500), "crew": build_crew(5000)}
+
+    return {
+        "small": (small["id"], small),
+        "typical": (movie["id"], movie),
+        "pathological": (pathological["id"], pathological)
+    }
+
+def build_cases() -> Dict[str, Dict]:
+    from src.movie_etl.tasks import etl_task
+    from src.movie_etl.utils.etl import parse_property, extract_metacritic_data
+
+    person = load_fixture("person_details_2524.json")
+    person_properties = {
+        "person_id": person["id"],
+        "name": person["name"],
+        "gender": "Male",
+        "biography": person["biography"],
+        "place_of_birth": person["place_of_birth"],
+        "birthday": person["birthday"],
+        "deathday": person["deathday"],
+        "popularity": person["popularity"]
+    }
+    wide_properties = {f"property_{index}": index for index in range(500)} | {"birthday": "1977-09-15", "deathday": "2020-01-01"}
+
+    async_case = lambda function: lambda *args: run_coroutine(function(*args))
+
+    return {
+        "clean_movie_details": {
+            "function": async_case(etl_task.clean_movie_details.fn),
+            "inputs": build_movie_inputs
+        },
+        "clean_watch_providers": {
+            "function": async_case(etl_task.clean_watch_providers.fn),
+            "inputs": lambda: {
+                "small": (1, {"id": 1, "results": {"US": {"flatrate": [{"provider_id": 8}]}}}),
+                "typical": (123, load_fixture("watch_providers_123.json")),
+                "pathological": (1, build_provider_map(150, 40))
+            }
+        },
+        "parse_property": {
+            "function": parse_property,
+            "inputs": lambda: {
+                "small": ({"collection_id": 1, "name": "Collection", "overview": None},),
+                "typical": (person_properties, {}, ["birthday", "deathday"]),
+                "pathological": (wide_properties, {f"property_{index}": f"renamed_{index}" for index in range(100)}, ["birthday", "deathday"])
+            }
+        },
+        "extract_metacritic_data": {
+            "function": extract_metacritic_data,
+            "inputs": lambda: {
+                size: (BeautifulSoup(build_metacritic_section("78", [40, 8, 2], noise), "html.parser").div,)
+                for size, noise in [("small", 0), ("typical", 50), ("pathological", 5000)]
+            }
+        },
+        "clean_imdb_ratings": {
+            "function": async_case(etl_task.clean_imdb_ratings.fn),
+            "inputs": lambda: {
+                size: ("tt0000001", build_imdb_page(noise))
+                for size, noise in [("small", 0), ("typical", 500), ("pathological", 20000)]
+            }
+        },
+        "clean_metacritic_ratings": {
+            "function": async_case(etl_task.clean_metacritic_ratings.fn),
+            "inputs": lambda: {
+                size: ("movie/example", build_metacritic_page(noise))
+                for size, noise in [("small", 0), ("typical", 500), ("pathological", 20000)]
+            }
+        },
+        "clean_rotten_tomatoes_ratings": {
+            "function": async_case(etl_task.clean_rotten_tomatoes_ratings.fn),
+            "inputs": lambda: {
+                size: ("m/example", build_rotten_tomatoes_page(noise))
+                for size, noise in [("small", 0), ("typical", 500), ("pathological", 20000)]
+            }
+        }
+    }
+
+def time_calls(
+    function: Callable,
+    args: tuple,
+    number: int
+) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        function(*args)
+
+    return time.perf_counter() - start
+
+def measure_speed(
+    function: Callable,
+    args: tuple,
+    min_time: float=0.5,
+    rounds: int=5
+) -> Dict:
+    # grow the loop until one round is long enough for perf_counter noise not to matter
+    number = 1
+    while time_calls(function, args, number) < min_time / rounds / 10:
+        number *= 2
+    number *= 10
+
+    timings = [time_calls(function, args, number) / number for _ in range(rounds)]
+
+    return {
+        "ops_per_second": 1 / min(timings),
+        "median_seconds": statistics.median(timings),
+        "loops": number,
+        "rounds": rounds
+    }
+
+def measure_allocations(
+    function: Callable,
+    args: tuple
+) -> Dict:
+    function(*args)
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = function(*args)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+
+    return {
+        "peak_bytes": peak - before,
+        "retained_bytes": after - before
+    }
+
+@contextmanager
+def instant_sleeps():
+    from src.movie_etl.tasks import etl_task
+
+    original = etl_task.asyncio
+    etl_task.asyncio = InstantAsyncio()
+    try:
+        yield
+    finally:
+        etl_task.asyncio = original
+
+def run_microbenchmarks(
+    case_names: List=None,
+    sizes: List=SIZES,
+    min_time: float=0.5,
+    rounds: int=5
+) -> Dict:
+    results = {}
+    cases = build_cases()
+
+    with instant_sleeps():
+        for case_name, case in cases.items():
+            if case_names != None and case_name not in case_names:
+                continue
+
+            inputs = case["inputs"]()
+            for size in sizes:
+                results[f"{case_name}[{size}]"] = (
+                    measure_speed(case["function"], inputs[size], min_time=min_time, rounds=rounds)
+                    | measure_allocations(case["function"], inputs[size])
+                )
+
+    return results
+
+def compare_results(
+    results: Dict,
+    baseline: Dict,
+    threshold: float=0.2
+) -> List[Dict]:
+    regressions = []
+
+    for key, stats in results.items():
+        if key not in baseline:
+            continue
+
+        speed_ratio = stats["ops_per_second"] / baseline[key]["ops_per_second"]
+        memory_ratio = stats["peak_bytes"] / max(baseline[key]["peak_bytes"], 1)
+        if speed_ratio < 1 - threshold or memory_ratio > 1 + threshold:
+            regressions.append({
+                "benchmark": key,
+                "speed_ratio": speed_ratio,
+                "memory_ratio": memory_ratio
+            })
+
+    return regressions
+
+def format_results(
+    results: Dict,
+    baseline: Dict=None
+) -> str:
+    lines = [f"{'benchmark':<45} {'ops/sec':>12} {'peak KB':>10} {'retained KB':>12} {'vs baseline':>12}"]
+
+    for key, stats in results.items():
+        change = ""
+        if baseline != None and key in baseline:
+            change = f"{stats['ops_per_second'] / baseline[key]['ops_per_second'] - 1:+.1%}"
+        lines.append(
+            f"{key:<45} {stats['ops_per_second']:>12.1f} {stats['peak_bytes'] / 1024:>10.1f} "
+            f"{stats['retained_bytes'] / 1024:>12.1f} {change:>12}"
+        )
+
+    return "\n".join(lines)
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Time the per-movie transform functions on small, typical and pathological inputs")
+    parser.add_argument("--cases", nargs="+", help="only run these transforms")
+    parser.add_argument("--sizes", nargs="+", choices=SIZES, default=SIZES)
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds spent timing each benchmark")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="exit with status 1 when a benchmark regressed against the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed fractional drop in ops/sec or growth in peak memory")
+
+    return parser
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    results = run_microbenchmarks(args.cases, args.sizes, min_time=args.min_time, rounds=args.rounds)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as fp:
+            baseline = json.load(fp)["results"]
+
+    print(format_results(results, baseline))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as fp:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results}, fp, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+
+    if args.compare:
+        if baseline == None:
+            sys.exit(f"No baseline at {args.baseline}, run with --save-baseline first")
+
+        regressions = compare_results(results, baseline, args.threshold)
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression['benchmark']}: {regression['speed_ratio']:.2f}x ops/sec, "
+                f"{regression['memory_ratio']:.2f}x peak memory"
+            )
+        if regressions != []:
+            sys.exit(1)
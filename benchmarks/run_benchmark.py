@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import ExitStack
+from typing import Dict
+from unittest.mock import patch
+
+from benchmarks.fake_tmdb import FakeTMDBServer
+from benchmarks.fake_graph import RecordingDriver
+from benchmarks.workload import FixtureWorkload
+from benchmarks.synthetic import SyntheticWorkload
+
+class NoSleepAsyncio:
+    # Stands in for the asyncio module inside the task modules, so the fixed
+    # pacing sleeps after every task don't dominate the measurement.
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+    @staticmethod
+    async def sleep(delay, result=None):
+        return await asyncio.sleep(0, result)
+
+def get_peak_rss_mb() -> float:
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak_rss / 1024 / 1024 if sys.platform == "darwin" else peak_rss / 1024
+
+def build_workload(args):
+    if args.workload == "synthetic":
+        return SyntheticWorkload(
+            args.movies,
+            seed=args.seed,
+            person_pool=args.person_pool,
+            company_pool=args.company_pool,
+            collection_pool=args.collection_pool,
+            exponent=args.zipf_exponent,
+            company_chain_depth=args.company_chain_depth
+        )
+
+    return FixtureWorkload(args.movies)
+
+def run_benchmark(args) -> Dict:
+    workload = build_workload(args)
+    server = FakeTMDBServer(workload, latency=args.latency, error_rate=args.error_rate, seed=args.seed).start()
+
+    # The flows read TMDB_API_URL at import time
+    os.environ["TMDB_API_URL"] = server.url
+    os.environ.setdefault("TMDB_API_KEY", "benchmark")
+
+    import main
+    from src.movie_etl.tasks import etl_task, kg_task
+    from src.movie_etl.utils.connections import neo4j_driver
+    from src.movie_etl.utils.metrics import counters, reset_metrics, get_step_percentiles
+
+    fake_driver = RecordingDriver()
+    reset_metrics()
+
+    with ExitStack() as stack:
+        stack.enter_context(neo4j_driver.override(fake_driver))
+        if args.skip_sleeps:
+            for module in [etl_task, kg_task]:
+                stack.enter_context(patch.object(module, "asyncio", NoSleepAsyncio()))
+
+        start = time.perf_counter()
+        try:
+            result = asyncio.run(main.movies_flow(
+                start_date="2024-10-01",
+                end_date="2024-11-01",
+                movie_ids=workload.get_movie_ids() if args.skip_discover else None,
+                force=True,
+                raise_on_failure=False,
+                granularity=args.granularity,
+                batch_size=args.batch_size,
+                pipelined=args.pipelined,
+                movie_limit=args.movie_limit,
+                tmdb_limit=args.tmdb_limit,
+                neo4j_limit=args.neo4j_limit
+            ))
+        finally:
+            elapsed = time.perf_counter() - start
+            server.stop()
+
+    movies_loaded = counters["movies_loaded"]
+    per_movie = max(movies_loaded, 1)
+    graph_report = fake_driver.get_report()
+
+    return {
+        "parameters": vars(args),
+        "movies_requested": args.movies,
+        "movies_loaded": movies_loaded,
+        "failed_movie_ids": len(result["failed_movie_ids"]),
+        "elapsed_seconds": elapsed,
+        "movies_per_second": movies_loaded / elapsed,
+        "api_calls": sum(server.requests.values()),
+        "api_calls_by_endpoint": dict(server.requests),
+        "api_calls_throttled": sum(server.throttled.values()),
+        "api_calls_per_movie": sum(server.requests.values()) / per_movie,
+        "graph_statements_per_movie": graph_report["statements"] / per_movie,
+        "graph_writes_per_movie": graph_report["write_statements"] / per_movie,
+        "graph_statements_by_template": graph_report["statements_by_template"],
+        "counters": dict(counters),
+        "steps": get_step_percentiles(),
+        "peak_rss_mb": get_peak_rss_mb()
+    }
+
+def format_report(report: Dict) -> str:
+    lines = [
+        f"movies loaded      {report['movies_loaded']}/{report['movies_requested']} ({report['failed_movie_ids']} failed)",
+        f"elapsed            {report['elapsed_seconds']:.2f}s",
+        f"movies/sec         {report['movies_per_second']:.2f}",
+        f"API calls/movie    {report['api_calls_per_movie']:.2f} ({report['api_calls_throttled']} throttled)",
+        f"graph writes/movie {report['graph_writes_per_movie']:.2f} ({report['graph_statements_per_movie']:.2f} statements)",
+        f"peak RSS           {report['peak_rss_mb']:.1f} MB",
+        "",
+        f"{'step':<45} {'calls':>8} {'p50 (s)':>10} {'p95 (s)':>10}"
+    ]
+
+    for name, stats in sorted(report["steps"].items(), key=lambda item: -item[1]["p95"]):
+        lines.append(f"{name:<45} {stats['count']:>8} {stats['p50']:>10.4f} {stats['p95']:>10.4f}")
+
+    return "\n".join(lines)
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run movies_flow against a local fake TMDB server and a recording graph driver")
+    parser.add_argument("--movies", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake API response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of API responses answered with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workload", choices=["fixture", "synthetic"], default="fixture")
+    parser.add_argument("--person-pool", type=int, help="distinct person ids in a synthetic workload")
+    parser.add_argument("--company-pool", type=int, help="distinct company ids in a synthetic workload")
+    parser.add_argument("--collection-pool", type=int, help="distinct collection ids in a synthetic workload")
+    parser.add_argument("--zipf-exponent", type=float, default=1.1)
+    parser.add_argument("--company-chain-depth", type=int, default=6)
+    parser.add_argument("--skip-discover", action="store_true", help="pass the movie ids directly instead of paging /discover/movie")
+    parser.add_argument("--granularity", choices=["flow", "movie", "batch"], default="batch")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--pipelined", action="store_true")
+    parser.add_argument("--movie-limit", type=int, default=10)
+    parser.add_argument("--tmdb-limit", type=int, default=20)
+    parser.add_argument("--neo4j-limit", type=int, default=10)
+    parser.add_argument("--skip-sleeps", action="store_true", help="drop the fixed sleeps at the end of every task")
+    parser.add_argument("--output", help="write the full report as JSON to this path")
+
+    return parser
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    report = run_benchmark(args)
+
+    print(format_report(report))
+    if args.output != None:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2, default=str)
@@ -0,0 +1,330 @@
+import bisect
+import itertools
+import random
+from datetime import date, timedelta
+from typing import Dict, List
+
+from benchmarks.fake_graph import load_seed_nodes
+from benchmarks.workload import build_discover_page
+
+DEPARTMENT_JOBS = {
+    "Directing": ["Director", "First Assistant Director"],
+    "Writing": ["Screenplay", "Story", "Characters", "Novel"],
+    "Production": ["Producer", "Executive Producer", "Casting", "Line Producer"],
+    "Camera": ["Director of Photography", "Camera Operator", "Steadicam Operator"],
+    "Editing": ["Editor", "Assistant Editor"],
+    "Sound": ["Original Music Composer", "Sound Designer", "Boom Operator"],
+    "Art": ["Production Design", "Art Direction", "Set Decoration"],
+    "Costume & Make-Up": ["Costume Design", "Makeup Artist", "Hairstylist"],
+    "Visual Effects": ["Visual Effects Supervisor", "VFX Artist"],
+    "Lighting": ["Gaffer", "Lighting Technician"],
+    "Crew": ["Stunt Coordinator", "Stunts", "Driver"]
+}
+
+class ZipfSampler:
+    # Rank k (1-based) is drawn with probability proportional to 1 / k**exponent,
+    # so a few ids are reused across most movies and the tail is rarely seen.
+    def __init__(
+        self,
+        size: int,
+        exponent: float=1.1
+    ):
+        self.cumulative = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, size + 1)))
+
+    def sample(
+        self,
+        rng: random.Random
+    ) -> int:
+        return bisect.bisect_left(self.cumulative, rng.random() * self.cumulative[-1]) + 1
+
+    def sample_distinct(
+        self,
+        rng: random.Random,
+        count: int
+    ) -> List[int]:
+        count = min(count, len(self.cumulative))
+        ranks = {}
+        while len(ranks) < count:
+            ranks[self.sample(rng)] = None
+
+        return list(ranks)
+
+class SyntheticWorkload:
+    # Generates TMDB-shaped payloads on demand from (seed, id), so any movie,
+    # person, company or collection can be requested in any order without
+    # holding the workload in memory.
+    def __init__(
+        self,
+        movie_count: int,
+        seed: int=0,
+        person_pool: int=None,
+        company_pool: int=None,
+        collection_pool: int=None,
+        exponent: float=1.1,
+        cast_size: int=20,
+        crew_size: int=30,
+        company_chain_depth: int=6,
+        collection_rate: float=0.3,
+        provider_count: int=6,
+        max_provider_regions: int=60,
+        first_movie_id: int=1
+    ):
+        self.movie_ids = list(range(first_movie_id, first_movie_id + movie_count))
+        self.seed = seed
+        self.cast_size = cast_size
+        self.crew_size = crew_size
+        self.company_chain_depth = company_chain_depth
+        self.collection_rate = collection_rate
+        self.provider_count = provider_count
+        self.max_provider_regions = max_provider_regions
+
+        self.person_sampler = ZipfSampler(person_pool or max(movie_count * 5, 100), exponent)
+        self.company_sampler = ZipfSampler(company_pool or max(movie_count // 5, 50), exponent)
+        self.collection_sampler = ZipfSampler(collection_pool or max(movie_count // 10, 20), exponent)
+
+        # reference ids must exist in the seeded graph, or the edges are rejected
+        seed_nodes = load_seed_nodes()
+        self.genre_ids = sorted(seed_nodes["Genre"])
+        self.language_ids = sorted(seed_nodes["Language"])
+        self.country_ids = sorted(seed_nodes["Country"])
+        self.provider_ids = sorted(seed_nodes["WatchProvider"])
+        self.reference_sampler = {
+            "Genre": ZipfSampler(len(self.genre_ids), exponent),
+            "Language": ZipfSampler(len(self.language_ids), exponent),
+            "Country": ZipfSampler(len(self.country_ids), exponent),
+            "WatchProvider": ZipfSampler(len(self.provider_ids), exponent)
+        }
+
+    def get_rng(
+        self,
+        kind: str,
+        entity_id: int
+    ) -> random.Random:
+        return random.Random(f"{self.seed}:{kind}:{entity_id}")
+
+    def sample_reference(
+        self,
+        rng: random.Random,
+        node_label: str,
+        ids: List,
+        count: int
+    ) -> List:
+        return [ids[rank - 1] for rank in self.reference_sampler[node_label].sample_distinct(rng, count)]
+
+    def get_discover_page(
+        self,
+        page: int
+    ) -> Dict:
+        return build_discover_page(self.movie_ids, page)
+
+    def get_movie_ids(self) -> List:
+        return list(self.movie_ids)
+
+    def get_movie(
+        self,
+        movie_id: int
+    ) -> Dict:
+        rng = self.get_rng("movie", movie_id)
+        release_date = date(1990, 1, 1) + timedelta(days=rng.randrange(365 * 35))
+
+        collection = None
+        if rng.random() < self.collection_rate:
+            collection_id = self.collection_sampler.sample(rng)
+            collection = {
+                "id": collection_id,
+                "name": f"Collection {collection_id}",
+                "poster_path": None,
+                "backdrop_path": None
+            }
+
+        return {
+            "adult": False,
+            "belongs_to_collection": collection,
+            "budget": rng.choice([0, rng.randrange(1, 300) * 1_000_000]),
+            "genres": [
+                {"id": genre_id, "name": f"Genre {genre_id}"}
+                for genre_id in self.sample_reference(rng, "Genre", self.genre_ids, rng.randint(1, 4))
+            ],
+            "id": movie_id,
+            "imdb_id": f"tt{movie_id:08d}",
+            "original_language": "en",
+            "original_title": f"Movie {movie_id}",
+            "overview": f"Synthetic movie {movie_id}.",
+            "popularity": round(rng.paretovariate(1.5), 3),
+            "production_companies": [
+                {"id": company_id, "logo_path": None, "name": f"Company {company_id}", "origin_country": ""}
+                for company_id in self.company_sampler.sample_distinct(rng, rng.randint(1, 5))
+            ],
+            "production_countries": [
+                {"iso_3166_1": country_id, "name": country_id}
+                for country_id in self.sample_reference(rng, "Country", self.country_ids, rng.randint(1, 3))
+            ],
+            "release_date": release_date.isoformat(),
+            "revenue": rng.choice([0, rng.randrange(1, 2000) * 1_000_000]),
+            "runtime": rng.randint(70, 200),
+            "spoken_languages": [
+                {"english_name": language_id, "iso_639_1": language_id, "name": language_id}
+                for language_id in self.sample_reference(rng, "Language", self.language_ids, rng.randint(1, 3))
+            ],
+            "status": "Released",
+            "title": f"Movie {movie_id}",
+            "vote_average": round(rng.uniform(1, 10), 1),
+            "vote_count": rng.randint(10, 30000),
+            "credits": self.get_credits(movie_id),
+            "watch/providers": self.get_watch_providers(movie_id),
+            "external_ids": {"wikidata_id": None}
+        }
+
+    def get_credits(
+        self,
+        movie_id: int
+    ) -> Dict:
+        rng = self.get_rng("credits", movie_id)
+        cast_ids = self.person_sampler.sample_distinct(rng, max(int(rng.gauss(self.cast_size, self.cast_size / 3)), 1))
+        crew_ids = self.person_sampler.sample_distinct(rng, max(int(rng.gauss(self.crew_size, self.crew_size / 3)), 1))
+
+        cast = [
+            {
+                "adult": False,
+                "gender": self.get_gender(person_id),
+                "id": person_id,
+                "known_for_department": "Acting",
+                "name": f"Person {person_id}",
+                "character": f"Character {order}" if rng.random() < 0.95 else "",
+                "credit_id": f"{movie_id}-cast-{person_id}",
+                "order": order
+            } for order, person_id in enumerate(cast_ids)
+        ]
+
+        crew = []
+        for person_id in crew_ids:
+            # some people hold several jobs on the same movie
+            for _ in range(1 if rng.random() < 0.85 else 2):
+                department = rng.choice(list(DEPARTMENT_JOBS))
+                crew.append({
+                    "adult": False,
+                    "gender": self.get_gender(person_id),
+                    "id": person_id,
+                    "known_for_department": department,
+                    "name": f"Person {person_id}",
+                    "credit_id": f"{movie_id}-crew-{person_id}-{len(crew)}",
+                    "department": department,
+                    "job": rng.choice(DEPARTMENT_JOBS[department])
+                })
+
+        return {"id": movie_id, "cast": cast, "crew": crew}
+
+    def get_watch_providers(
+        self,
+        movie_id: int
+    ) -> Dict:
+        rng = self.get_rng("providers", movie_id)
+        results = {}
+
+        for provider_id in self.sample_reference(rng, "WatchProvider", self.provider_ids, rng.randint(0, self.provider_count)):
+            regions = rng.sample(self.country_ids, rng.randint(1, min(self.max_provider_regions, len(self.country_ids))))
+
+            for region in regions:
+                watch_type = rng.choice(["buy", "rent", "flatrate"])
+                region_providers = results.setdefault(region, {"link": f"https://www.themoviedb.org/movie/{movie_id}/watch?locale={region}"})
+                region_providers.setdefault(watch_type, []).append({
+                    "logo_path": None,
+                    "provider_id": provider_id,
+                    "provider_name": f"Provider {provider_id}",
+                    "display_priority": 0
+                })
+
+        return {"id": movie_id, "results": results}
+
+    def get_gender(
+        self,
+        person_id: int
+    ) -> int:
+        return self.get_rng("person", person_id).choice([0, 1, 2, 2, 3])
+
+    def get_person(
+        self,
+        person_id: int
+    ) -> Dict:
+        rng = self.get_rng("person", person_id)
+        gender = rng.choice([0, 1, 2, 2, 3])
+        birthday = date(1930, 1, 1) + timedelta(days=rng.randrange(365 * 75))
+
+        return {
+            "adult": False,
+            "also_known_as": [],
+            "biography": f"Synthetic person {person_id}." if rng.random() < 0.7 else "",
+            "birthday": birthday.isoformat(),
+            "deathday": None,
+            "gender": gender,
+            "homepage": None,
+            "id": person_id,
+            "imdb_id": f"nm{person_id:07d}",
+            "known_for_department": "Acting",
+            "name": f"Person {person_id}",
+            "place_of_birth": rng.choice(self.country_ids),
+            "popularity": round(rng.paretovariate(1.5), 3),
+            "profile_path": None
+        }
+
+    def get_parent_company_id(
+        self,
+        company_id: int
+    ) -> int:
+        # companies form chains of company_chain_depth: 1 -> 2 -> ... -> depth,
+        # so the most reused (lowest) ids carry the deepest ancestry
+        if company_id % self.company_chain_depth == 0:
+            return None
+
+        return company_id + 1
+
+    def get_company(
+        self,
+        company_id: int
+    ) -> Dict:
+        rng = self.get_rng("company", company_id)
+        parent_company_id = self.get_parent_company_id(company_id)
+
+        return {
+            "description": f"Synthetic company {company_id}.",
+            "headquarters": f"City {rng.randint(1, 500)}",
+            "homepage": "",
+            "id": company_id,
+            "logo_path": None,
+            "name": f"Company {company_id}",
+            "origin_country": rng.choice(self.country_ids),
+            "parent_company": {
+                "id": parent_company_id,
+                "logo_path": None,
+                "name": f"Company {parent_company_id}"
+            } if parent_company_id != None else None
+        }
+
+    def get_collection(
+        self,
+        collection_id: int
+    ) -> Dict:
+        return {
+            "id": collection_id,
+            "name": f"Collection {collection_id}",
+            "overview": f"Synthetic collection {collection_id}.",
+            "poster_path": None,
+            "backdrop_path": None,
+            "parts": []
+        }
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Write synthetic TMDB movie-detail payloads as JSON lines")
+    parser.add_argument("--movies", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--exponent", type=float, default=1.1)
+    parser.add_argument("--output", default="synthetic_movies.jsonl")
+    args = parser.parse_args()
+
+    workload = SyntheticWorkload(args.movies, seed=args.seed, exponent=args.exponent)
+    with open(args.output, "w") as fp:
+        for movie_id in workload.get_movie_ids():
+            fp.write(json.dumps(workload.get_movie(movie_id)) + "\n")
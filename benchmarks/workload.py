@@ -0,0 +1,93 @@
+import copy
+import json
+import pathlib
+from typing import Dict, List
+
+FIXTURES_DIR = pathlib.Path(__file__).resolve().parent.parent / "tests" / "unit_tests" / "mock_apis"
+
+def build_discover_page(
+    movie_ids: List,
+    page: int,
+    page_size: int=20
+) -> Dict:
+    total_pages = max((len(movie_ids) + page_size - 1) // page_size, 1)
+    page_ids = movie_ids[(page - 1) * page_size:page * page_size]
+
+    return {
+        "page": page,
+        "results": [{"id": movie_id} for movie_id in page_ids],
+        "total_pages": total_pages,
+        "total_results": len(movie_ids)
+    }
+
+class FixtureWorkload:
+    # Clones the single-entity fixtures under synthetic ids, so every movie has
+    # the same shape and fan-out as movie 912649.
+    def __init__(
+        self,
+        movie_count: int,
+        fixtures_dir: pathlib.Path=FIXTURES_DIR,
+        first_movie_id: int=1
+    ):
+        self.movie_ids = list(range(first_movie_id, first_movie_id + movie_count))
+
+        with open(fixtures_dir / "movie_details_912649.json", "r") as fp:
+            self.movie = json.load(fp)
+        with open(fixtures_dir / "watch_providers_123.json", "r") as fp:
+            self.watch_providers = json.load(fp)
+        with open(fixtures_dir / "collection_details_558216.json", "r") as fp:
+            self.collection = json.load(fp)
+        with open(fixtures_dir / "company_details_5.json", "r") as fp:
+            self.company = json.load(fp)
+        with open(fixtures_dir / "person_details_2524.json", "r") as fp:
+            self.person = json.load(fp)
+
+    def get_discover_page(
+        self,
+        page: int
+    ) -> Dict:
+        return build_discover_page(self.movie_ids, page)
+
+    def get_movie(
+        self,
+        movie_id: int
+    ) -> Dict:
+        movie = copy.deepcopy(self.movie)
+        movie["id"] = movie_id
+        movie["watch/providers"] = self.get_watch_providers(movie_id)
+        movie["external_ids"] = {"wikidata_id": None}
+
+        return movie
+
+    def get_credits(
+        self,
+        movie_id: int
+    ) -> Dict:
+        return {"id": movie_id} | copy.deepcopy(self.movie["credits"])
+
+    def get_watch_providers(
+        self,
+        movie_id: int
+    ) -> Dict:
+        return {"id": movie_id, "results": copy.deepcopy(self.watch_providers["results"])}
+
+    def get_collection(
+        self,
+        collection_id: int
+    ) -> Dict:
+        return copy.deepcopy(self.collection) | {"id": collection_id}
+
+    def get_company(
+        self,
+        company_id: int
+    ) -> Dict:
+        return copy.deepcopy(self.company) | {"id": company_id}
+
+    def get_person(
+        self,
+        person_id: int
+    ) -> Dict:
+        return copy.deepcopy(self.person) | {"id": person_id}
+
+    def get_movie_ids(self) -> List:
+        return list(self.movie_ids)
@@ -0,0 +1,12 @@
+// Watch providers used to get one AVAILABLE_ON edge per availability type, with
+// region and type properties. Those edges share a relationship_id, so they break
+// the AVAILABLE_ON uniqueness constraint and the MERGE of the per-provider edges.
+// Runs before 1_constraints.cypher. Deleting an edge stamps its movie, and
+// refresh_watch_providers_flow writes the per-provider edges back.
+MATCH (m:Movie)-[r:AVAILABLE_ON]->(:WatchProvider)
+WHERE r.type IS NOT NULL
+CALL {
+    WITH m, r
+    SET m.updated_at = datetime()
+    DELETE r
+} IN TRANSACTIONS OF 10000 ROWS;
@@ -12,7 +12,11 @@ CREATE CONSTRAINT relationship_constraint_movie_production IF NOT EXISTS FOR ()-
 CREATE CONSTRAINT relationship_constraint_movie_language IF NOT EXISTS FOR ()-[r: HAS_LANGUAGE]-() REQUIRE r.relationship_id IS UNIQUE;
 CREATE CONSTRAINT relationship_constraint_movie_company IF NOT EXISTS FOR ()-[r: BASED_ON]-() REQUIRE r.relationship_id IS UNIQUE;
 CREATE CONSTRAINT relationship_constraint_movie_genre IF NOT EXISTS FOR ()-[r: HAS_GENRE]-() REQUIRE r.relationship_id IS UNIQUE;
-CREATE CONSTRAINT relationship_constraint_movie_provider IF NOT EXISTS FOR ()-[r: AVAILABLE_ON]-() REQUIRE r.relationship_id AND r.type IS UNIQUE;
+// IF NOT EXISTS would keep an AVAILABLE_ON constraint created from the old definition.
+// It is dropped by its old name and the fixed one gets a new name, so the drop is a
+// no-op on every later start instead of rebuilding the constraint.
+DROP CONSTRAINT relationship_constraint_movie_provider IF EXISTS;
+CREATE CONSTRAINT relationship_constraint_movie_provider_id IF NOT EXISTS FOR ()-[r: AVAILABLE_ON]-() REQUIRE r.relationship_id IS UNIQUE;
 
 CREATE CONSTRAINT relationship_constraint_movie_writter IF NOT EXISTS FOR ()-[r: WRITTEN_BY]-() REQUIRE r.relationship_id IS UNIQUE;
 CREATE CONSTRAINT relationship_constraint_movie_editor IF NOT EXISTS FOR ()-[r: EDITED_BY]-() REQUIRE r.relationship_id IS UNIQUE;
@@ -25,4 +29,13 @@ CREATE CONSTRAINT relationship_constraint_movie_sound IF NOT EXISTS FOR ()-[r: S
 CREATE CONSTRAINT relationship_constraint_movie_producer IF NOT EXISTS FOR ()-[r: PRODUCED_BY]-() REQUIRE r.relationship_id IS UNIQUE;
 CREATE CONSTRAINT relationship_constraint_movie_art IF NOT EXISTS FOR ()-[r: ART_BY]-() REQUIRE r.relationship_id IS UNIQUE;
 CREATE CONSTRAINT relationship_constraint_movie_vfx IF NOT EXISTS FOR ()-[r: VISUAL_EFFECTS_BY]-() REQUIRE r.relationship_id IS UNIQUE;
-CREATE CONSTRAINT relationship_constraint_cast_movie IF NOT EXISTS FOR ()-[r: ACTED_IN]-() REQUIRE r.relationship_id IS UNIQUE;
\ No newline at end of file
+CREATE CONSTRAINT relationship_constraint_cast_movie IF NOT EXISTS FOR ()-[r: ACTED_IN]-() REQUIRE r.relationship_id IS UNIQUE;
+
+CREATE INDEX node_index_movie_updated_at IF NOT EXISTS FOR (n: Movie) ON (n.updated_at);
+CREATE INDEX node_index_collection_updated_at IF NOT EXISTS FOR (n: Collection) ON (n.updated_at);
+CREATE INDEX node_index_language_updated_at IF NOT EXISTS FOR (n: Language) ON (n.updated_at);
+CREATE INDEX node_index_genre_updated_at IF NOT EXISTS FOR (n: Genre) ON (n.updated_at);
+CREATE INDEX node_index_person_updated_at IF NOT EXISTS FOR (n: Person) ON (n.updated_at);
+CREATE INDEX node_index_country_updated_at IF NOT EXISTS FOR (n: Country) ON (n.updated_at);
+CREATE INDEX node_index_provider_updated_at IF NOT EXISTS FOR (n: WatchProvider) ON (n.updated_at);
+CREATE INDEX node_index_company_updated_at IF NOT EXISTS FOR (n: Company) ON (n.updated_at);
\ No newline at end of file
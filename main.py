@@ -2,14 +2,46 @@ import sys
 import os
 import pathlib
 import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date, datetime
+from typing import List, Dict
+from contextlib import nullcontext
 
 sys.path.append(str(pathlib.Path(os.path.dirname(os.path.realpath(__file__)), "src")))
 
 from prefect import flow, get_run_logger
-from src.movie_etl.utils.etl import is_primary_key_exist_in_table, get_previous_week, generate_flow_run_name
-from src.movie_etl.tasks.etl_task import get_movie_ids
-from src.movie_etl.flows.etl_flow import single_movie_flow, engine
+from prefect.deployments import run_deployment
+from prefect.artifacts import create_markdown_artifact
+from src.movie_etl.utils.etl import get_previous_week, generate_flow_run_name, split_date_range
+from src.movie_etl.tasks.etl_task import get_movie_ids, filter_loaded_movie_ids
+from src.movie_etl.flows.etl_flow import (
+    single_movie_flow,
+    single_movie_task,
+    movie_batch_task,
+    run_movie_pipeline,
+    person_enrichment_flow,
+    row_buffer
+)
+from src.movie_etl.utils.execution import lightweight_steps, run_worker_pool
+from src.movie_etl.utils.connections import get_engine, get_driver
+from src.movie_etl.utils.shard import partition_movie_ids, run_shard
+from src.movie_etl.utils.checkpoint import CheckpointStore, use_checkpoint
+from src.movie_etl.utils.scheduler import scheduler
+from src.movie_etl.utils.metrics import (
+    ProgressReporter,
+    snapshot_metrics,
+    get_metrics_summary,
+    format_metrics_markdown,
+    write_metrics
+)
+from src.movie_etl.utils.reference import reference_data
+from src.movie_etl.utils.cache import collection_cache
+from src.movie_etl.utils.archive import raw_archive
+from src.movie_etl.utils.profiling import get_profile_settings, start_profiling, stop_profiling
+from src.movie_etl.utils.graph_stats import query_stats, write_query_report, format_query_report_markdown
+
+GRANULARITIES = {"flow", "movie", "batch"}
 
 @flow(
     name="Movies ETL Flow",
@@ -22,34 +54,491 @@ async def movies_flow(
     end_date: date=datetime.strptime("2024-11-01", "%Y-%m-%d"),
     vote_count_minimum: int=10,
     movie_limit: int=3,
-    person_limit: int=10
+    tmdb_limit: int=20,
+    scrape_limit: int=2,
+    neo4j_limit: int=10,
+    postgres_limit: int=5,
+    adaptive_concurrency: bool=False,
+    skip_source: str="kg",
+    stale_after_days: int=None,
+    force: bool=False,
+    buffer_max_rows: int=500,
+    buffer_max_seconds: float=30.0,
+    granularity: str="flow",
+    batch_size: int=20,
+    pipelined: bool=False,
+    stage_workers: Dict=None,
+    queue_size: int=10,
+    movie_ids: List=None,
+    raise_on_failure: bool=True,
+    external_data: bool=False,
+    load_credits: bool=False,
+    cast_limit: int=None,
+    crew_departments: List=None,
+    enrich_persons: bool=False,
+    enrich_stale_after_days: int=None,
+    run_key: str=None,
+    checkpoint_path: str="movie_etl_checkpoints.sqlite",
+    collection_cache_path: str=None,
+    collection_cache_ttl_days: int=30,
+    metrics_dir: str=None,
+    profile: str=None,
+    profile_dir: str=None,
+    profile_per_movie: bool=None,
+    slow_query_ms: float=500.0,
+    archive_dir: str=None,
+    archive_mode: str="off"
 ):
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity!r}, expected one of {sorted(GRANULARITIES)}")
+
     if start_date is None or end_date is None:
         end_date = date.today()
         start_date = get_previous_week()
     
-    start_date = start_date.strftime("%Y-%m-%d")
-    end_date = end_date.strftime("%Y-%m-%d")
+    if not isinstance(start_date, str):
+        start_date = start_date.strftime("%Y-%m-%d")
+    if not isinstance(end_date, str):
+        end_date = end_date.strftime("%Y-%m-%d")
 
-    limit = asyncio.Semaphore(movie_limit)
-    async def process_movie_with_semaphore(coro):
-        async with limit:
-            return await coro
+    scheduler.configure(
+        {
+            "tmdb": tmdb_limit,
+            "scrape": scrape_limit,
+            "neo4j": neo4j_limit,
+            "postgres": postgres_limit
+        },
+        adaptive=adaptive_concurrency
+    )
 
     logger = get_run_logger()
     logger.info("Start movies ETL flow")
-    movie_ids = await get_movie_ids(start_date=start_date, end_date=end_date, vote_count_minimum=vote_count_minimum)
-    logger.info("Got " + str(len(movie_ids)) + " movie_ids")
+    metrics_snapshot = snapshot_metrics()
+    query_stats.reset()
+    query_stats.configure(slow_query_ms)
+
+    # "record" archives every raw response, "replay" serves them back without network
+    raw_archive.configure(archive_dir, archive_mode)
+
+    checkpoint_store = CheckpointStore(checkpoint_path) if run_key != None else None
+    checkpoint_run = checkpoint_store.get_run(run_key) if checkpoint_store != None else None
+
+    if checkpoint_run != None:
+        movie_ids = checkpoint_run["movie_ids"]
+        run_movie_ids = movie_ids
+        logger.info(f"Resuming run {run_key} started with {checkpoint_run['parameters']}")
+
+        if external_data != checkpoint_run["parameters"]["external_data"]:
+            logger.warning(f"Resuming run {run_key} with its original external_data={checkpoint_run['parameters']['external_data']}")
+        external_data = checkpoint_run["parameters"]["external_data"]
+
+        final_stages = {"nodes", "edges"} | ({"ratings"} if external_data else set())
+        movie_ids = [
+            movie_id for movie_id in movie_ids
+            if not final_stages.issubset(checkpoint_store.get_completed_stages(run_key, movie_id))
+        ]
+    else:
+        if movie_ids is None and raw_archive.replaying:
+            movie_ids = [int(movie_id) for movie_id in raw_archive.get_entity_ids("tmdb/movie")]
+        elif movie_ids is None:
+            movie_ids = await get_movie_ids(start_date=start_date, end_date=end_date, vote_count_minimum=vote_count_minimum)
+        logger.info("Got " + str(len(movie_ids)) + " movie_ids")
+
+        movie_ids = await filter_loaded_movie_ids(
+            movie_ids,
+            driver=get_driver() if skip_source == "kg" else None,
+            engine=get_engine() if skip_source == "db" else None,
+            stale_after_days=stale_after_days,
+            force=force or raw_archive.replaying,
+            skip_source=skip_source
+        )
+        run_movie_ids = movie_ids
+
+        if checkpoint_store != None:
+            checkpoint_store.save_run(
+                run_key,
+                parameters={
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "vote_count_minimum": vote_count_minimum,
+                    "skip_source": skip_source,
+                    "stale_after_days": stale_after_days,
+                    "force": force,
+                    "external_data": external_data
+                },
+                movie_ids=movie_ids
+            )
+    logger.info("Processing " + str(len(movie_ids)) + " new or stale movie_ids")
     
-    futures = []
-    for movie_id in movie_ids:
-        # if is_primary_key_exist_in_table(movie_id, "movie_id", "movies", engine):
-            # logger.warning(f"Movie-{movie_id} already exist")
-            
-        futures.append(process_movie_with_semaphore(single_movie_flow(movie_id, person_limit)))
-    await asyncio.gather(*futures)
+    credit_filter = {"cast_limit": cast_limit, "crew_departments": crew_departments} if load_credits else None
+
+    await asyncio.to_thread(reference_data.load, get_driver(), True)
+    logger.info(f"Loaded reference ids: { {node_label: len(ids) for node_label, ids in reference_data.ids.items()} }")
+
+    profile_settings = get_profile_settings(profile, profile_dir, profile_per_movie)
+    profiler = start_profiling(
+        f"movies-flow-{run_key or datetime.now().strftime('%Y%m%dT%H%M%S')}",
+        profile_settings["modes"],
+        profile_settings["output_dir"],
+        per_movie=profile_settings["per_movie"]
+    )
+
+    collection_cache.configure(collection_cache_path, collection_cache_ttl_days)
+    row_buffer.start(max_rows=buffer_max_rows, max_seconds=buffer_max_seconds)
+    failed_movie_ids = []
+    try:
+        if pipelined:
+            lightweight = lightweight_steps("movie-pipeline") if granularity != "flow" else nullcontext()
+
+            with use_checkpoint(checkpoint_store, run_key), lightweight:
+                failures = await run_movie_pipeline(
+                    movie_ids,
+                    external_data=external_data,
+                    stage_workers=stage_workers,
+                    queue_size=queue_size,
+                    credit_filter=credit_filter
+                )
+
+            for movie_id, stage, error in failures:
+                logger.error(f"Failed processing movie_id {movie_id} at {stage} stage: {error!r}")
+                failed_movie_ids.append(movie_id)
+
+        else:
+            if granularity == "batch":
+                units = enumerate(movie_ids[i:i+batch_size] for i in range(0, len(movie_ids), batch_size))
+
+                async def process_unit(unit):
+                    await movie_batch_task(unit[0], unit[1], external_data, credit_filter)
+            elif granularity == "movie":
+                units = enumerate([movie_id] for movie_id in movie_ids)
+
+                async def process_unit(unit):
+                    await single_movie_task(unit[1][0], external_data, credit_filter)
+            else:
+                units = enumerate([movie_id] for movie_id in movie_ids)
+
+                async def process_unit(unit):
+                    await single_movie_flow(unit[1][0], external_data, credit_filter)
+
+            with use_checkpoint(checkpoint_store, run_key):
+                failures = await run_worker_pool(units, process_unit, movie_limit)
+
+            for (_, unit_movie_ids), error in failures:
+                logger.error(f"Failed processing movie_ids {unit_movie_ids}: {error!r}")
+                failed_movie_ids.extend(unit_movie_ids)
+
+        if enrich_persons and load_credits:
+            # every movie of the run, including those an interrupted attempt finished
+            await person_enrichment_flow(movie_ids=run_movie_ids, stale_after_days=enrich_stale_after_days)
+        elif enrich_persons:
+            logger.warning("Skipping person enrichment, it needs load_credits to load persons")
+
+    finally:
+        dead_letters = await row_buffer.close()
+        collection_cache.close()
+        raw_archive.close()
+        if checkpoint_store != None:
+            checkpoint_store.close()
+        for path in stop_profiling(profiler):
+            logger.info(f"Wrote profile to {path}")
+
+    for table_name, row, error in dead_letters:
+        logger.error(f"Failed writing {table_name} row of movie_id {row.get('movie_id')}: {error!r}")
+        if row.get("movie_id") not in failed_movie_ids:
+            failed_movie_ids.append(row.get("movie_id"))
+
+    for node_label, unknown_ids in reference_data.get_unknown_ids().items():
+        logger.warning(f"Skipped edges to {len(unknown_ids)} unknown {node_label} ids: {unknown_ids}")
+
+    metrics_summary = get_metrics_summary(since=metrics_snapshot)
+    logger.info(f"Run counters: {metrics_summary['counters']}")
+    await create_markdown_artifact(
+        key="movie-etl-metrics",
+        markdown=format_metrics_markdown(metrics_summary),
+        description="Counters and latency percentiles of this movies ETL run"
+    )
+    if metrics_dir != None:
+        write_metrics(metrics_dir, metrics_summary)
+        logger.info(f"Wrote metrics to {metrics_dir}")
+
+    query_report = query_stats.get_report()
+    logger.info(
+        f"Graph writes: {query_report['statements']}, with zero effect: {query_report['zero_effect_writes']}, "
+        f"batch rows matching nothing: {query_report['missed_rows']}"
+    )
+    for entry in query_report["slow_queries"][:5]:
+        logger.warning(f"Slow graph write ({entry['client_ms']:.0f} ms): {entry['template'][:200]} [{entry['parameters']}]")
+    await create_markdown_artifact(
+        key="movie-etl-graph-queries",
+        markdown=format_query_report_markdown(query_report),
+        description="Neo4j write statements of this movies ETL run grouped by template"
+    )
+    if metrics_dir != None:
+        write_query_report(metrics_dir, query_report)
 
     logger.info("Finished movies ETL flow")
 
+    if failed_movie_ids != [] and raise_on_failure:
+        raise RuntimeError(f"{len(failed_movie_ids)} of {len(movie_ids)} movies failed: {failed_movie_ids}")
+
+    return {
+        "movie_ids": len(movie_ids),
+        "failed_movie_ids": failed_movie_ids
+    }
+
+@flow(
+    name="Sharded Movies ETL Flow",
+    log_prints=True,
+    flow_run_name=generate_flow_run_name,
+    validate_parameters=False
+)
+async def sharded_movies_flow(
+    start_date: date=datetime.strptime("2024-10-01", "%Y-%m-%d"),
+    end_date: date=datetime.strptime("2024-11-01", "%Y-%m-%d"),
+    vote_count_minimum: int=10,
+    shard_count: int=4,
+    shard_mode: str="process",
+    deployment_name: str="Movies ETL Flow/Movie ETL Deployment",
+    movie_limit: int=3,
+    tmdb_limit: int=20,
+    scrape_limit: int=2,
+    neo4j_limit: int=10,
+    postgres_limit: int=5,
+    adaptive_concurrency: bool=False,
+    skip_source: str="kg",
+    stale_after_days: int=None,
+    force: bool=False,
+    granularity: str="flow",
+    batch_size: int=20,
+    pipelined: bool=False,
+    external_data: bool=False,
+    load_credits: bool=False,
+    cast_limit: int=None,
+    crew_departments: List=None,
+    enrich_persons: bool=False,
+    enrich_stale_after_days: int=None,
+    run_key: str=None
+):
+    # checked before the shards start, each of which would fail on it
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity!r}, expected one of {sorted(GRANULARITIES)}")
+
+    if start_date is None or end_date is None:
+        end_date = date.today()
+        start_date = get_previous_week()
+
+    if not isinstance(start_date, str):
+        start_date = start_date.strftime("%Y-%m-%d")
+    if not isinstance(end_date, str):
+        end_date = end_date.strftime("%Y-%m-%d")
+
+    logger = get_run_logger()
+    logger.info("Start sharded movies ETL flow")
+    movie_ids = await get_movie_ids(start_date=start_date, end_date=end_date, vote_count_minimum=vote_count_minimum)
+    movie_ids = await filter_loaded_movie_ids(
+        movie_ids,
+        driver=get_driver() if skip_source == "kg" else None,
+        engine=get_engine() if skip_source == "db" else None,
+        stale_after_days=stale_after_days,
+        force=force,
+        skip_source=skip_source
+    )
+
+    shards = [shard for shard in partition_movie_ids(movie_ids, shard_count) if shard != []]
+    logger.info(f"Split {len(movie_ids)} movie_ids into {len(shards)} shards ({shard_mode})")
+
+    shard_parameters = [
+        {
+            "start_date": start_date,
+            "end_date": end_date,
+            "movie_limit": movie_limit,
+            "tmdb_limit": max(1, tmdb_limit // len(shards)),
+            "scrape_limit": max(1, scrape_limit // len(shards)),
+            "neo4j_limit": max(1, neo4j_limit // len(shards)),
+            "postgres_limit": max(1, postgres_limit // len(shards)),
+            "adaptive_concurrency": adaptive_concurrency,
+            "force": True,
+            "granularity": granularity,
+            "batch_size": batch_size,
+            "pipelined": pipelined,
+            "movie_ids": shard,
+            "raise_on_failure": False,
+            "external_data": external_data,
+            "load_credits": load_credits,
+            "cast_limit": cast_limit,
+            "crew_departments": crew_departments,
+            "enrich_persons": False,
+            "run_key": f"{run_key}-shard-{shard_id}" if run_key != None else None
+        } for shard_id, shard in enumerate(shards)
+    ]
+
+    if shard_mode == "deployment":
+        async def run_deployment_shard(parameters):
+            # The summary of a remote run is only readable with shared result
+            # storage, so a deployment shard fails on any failed movie instead and
+            # its whole shard is reported; the run's own logs name the movies.
+            flow_run = await run_deployment(
+                name=deployment_name,
+                parameters=parameters | {"raise_on_failure": True},
+                timeout=None
+            )
+
+            return {
+                "movie_ids": len(parameters["movie_ids"]),
+                "failed_movie_ids": [] if flow_run.state.is_completed() else parameters["movie_ids"],
+                "state": flow_run.state.name
+            }
+
+        results = await asyncio.gather(*[run_deployment_shard(parameters) for parameters in shard_parameters])
+
+    else:
+        entrypoint = f"{os.path.realpath(__file__)}:movies_flow"
+        loop = asyncio.get_running_loop()
+
+        with ProcessPoolExecutor(
+            max_workers=len(shards) or 1,
+            mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results = await asyncio.gather(*[
+                loop.run_in_executor(executor, run_shard, entrypoint, parameters) for parameters in shard_parameters
+            ])
+
+    failed_movie_ids = []
+    for shard_id, result in enumerate(results):
+        logger.info(f"Shard {shard_id}: {result['movie_ids']} movie_ids, {len(result['failed_movie_ids'])} failed")
+        if "error" in result:
+            logger.error(f"Shard {shard_id} failed: {result['error']}")
+        failed_movie_ids.extend(result["failed_movie_ids"])
+
+    # once for all shards, which would otherwise enrich the same persons concurrently
+    if enrich_persons and load_credits:
+        await person_enrichment_flow(movie_ids=movie_ids, stale_after_days=enrich_stale_after_days)
+    elif enrich_persons:
+        logger.warning("Skipping person enrichment, it needs load_credits to load persons")
+
+    logger.info("Finished sharded movies ETL flow")
+
+    if failed_movie_ids != []:
+        raise RuntimeError(f"{len(failed_movie_ids)} of {len(movie_ids)} movies failed: {failed_movie_ids}")
+
+    return {
+        "movie_ids": len(movie_ids),
+        "failed_movie_ids": failed_movie_ids,
+        "shards": results
+    }
+
+@flow(
+    name="Backfill Movies ETL Flow",
+    log_prints=True,
+    flow_run_name=generate_flow_run_name,
+    validate_parameters=False
+)
+async def backfill_movies_flow(
+    start_date: date=datetime.strptime("1990-01-01", "%Y-%m-%d"),
+    end_date: date=datetime.strptime("2024-12-31", "%Y-%m-%d"),
+    vote_count_minimum: int=10,
+    window_days: int=30,
+    window_limit: int=4,
+    movie_limit: int=3,
+    tmdb_limit: int=20,
+    scrape_limit: int=2,
+    neo4j_limit: int=10,
+    postgres_limit: int=5,
+    adaptive_concurrency: bool=False,
+    skip_source: str="kg",
+    stale_after_days: int=None,
+    force: bool=False,
+    granularity: str="movie",
+    pipelined: bool=False,
+    external_data: bool=False,
+    load_credits: bool=False,
+    cast_limit: int=None,
+    crew_departments: List=None,
+    enrich_persons: bool=False,
+    run_key: str=None,
+    report_interval: float=60.0
+):
+    if isinstance(start_date, str):
+        start_date = datetime.strptime(start_date, "%Y-%m-%d")
+    if isinstance(end_date, str):
+        end_date = datetime.strptime(end_date, "%Y-%m-%d")
+
+    scheduler.configure(
+        {
+            "tmdb": tmdb_limit,
+            "scrape": scrape_limit,
+            "neo4j": neo4j_limit,
+            "postgres": postgres_limit
+        },
+        adaptive=adaptive_concurrency
+    )
+
+    logger = get_run_logger()
+    windows = split_date_range(start_date, end_date, window_days)
+    logger.info(f"Start backfill over {len(windows)} windows of {window_days} days")
+
+    # dict keeps discovery order while de-duplicating ids that fall in several windows
+    discovered_movie_ids = {}
+
+    async def discover_window(window):
+        window_movie_ids = await get_movie_ids(
+            start_date=window[0],
+            end_date=window[1],
+            vote_count_minimum=vote_count_minimum
+        )
+        discovered_movie_ids.update(dict.fromkeys(window_movie_ids))
+
+    failures = await run_worker_pool(windows, discover_window, window_limit)
+    for window, error in failures:
+        logger.error(f"Failed discovering window {window[0]}--{window[1]}: {error!r}")
+
+    movie_ids = await filter_loaded_movie_ids(
+        list(discovered_movie_ids),
+        driver=get_driver() if skip_source == "kg" else None,
+        engine=get_engine() if skip_source == "db" else None,
+        stale_after_days=stale_after_days,
+        force=force,
+        skip_source=skip_source
+    )
+    logger.info(f"Discovered {len(discovered_movie_ids)} unique movie_ids, {len(movie_ids)} to process")
+
+    progress_reporter = ProgressReporter(len(movie_ids), interval=report_interval)
+    reporting = asyncio.create_task(progress_reporter.report_periodically(logger))
+
+    try:
+        summary = await movies_flow(
+            start_date=start_date,
+            end_date=end_date,
+            movie_limit=movie_limit,
+            tmdb_limit=tmdb_limit,
+            scrape_limit=scrape_limit,
+            neo4j_limit=neo4j_limit,
+            postgres_limit=postgres_limit,
+            adaptive_concurrency=adaptive_concurrency,
+            force=True,
+            granularity=granularity,
+            pipelined=pipelined,
+            movie_ids=movie_ids,
+            raise_on_failure=False,
+            external_data=external_data,
+            load_credits=load_credits,
+            cast_limit=cast_limit,
+            crew_departments=crew_departments,
+            enrich_persons=enrich_persons,
+            run_key=run_key
+        )
+
+    finally:
+        reporting.cancel()
+        logger.info(progress_reporter.format_progress())
+
+    if failures != [] or summary["failed_movie_ids"] != []:
+        raise RuntimeError(
+            f"Backfill finished with {len(failures)} failed windows and "
+            f"{len(summary['failed_movie_ids'])} failed movies: {summary['failed_movie_ids']}"
+        )
+
+    return summary | {"windows": len(windows)}
+
 if __name__ == "__main__":
     asyncio.run(movies_flow())
\ No newline at end of file
@@ -1,14 +1,26 @@
-from dotenv import load_dotenv
-import os
 from typing import List, Dict
-from sqlalchemy import create_engine, URL
 import asyncio
-from prefect import get_run_logger, flow
+from datetime import datetime, timedelta, timezone
+from prefect import get_run_logger, flow, task
+from prefect.cache_policies import NONE
 
-from src.movie_etl.utils.etl import is_primary_key_exist_in_table, map_departement, is_node_exist
+from src.movie_etl.utils.etl import (
+    map_departement,
+    is_node_exist,
+    get_existing_node_ids,
+    get_unenriched_person_ids,
+    aggregate_casts,
+    aggregate_crews,
+    split_credits,
+    get_provider_edges,
+    diff_provider_edges,
+    WATCH_TYPES
+)
 from src.movie_etl.tasks.etl_task import (
+    TMDB_API_URL,
     get_data_from_tmdb_api,
     clean_movie_details,
+    clean_movie_credits,
     clean_collection_details,
     clean_company_details,
     clean_person_details,
@@ -16,29 +28,88 @@ from src.movie_etl.tasks.etl_task import (
     clean_genres,
     clean_languages,
     clean_production_countries,
-    load_single_row_to_db,
-    load_multi_row_to_db,
     scrape_html_content,
     clean_imdb_ratings,
     clean_rotten_tomatoes_ratings,
     clean_metacritic_ratings,
     clean_wikidata
 )
-from src.movie_etl.tasks.kg_task import load_entity_to_kg, load_relationship_to_kg
-from src.movie_etl.flows.kg_flow import driver, bulk_entity_flow
-
-load_dotenv()
-
-url_object = URL.create(
-    "postgresql+psycopg2",
-    username=os.getenv("POSTGRES_USER"),
-    password=os.getenv("POSTGRES_PASSWORD"),
-    host=os.getenv("POSTGRES_HOST"),
-    database=os.getenv("POSTGRES_DB"),
-    port=os.getenv("POSTGRES_PORT")
+from src.movie_etl.utils.buffer import RowBuffer
+from src.movie_etl.utils.execution import run_step, run_pipeline, run_worker_pool, lightweight_steps
+from src.movie_etl.utils.scheduler import scheduler
+from src.movie_etl.utils.metrics import increment
+from src.movie_etl.utils.reference import reference_data, REFERENCE_KEYS
+from src.movie_etl.utils.cache import collection_cache
+from src.movie_etl.utils.archive import raw_archive, get_request_key
+from src.movie_etl.utils.profiling import profile_movie
+from src.movie_etl.utils.checkpoint import (
+    get_completed_stages,
+    get_stage_payload,
+    mark_stage,
+    bind_mark_stage,
+    drop_stage_payload
+)
+from src.movie_etl.tasks.kg_task import (
+    load_entity_to_kg,
+    load_relationship_to_kg,
+    load_entity_batch_to_kg,
+    load_relationship_batch_to_kg,
+    delete_relationship_batch_from_kg
 )
+from src.movie_etl.utils.connections import get_driver
+
+row_buffer = RowBuffer()
+
+async def is_node_exist_async(
+    node_label: str,
+    property_id_name: str,
+    property_id: int,
+    driver
+) -> bool:
+    async with scheduler.acquire("neo4j"):
+        return await asyncio.to_thread(is_node_exist, node_label, property_id_name, property_id, driver)
+
+async def is_node_reusable_async(
+    node_label: str,
+    property_id_name: str,
+    property_id: int,
+    endpoint_name: str
+) -> bool:
+    # A replay re-runs clean_* for every archived entity, even one already in the
+    # graph. Entities that were never archived keep the node the graph has.
+    if raw_archive.replaying and await asyncio.to_thread(raw_archive.contains, get_request_key(f"/{endpoint_name}/{property_id}")):
+        return False
+
+    return await is_node_exist_async(node_label, property_id_name, property_id, get_driver())
+
+async def load_reference_edges(
+    movie_id: int,
+    relationship_label: str,
+    tail_label: str,
+    tail_ids: List,
+    relationship_properties: Dict={}
+):
+    logger = get_run_logger()
 
-engine = create_engine(url_object)
+    if not reference_data.loaded:
+        async with scheduler.acquire("neo4j"):
+            await asyncio.to_thread(reference_data.load, get_driver())
+
+    known_ids, unknown_ids = reference_data.validate(tail_label, tail_ids)
+    if unknown_ids != []:
+        logger.warning(f"Skipping {relationship_label} edges of movie_id {movie_id} to unknown {tail_label} ids: {unknown_ids}")
+        increment("unknown_reference_ids", len(unknown_ids), labels={"label": tail_label})
+
+    await run_step(
+        load_relationship_batch_to_kg,
+        relationship_label=relationship_label,
+        head_label="Movie",
+        tail_label=tail_label,
+        head_key="movie_id",
+        tail_key=REFERENCE_KEYS[tail_label],
+        relationships=[{"head_id": movie_id, "tail_id": tail_id} | relationship_properties.get(tail_id, {}) for tail_id in known_ids],
+        driver=get_driver()
+    )
 
 @flow(
     name="Movie Production Countries Load",
@@ -50,7 +121,7 @@ async def movie_production_country_flow(
     movie_id: int,
     production_countries: List
 ):
-    countries = await clean_production_countries(production_countries, movie_id)
+    countries = await run_step(clean_production_countries, production_countries, movie_id)
 
     # await load_multi_row_to_db(
     #     table_name="production_country",
@@ -59,15 +130,7 @@ async def movie_production_country_flow(
     #     engine=engine
     # )
 
-    for movie_id, country_id in countries:
-        await load_relationship_to_kg(
-            relationship_label="produced_in",
-            head_label="Movie",
-            tail_label="Country",
-            head_property_id={"movie_id": movie_id},
-            tail_property_id={"country_id": country_id},
-            driver=driver
-        )
+    await load_reference_edges(movie_id, "produced_in", "Country", [country_id for _, country_id in countries])
 
 @flow(
     name="Movie Provider ETL",
@@ -80,20 +143,18 @@ async def movie_provder_flow(
 ):
     logger = get_run_logger()
 
-    providers = await clean_watch_providers(movie_id, movie_providers)
-    # {provider_id: {buy: [region1, region2], rent: [], "subscription": []}}
-    for provider_id, details in providers.items():
-        for watch_type in ["buy", "rent", "subscription"]:
-            if details[watch_type] != []:
-                await load_relationship_to_kg(
-                    relationship_label="AVAILABLE_ON",
-                    head_label="Movie",
-                    tail_label="WatchProvider",
-                    head_property_id={"movie_id": movie_id},
-                    tail_property_id={"provider_id": provider_id},
-                    relationship_property={"region": details[watch_type], "type": watch_type},
-                    driver=driver
-                )
+    providers = await run_step(clean_watch_providers, movie_id, movie_providers)
+    # {provider_id: {buy: ["AT", "AU"], rent: [...], subscription: [...]}}, empty types are omitted
+    await load_reference_edges(
+        movie_id,
+        "AVAILABLE_ON",
+        "WatchProvider",
+        list(providers.keys()),
+        relationship_properties={
+            provider_id: {watch_type: regions.get(watch_type) for watch_type in WATCH_TYPES}
+            for provider_id, regions in providers.items()
+        }
+    )
 
     # for country, provider_id, provider_type in add_to_db:
     #     await load_relationship_to_kg(
@@ -125,20 +186,22 @@ async def external_data_flow(
     movie_id: int,
     wiki_id: str
 ):
-    wiki_soup = await scrape_html_content(
+    wiki_soup = await run_step(
+        scrape_html_content,
         wiki_id,
         url="https://www.wikidata.org/wiki",
         source="wikidata"
     )
 
-    external_ids = await clean_wikidata(
+    external_ids = await run_step(
+        clean_wikidata,
         wiki_id,
         wiki_soup
     )
 
-    await imdb_ratings_flow(movie_id, external_ids["imdb_id"])
-    await metacritic_ratings_flow(movie_id, external_ids["metacritic_id"])
-    await rotten_tomatoes_ratings_flow(movie_id, external_ids["rotten_tomatoes_id"])
+    await run_step(imdb_ratings_flow, movie_id, external_ids["imdb_id"])
+    await run_step(metacritic_ratings_flow, movie_id, external_ids["metacritic_id"])
+    await run_step(rotten_tomatoes_ratings_flow, movie_id, external_ids["rotten_tomatoes_id"])
 
 @flow(
     name="IMDB Rating ETL",
@@ -149,22 +212,22 @@ async def imdb_ratings_flow(
     movie_id: int,
     imdb_id: str
 ):
-    imdb_soup = await scrape_html_content(
+    imdb_soup = await run_step(
+        scrape_html_content,
         imdb_id,
         url="https://www.imdb.com/title",
         source="imdb"
     )
 
-    imdb_ratings = await clean_imdb_ratings(
+    imdb_ratings = await run_step(
+        clean_imdb_ratings,
         imdb_id,
         imdb_soup
     )
 
-    await load_single_row_to_db(
+    await row_buffer.add(
         table_name="imdb_details",
-        primary_key_id="imdb_id",
-        data=imdb_ratings | {"movie_id": movie_id},
-        engine=engine
+        row=imdb_ratings | {"movie_id": movie_id}
     )
 
 @flow(
@@ -176,22 +239,22 @@ async def metacritic_ratings_flow(
     movie_id: int,
     metacritic_id: str
 ):
-    metacritic_soup = await scrape_html_content(
+    metacritic_soup = await run_step(
+        scrape_html_content,
         metacritic_id,
         url="https://www.metacritic.com",
         source="metacritic"
     )
 
-    metacritic_ratings = await clean_metacritic_ratings(
+    metacritic_ratings = await run_step(
+        clean_metacritic_ratings,
         metacritic_id,
         metacritic_soup
     )
 
-    await load_single_row_to_db(
+    await row_buffer.add(
         table_name="metacritic_details",
-        primary_key_id="metacritic_id",
-        data=metacritic_ratings | {"movie_id": movie_id},
-        engine=engine
+        row=metacritic_ratings | {"movie_id": movie_id}
     )
 
 @flow(
@@ -203,49 +266,83 @@ async def rotten_tomatoes_ratings_flow(
     movie_id: int,
     rotten_tomatoes_id: str
 ):
-    rotten_tomatoes_soup = await scrape_html_content(
+    rotten_tomatoes_soup = await run_step(
+        scrape_html_content,
         rotten_tomatoes_id,
         url="https://www.rottentomatoes.com",
         source="rotten_tomatoes"
     )
 
-    rotten_tomatoes_ratings = await clean_rotten_tomatoes_ratings(
+    rotten_tomatoes_ratings = await run_step(
+        clean_rotten_tomatoes_ratings,
         rotten_tomatoes_id,
         rotten_tomatoes_soup
     )
 
-    await load_single_row_to_db(
+    await row_buffer.add(
         table_name="rotten_tomatoes_details",
-        primary_key_id="rotten_tomatoes_id",
-        data=rotten_tomatoes_ratings | {"movie_id": movie_id},
-        engine=engine
+        row=rotten_tomatoes_ratings | {"movie_id": movie_id}
     )
 
-@flow(
-    name="Movie Details ETL",
-    log_prints=True,
-    flow_run_name="movie-details-flow-on-{movie_id}"
-)
-async def movie_details_flow(
-    movie_id: int,
-):
+async def fetch_movie_stage(
+    movie_id: int
+) -> Dict:
+    completed_stages = get_completed_stages(movie_id)
+    movie = {
+        "movie_id": movie_id,
+        "completed_stages": completed_stages,
+        "raw": None,
+        "details": None
+    }
+
+    if "cleaned" in completed_stages:
+        movie["details"] = get_stage_payload(movie_id, "cleaned")
+    elif "fetched" in completed_stages:
+        movie["raw"] = get_stage_payload(movie_id, "fetched")
+    else:
+        movie["raw"] = await run_step(
+            get_data_from_tmdb_api,
+            id=movie_id,
+            url=f"{TMDB_API_URL}/movie",
+            endpoint_name="movie",
+            params={
+                "append_to_response": "credits,watch/providers,external_ids"
+            }
+        )
+        mark_stage(movie_id, "fetched", movie["raw"])
+
+    return movie
+
+async def clean_movie_stage(
+    movie: Dict
+) -> Dict:
+    if movie["details"] == None:
+        movie_id = movie["movie_id"]
+        movie["details"] = await run_step(clean_movie_details, movie["raw"]["id"], movie["raw"])
+        movie["raw"] = None
+
+        mark_stage(movie_id, "cleaned", movie["details"])
+        drop_stage_payload(movie_id, "fetched")
+
+    return movie
+
+async def load_movie_nodes_stage(
+    movie: Dict
+) -> Dict:
     logger = get_run_logger()
-    movie_details = await get_data_from_tmdb_api(
-        id=movie_id,
-        url="https://api.themoviedb.org/3/movie",
-        endpoint_name="movie",
-        params={
-            "append_to_response": "credits,watch/providers,external_ids"
-        }
-    )
-    movie_details = await clean_movie_details(movie_details["id"], movie_details)
+    movie_id = movie["movie_id"]
+    movie_details = movie["details"]
 
-    if movie_details["collection_id"] != None:
+    if "nodes" in movie["completed_stages"]:
+        return movie
+
+    if movie_details["collection_id"] != None and not collection_cache.is_loaded(movie_details["collection_id"]):
         logger.info("Collection exists for movie_id: " + str(movie_id))
     
-        await movie_collection_flow(movie_details["collection_id"])
+        await run_step(movie_collection_flow, movie_details["collection_id"])
 
-    await load_entity_to_kg(
+    await run_step(
+        load_entity_to_kg,
         node_label="Movie",
         node_property={k: movie_details[k] for k in [
             "movie_id",
@@ -257,21 +354,38 @@ async def movie_details_flow(
             "revenue",
             "runtime"
         ]},
-        driver=driver,
-        date_keys=["release_date"]
+        driver=get_driver(),
+        date_keys=["release_date"],
+        primary_key="movie_id"
     )
     
     if movie_details["collection_id"] != None:
-        await load_relationship_to_kg(
+        await run_step(
+            load_relationship_to_kg,
             relationship_label="PART_OF",
             head_label="Movie",
             tail_label="Collection",
             head_property_id={"movie_id": movie_id},
             tail_property_id={"collection_id": movie_details["collection_id"]},
-            driver=driver
+            driver=get_driver()
         )
 
-    return movie_details
+    mark_stage(movie_id, "nodes")
+    return movie
+
+@flow(
+    name="Movie Details ETL",
+    log_prints=True,
+    flow_run_name="movie-details-flow-on-{movie_id}"
+)
+async def movie_details_flow(
+    movie_id: int,
+):
+    movie = await fetch_movie_stage(movie_id)
+    movie = await clean_movie_stage(movie)
+    movie = await load_movie_nodes_stage(movie)
+
+    return movie["details"]
 
 @flow(
     name="Collection Details ETL",
@@ -281,22 +395,43 @@ async def movie_details_flow(
 async def movie_collection_flow(
     collection_id: int,
 ):
-    collection_details = await get_data_from_tmdb_api(
-        id=collection_id,
-        url="https://api.themoviedb.org/3/collection",
-        endpoint_name="collection"
-    )
+    async with collection_cache.lock(collection_id):
+        if collection_cache.is_loaded(collection_id):
+            return
 
-    collection_details = await clean_collection_details(
-        collection_id=collection_id,
-        collection_details=collection_details
-    )
+        if await is_node_reusable_async("Collection", "collection_id", collection_id, "collection"):
+            collection_cache.mark_loaded(collection_id)
+            increment("collection_cache_hits")
+            return
 
-    await load_entity_to_kg(
-        node_label="Collection",
-        node_property=collection_details,
-        driver=driver
-    )
+        # cached details were cleaned by the code a replay is meant to replace
+        collection_details = collection_cache.get_details(collection_id) if not raw_archive.replaying else None
+
+        if collection_details == None:
+            collection_details = await run_step(
+                get_data_from_tmdb_api,
+                id=collection_id,
+                url=f"{TMDB_API_URL}/collection",
+                endpoint_name="collection"
+            )
+
+            collection_details = await run_step(
+                clean_collection_details,
+                collection_id=collection_id,
+                collection_details=collection_details
+            )
+            collection_cache.save_details(collection_id, collection_details)
+        else:
+            increment("collection_cache_hits")
+
+        await run_step(
+            load_entity_to_kg,
+            node_label="Collection",
+            node_property=collection_details,
+            driver=get_driver(),
+            primary_key="collection_id"
+        )
+        collection_cache.mark_loaded(collection_id)
 
 @flow(
     name="Movie Genre Load",
@@ -307,17 +442,10 @@ async def movie_genre_flow(
     movie_id: int,
     movie_genres: List
 ):  
-    genres = await clean_genres(movie_genres, movie_id)
+    genres = await run_step(clean_genres, movie_genres, movie_id)
+
+    await load_reference_edges(movie_id, "HAS_GENRE", "Genre", [genre_id for _, genre_id in genres])
 
-    for movie_id, genre_id in genres:
-        await load_relationship_to_kg(
-            relationship_label="HAS_GENRE",
-            head_label="Movie",
-            tail_label="Genre",
-            head_property_id={"movie_id": movie_id},
-            tail_property_id={"genre_id": genre_id},
-            driver=driver
-        )
 @flow(
     name="Movie Language Load",
     log_prints=True,
@@ -327,17 +455,9 @@ async def movie_language_flow(
     movie_id: int,
     movie_languages: List
 ):
-    languages = await clean_languages(movie_languages, movie_id)
+    languages = await run_step(clean_languages, movie_languages, movie_id)
 
-    for movie_id, language_id in languages:
-        await load_relationship_to_kg(
-            relationship_label="HAS_LANGUAGE",
-            head_label="Movie",
-            tail_label="Language",
-            head_property_id={"movie_id": movie_id},
-            tail_property_id={"language_id": language_id},
-            driver=driver
-        )
+    await load_reference_edges(movie_id, "HAS_LANGUAGE", "Language", [language_id for _, language_id in languages])
 
 @flow(
     name="Company Details ET",
@@ -347,12 +467,13 @@ async def movie_language_flow(
 async def company_details_flow(
     company_id: int,
 ) -> Dict:
-    company_details = await get_data_from_tmdb_api(
+    company_details = await run_step(
+        get_data_from_tmdb_api,
         id=company_id,
-        url="https://api.themoviedb.org/3/company",
+        url=f"{TMDB_API_URL}/company",
         endpoint_name="company"
     )
-    company_details = await clean_company_details(company_id, company_details)
+    company_details = await run_step(clean_company_details, company_id, company_details)
 
     return company_details
 
@@ -367,59 +488,65 @@ async def movie_production_flow(
 ):
     for company_id in movie_productions:
         companies_to_add = []
-        if not is_node_exist("Company", "company_id", company_id, driver):
-            company_details = await company_details_flow(company_id)
+        if not await is_node_reusable_async("Company", "company_id", company_id, "company"):
+            company_details = await run_step(company_details_flow, company_id)
             companies_to_add.append(company_details)
             parent_company_id = company_details["parent_company_id"]
 
+            # walk up the parent chain until it reaches a company already in the graph
             while parent_company_id != None:
-                if not is_node_exist("Company", "company_id", parent_company_id, driver):
-                    parent_company_details = await company_details_flow(parent_company_id)
-                    companies_to_add.append(parent_company_details)
-                
+                if await is_node_reusable_async("Company", "company_id", parent_company_id, "company"):
+                    break
+
+                parent_company_details = await run_step(company_details_flow, parent_company_id)
                 companies_to_add.append(parent_company_details)
-                parent_company_id = companies_to_add[-1]["parent_company_id"]
+                parent_company_id = parent_company_details["parent_company_id"]
 
             for i in range(len(companies_to_add)-1, -1, -1):
                 
-                await load_entity_to_kg(
+                await run_step(
+                    load_entity_to_kg,
                     node_label="Company",
                     node_property={k: companies_to_add[i][k] for k in [
                         "company_id",
                         "head_quarters",
                         "name"
                     ]},
-                    driver=driver
+                    driver=get_driver(),
+                    primary_key="company_id"
                 )
 
                 if companies_to_add[i]["country_id"] != None:
-                    await load_relationship_to_kg(
+                    await run_step(
+                        load_relationship_to_kg,
                         relationship_label="BASED_ON",
                         head_label="Company",
                         tail_label="Country",
                         head_property_id={"company_id": companies_to_add[i]["company_id"]},
                         tail_property_id={"country_id": companies_to_add[i]["country_id"]},
-                        driver=driver
+                        driver=get_driver()
                     )
 
                 if companies_to_add[i]["parent_company_id"] != None:
-                    await load_relationship_to_kg(
+                    await run_step(
+                        load_relationship_to_kg,
                         relationship_label="PART_OF",
                         head_label="Company",
                         tail_label="Company",
                         head_property_id={"company_id": companies_to_add[i]["company_id"]},
                         tail_property_id={"parent_company_id": companies_to_add[i]["parent_company_id"]},
                         tail_map_key={"parent_company_id": "company_id"},
-                        driver=driver
+                        driver=get_driver()
                     )
 
-        await load_relationship_to_kg(
+        await run_step(
+            load_relationship_to_kg,
             relationship_label="PRODUCED_BY",
             head_label="Movie",
             tail_label="Company",
             head_property_id={"movie_id": movie_id},
             tail_property_id={"company_id": company_id},
-            driver=driver
+            driver=get_driver()
         )
 
 @flow(
@@ -430,31 +557,38 @@ async def movie_production_flow(
 async def cast_flow(
     movie_id: int,
     cast: Dict,
-    person_id: int
+    person_id: int,
+    append_roles: bool=False
 ):
     logger = get_run_logger()
-    if not is_node_exist("Person", "person_id", person_id, driver):
-        logger.warning(f"Person with primary id of {person_id} doesn't exists!")
+    # a replay rewrites the person from the re-cleaned credits
+    if raw_archive.replaying or not await is_node_exist_async("Person", "person_id", person_id, get_driver()):
+        if not raw_archive.replaying:
+            logger.warning(f"Person with primary id of {person_id} doesn't exists!")
 
-        await load_entity_to_kg(
+        await run_step(
+            load_entity_to_kg,
             node_label="Person",
             node_property={k: cast[k] for k in [
                 "person_id",
                 "name",
                 "gender"
             ]},
-            driver=driver,
+            driver=get_driver(),
+            primary_key="person_id"
             # date_keys=["birthday", "deathday"]
         )
 
-    await load_relationship_to_kg(
+    await run_step(
+        load_relationship_to_kg,
         relationship_label="ACTED_IN",
         head_label="Person",
         tail_label="Movie",
         head_property_id={"person_id": person_id},
         tail_property_id={"movie_id": movie_id},
-        driver=driver,
-        relationship_property={"role": cast["character"]} if cast["character"] != "" else {}
+        driver=get_driver(),
+        relationship_property={"roles": cast["characters"]} if cast["characters"] != [] else {},
+        append_keys=["roles"] if append_roles else []
     )
 
 @flow(
@@ -465,15 +599,9 @@ async def cast_flow(
 async def movie_cast_flow(
     movie_id: int,
     movie_casts: List,
-    person_limit: int
+    append_roles: bool=False
 ):
-    cast_details_limit = asyncio.Semaphore(person_limit)
-
-    async def process_cast_with_semaphore(coro):
-        async with cast_details_limit:
-            return await coro
-
-    futures = [process_cast_with_semaphore(cast_flow(movie_id, cast, cast["person_id"])) for cast in movie_casts]
+    futures = [run_step(cast_flow, movie_id, cast, cast["person_id"], append_roles) for cast in aggregate_casts(movie_casts)]
     await asyncio.gather(*futures)
 
 @flow(
@@ -487,28 +615,33 @@ async def crew_flow(
     person_id: int
 ):
     logger = get_run_logger()
-    if not is_node_exist("Person", "person_id", person_id, driver):
-        logger.warning(f"Person with primary id of {person_id} doesn't exists!")
+    # a replay rewrites the person from the re-cleaned credits
+    if raw_archive.replaying or not await is_node_exist_async("Person", "person_id", person_id, get_driver()):
+        if not raw_archive.replaying:
+            logger.warning(f"Person with primary id of {person_id} doesn't exists!")
 
-        await load_entity_to_kg(
-            node_label=f"Person",
+        await run_step(
+            load_entity_to_kg,
+            node_label="Person",
             node_property={k: crew[k] for k in [
                 "person_id",
                 "name",
                 "gender"
             ]},
-            driver=driver,
+            driver=get_driver(),
+            primary_key="person_id"
             # date_keys=["birthday", "deathday"]
         )
 
-    await load_relationship_to_kg(
+    await run_step(
+        load_relationship_to_kg,
         relationship_label=map_departement(crew["department"]),
         head_label="Movie",
         tail_label="Person",
         head_property_id={"movie_id": movie_id},
         tail_property_id={"person_id": person_id},
-        driver=driver,
-        relationship_property={"job": crew["job"]} if crew["job"] != "" else {}
+        driver=get_driver(),
+        relationship_property={"jobs": crew["jobs"]} if crew["jobs"] != [] else {}
     )
 
 @flow(
@@ -518,69 +651,406 @@ async def crew_flow(
 )
 async def movie_crew_flow(
     movie_id: int,
-    movie_crews: List,
-    person_limit: int
+    movie_crews: List
 ):
-    crew_limit = asyncio.Semaphore(person_limit)
+    futures = [run_step(crew_flow, movie_id, crew, crew["person_id"]) for crew in aggregate_crews(movie_crews)]
+    await asyncio.gather(*futures)
+
+async def load_movie_edges_stage(
+    movie: Dict,
+    external_data: bool=False,
+    credit_filter: Dict=None
+) -> Dict:
+    logger = get_run_logger()
+    movie_id = movie["movie_id"]
+    movie_details = movie["details"]
+    completed_stages = movie["completed_stages"]
 
-    async def process_crew_with_semaphore(coro):
-        async with crew_limit:
-            return await coro
+    if "edges" not in completed_stages:
+        futures = [
+            run_step(movie_provder_flow, movie_id, movie_details["watch_providers"]),
+        ]
 
-    futures = [process_crew_with_semaphore(crew_flow(movie_id, crew, crew["person_id"])) for crew in movie_crews]
-    await asyncio.gather(*futures)
+        if credit_filter != None:
+            kept_credits, deferred_credits = split_credits(movie_details["casts"], movie_details["crews"], **credit_filter)
+
+            if kept_credits["casts"] != []:
+                futures.append(run_step(movie_cast_flow, movie_id, kept_credits["casts"]))
+            if kept_credits["crews"] != []:
+                futures.append(run_step(movie_crew_flow, movie_id, kept_credits["crews"]))
+
+            if deferred_credits["casts"] != [] or deferred_credits["crews"] != []:
+                logger.info(f"Deferred {len(deferred_credits["casts"])} casts and {len(deferred_credits["crews"])} crews")
+                # the limits travel with the flag, so deferred_credits_flow splits the same way
+                futures.append(run_step(
+                    load_entity_to_kg,
+                    node_label="Movie",
+                    node_property={
+                        "movie_id": movie_id,
+                        "credits_deferred": True,
+                        "deferred_cast_limit": credit_filter["cast_limit"],
+                        "deferred_crew_departments": credit_filter["crew_departments"]
+                    },
+                    driver=get_driver(),
+                    primary_key="movie_id"
+                ))
+
+        if movie_details["genres"] != []:
+            futures.append(run_step(movie_genre_flow, movie_id, movie_details["genres"]))
+        else:
+            logger.warning("Movie genres doesn't exists!")
+
+        if movie_details["spoken_languages"] != []:
+            futures.append(run_step(movie_language_flow, movie_id, movie_details["spoken_languages"]))
+        else:
+            logger.warning("Movie languages doesn't exists!")
+
+        if movie_details["production_companies"] != []:
+            futures.append(run_step(movie_production_flow, movie_id, movie_details["production_companies"]))
+        else:
+            logger.warning("Production companies doesn't exists!")
+
+        # if movie_details["production_countries"] != []:
+        #     futures.append(movie_production_country_flow(movie_id, movie_details["production_countries"]))
+        # else:
+        #     logger.warning("Production countries doesn't exists!")
+
+        # try:
+        await asyncio.gather(*futures)
+        mark_stage(movie_id, "edges")
+
+        # except Exception as e:
+        #     logger.error(f"Error processing movie: {e}")
+        #     logger.warning("Rollback current movie")
+        #     rollback_movie(movie_id, engine)
+        
+        # finally:
+        #     await asyncio.sleep(5)
+
+    if external_data and "ratings" not in completed_stages:
+        if movie_details["wiki_id"] != None:
+            await run_step(external_data_flow, movie_id, movie_details["wiki_id"])
+        else:
+            logger.warning("Wiki ID doesn't exists!")
+        # the rating rows wait in row_buffer, the stage is done once they are flushed
+        row_buffer.when_written(movie_id, bind_mark_stage(movie_id, "ratings"))
+
+    # stamped last, so filter_loaded_movie_ids retries a movie whose edges failed
+    await run_step(
+        load_entity_to_kg,
+        node_label="Movie",
+        node_property={"movie_id": movie_id, "loaded_at": datetime.now(timezone.utc).isoformat()},
+        driver=get_driver(),
+        date_keys=["loaded_at"],
+        primary_key="movie_id"
+    )
+
+    increment("movies_loaded")
+    return movie
 
 @flow(
     name="Movie ETL",
     log_prints=True,
     flow_run_name="movie-flow-on-{movie_id}"
 )
-async def single_movie_flow(movie_id: int, person_limit: int):
+async def single_movie_flow(
+    movie_id: int,
+    external_data: bool=False,
+    credit_filter: Dict=None
+):
     logger = get_run_logger()
-    movie_details = await movie_details_flow(movie_id)
 
-    logger.info(f"Get movie casts: {len(movie_details["casts"])}")
-    logger.info(f"Get movie crews: {len(movie_details["crews"])}")
+    with profile_movie(movie_id):
+        completed_stages = get_completed_stages(movie_id)
+        movie_details = await run_step(movie_details_flow, movie_id)
 
-    futures = [
-        # movie_cast_flow(movie_id, movie_details["casts"], person_limit),
-        # movie_crew_flow(movie_id, movie_details["crews"], person_limit),
-        movie_provder_flow(movie_id, movie_details["watch_providers"]),
-    ]
-    # futures = []
+        logger.info(f"Get movie casts: {len(movie_details["casts"])}")
+        logger.info(f"Get movie crews: {len(movie_details["crews"])}")
 
-    if movie_details["genres"] != []:
-        futures.append(movie_genre_flow(movie_id, movie_details["genres"]))
-    else:
-        logger.warning("Movie genres doesn't exists!")
+        await load_movie_edges_stage(
+            {
+                "movie_id": movie_id,
+                "completed_stages": completed_stages,
+                "details": movie_details
+            },
+            external_data=external_data,
+            credit_filter=credit_filter
+        )
 
-    if movie_details["spoken_languages"] != []:
-        futures.append(movie_language_flow(movie_id, movie_details["spoken_languages"]))
-    else:
-        logger.warning("Movie languages doesn't exists!")
+@task(
+    name="Movie ETL Task",
+    log_prints=True,
+    cache_policy=NONE,
+    task_run_name="movie-task-on-{movie_id}"
+)
+async def single_movie_task(
+    movie_id: int,
+    external_data: bool=False,
+    credit_filter: Dict=None
+):
+    with lightweight_steps(f"movie-{movie_id}"):
+        await single_movie_flow.fn(movie_id, external_data, credit_filter)
+
+@task(
+    name="Movie Batch ETL Task",
+    log_prints=True,
+    cache_policy=NONE,
+    task_run_name="movie-batch-task-of-{batch_id}"
+)
+async def movie_batch_task(
+    batch_id: int,
+    movie_ids: List,
+    external_data: bool=False,
+    credit_filter: Dict=None
+):
+    with lightweight_steps(f"movie-batch-{batch_id}"):
+        for movie_id in movie_ids:
+            await single_movie_flow.fn(movie_id, external_data, credit_filter)
+
+@flow(
+    name="Deferred Credits ETL",
+    log_prints=True,
+    flow_run_name="deferred-credits-flow"
+)
+async def deferred_credits_flow(
+    movie_ids: List=None,
+    cast_limit: int=None,
+    crew_departments: List=None,
+    movie_limit: int=3
+):
+    logger = get_run_logger()
+
+    def get_deferred_movies():
+        with get_driver().session() as session:
+            result = session.run(
+                """MATCH (n:Movie) WHERE n.credits_deferred = true AND ($movie_ids IS NULL OR n.movie_id IN $movie_ids)
+                RETURN n.movie_id AS movie_id, n.deferred_cast_limit AS cast_limit, n.deferred_crew_departments AS crew_departments""",
+                parameters={"movie_ids": movie_ids}
+            )
+            return {record["movie_id"]: (record["cast_limit"], record["crew_departments"]) for record in result}
+
+    deferred_movies = await asyncio.to_thread(get_deferred_movies)
+    movie_ids = list(deferred_movies.keys())
+    logger.info(f"Loading deferred credits of {len(movie_ids)} movies")
+
+    async def load_deferred_credits(movie_id):
+        # a deferral stores at least one limit, the arguments only cover movies
+        # deferred before the limits were stored
+        movie_cast_limit, movie_crew_departments = deferred_movies[movie_id]
+        if movie_cast_limit == None and movie_crew_departments == None:
+            movie_cast_limit, movie_crew_departments = cast_limit, crew_departments
+        if movie_cast_limit == None and movie_crew_departments == None:
+            raise ValueError("Unknown credit limits, pass the cast_limit and crew_departments the movie was loaded with")
+
+        movie_credits = await run_step(
+            get_data_from_tmdb_api,
+            id=f"{movie_id}/credits",
+            url=f"{TMDB_API_URL}/movie",
+            endpoint_name="credits"
+        )
+        movie_credits = await run_step(clean_movie_credits, movie_id, movie_credits)
+        _, deferred_credits = split_credits(movie_credits["casts"], movie_credits["crews"], movie_cast_limit, movie_crew_departments)
+
+        # the flag is only cleared once both loads succeeded, gather raises otherwise.
+        # A cast member with roles on both sides of the limit already has an edge
+        # for the kept roles, so the deferred ones are appended to it.
+        await asyncio.gather(
+            run_step(movie_cast_flow, movie_id, deferred_credits["casts"], append_roles=True),
+            run_step(movie_crew_flow, movie_id, deferred_credits["crews"])
+        )
+        await run_step(
+            load_entity_to_kg,
+            node_label="Movie",
+            node_property={"movie_id": movie_id, "credits_deferred": False},
+            driver=get_driver(),
+            primary_key="movie_id"
+        )
+
+    failures = await run_worker_pool(movie_ids, load_deferred_credits, movie_limit)
+    for movie_id, error in failures:
+        logger.error(f"Failed loading deferred credits of movie_id {movie_id}: {error!r}")
+
+    return {
+        "movie_ids": len(movie_ids),
+        "failed_movie_ids": [movie_id for movie_id, _ in failures]
+    }
 
-    if movie_details["production_companies"] != []:
-        futures.append(movie_production_flow(movie_id, movie_details["production_companies"]))
+@flow(
+    name="Watch Provider Refresh ETL",
+    log_prints=True,
+    flow_run_name="watch-provider-refresh-flow"
+)
+async def refresh_watch_providers_flow(
+    movie_ids: List,
+    batch_size: int=200,
+    movie_limit: int=10
+):
+    logger = get_run_logger()
+    summary = {"movie_ids": len(movie_ids), "added": 0, "changed": 0, "removed": 0, "failed_movie_ids": []}
+
+    if not reference_data.loaded:
+        async with scheduler.acquire("neo4j"):
+            await asyncio.to_thread(reference_data.load, get_driver())
+
+    for start in range(0, len(movie_ids), batch_size):
+        batch_movie_ids = movie_ids[start:start + batch_size]
+        fresh_edges = {}
+
+        async def fetch_providers(movie_id):
+            movie_providers = await run_step(
+                get_data_from_tmdb_api,
+                id=f"{movie_id}/watch/providers",
+                url=f"{TMDB_API_URL}/movie",
+                endpoint_name="watch providers"
+            )
+            providers = await run_step(clean_watch_providers, movie_id, movie_providers)
+
+            # an edge to an unknown provider is never written, so diffing it would re-add it on every refresh
+            known_ids, unknown_ids = reference_data.validate("WatchProvider", list(providers.keys()))
+            if unknown_ids != []:
+                logger.warning(f"Skipping AVAILABLE_ON edges of movie_id {movie_id} to unknown WatchProvider ids: {unknown_ids}")
+                increment("unknown_reference_ids", len(unknown_ids), labels={"label": "WatchProvider"})
+            fresh_edges[movie_id] = {provider_id: providers[provider_id] for provider_id in known_ids}
+
+        failures = await run_worker_pool(batch_movie_ids, fetch_providers, movie_limit)
+        for movie_id, error in failures:
+            logger.error(f"Failed fetching watch providers of movie_id {movie_id}: {error!r}")
+        summary["failed_movie_ids"] += [movie_id for movie_id, _ in failures]
+
+        async with scheduler.acquire("neo4j"):
+            stored_edges = await asyncio.to_thread(get_provider_edges, list(fresh_edges.keys()), get_driver())
+        upserts, removals = diff_provider_edges(stored_edges, fresh_edges)
+
+        edge_keys = {
+            "relationship_label": "AVAILABLE_ON",
+            "head_label": "Movie",
+            "tail_label": "WatchProvider",
+            "head_key": "movie_id",
+            "tail_key": "provider_id",
+            "driver": get_driver()
+        }
+        await run_step(load_relationship_batch_to_kg, relationships=upserts, **edge_keys)
+        await run_step(delete_relationship_batch_from_kg, relationships=removals, **edge_keys)
+
+        added = sum(1 for edge in upserts if edge["tail_id"] not in stored_edges[edge["head_id"]])
+        summary["added"] += added
+        summary["changed"] += len(upserts) - added
+        summary["removed"] += len(removals)
+        logger.info(
+            f"Refreshed watch providers of {min(start + batch_size, len(movie_ids))}/{len(movie_ids)} movies: "
+            f"{summary['added']} added, {summary['changed']} changed, {summary['removed']} removed"
+        )
+
+    return summary
+
+@flow(
+    name="Person Enrichment ETL",
+    log_prints=True,
+    flow_run_name="person-enrichment-flow"
+)
+async def person_enrichment_flow(
+    movie_ids: List=None,
+    person_ids: List=None,
+    enrich_workers: int=20,
+    batch_size: int=500,
+    stale_after_days: int=None
+):
+    logger = get_run_logger()
+
+    if movie_ids == None and person_ids == None:
+        raise ValueError("person_enrichment_flow needs the movie_ids of a run or person_ids")
+
+    enriched_after = datetime.now(timezone.utc) - timedelta(days=stale_after_days) if stale_after_days != None else None
+
+    if person_ids == None:
+        # the persons credited on the run's movies, read from the graph so movies
+        # finished by an earlier attempt of a resumed run are covered too
+        person_ids = await asyncio.to_thread(get_unenriched_person_ids, movie_ids, get_driver(), enriched_after)
+        logger.info(f"Enriching {len(person_ids)} persons of {len(movie_ids)} movies not enriched yet or stale")
     else:
-        logger.warning("Production companies doesn't exists!")
+        enriched_person_ids = await asyncio.to_thread(
+            get_existing_node_ids,
+            "Person",
+            "person_id",
+            person_ids,
+            get_driver(),
+            loaded_after=enriched_after,
+            timestamp_key="enriched_at"
+        )
+        person_ids = [person_id for person_id in person_ids if person_id not in enriched_person_ids]
+        logger.info(f"Enriching {len(person_ids)} persons, {len(enriched_person_ids)} already enriched")
 
-    # if movie_details["production_countries"] != []:
-    #     futures.append(movie_production_country_flow(movie_id, movie_details["production_countries"]))
-    # else:
-    #     logger.warning("Production countries doesn't exists!")
+    person_details_batch = []
+    batch_failures = []
 
-    # if movie_details["wiki_id"] != None:
-    #     futures.append(external_data_flow(movie_id, movie_details["wiki_id"]))
-    # else:
-    #     logger.warning("Wiki ID doesn't exists!")
+    async def enrich_person(person_id):
+        person_details = await run_step(
+            get_data_from_tmdb_api,
+            id=person_id,
+            url=f"{TMDB_API_URL}/person",
+            endpoint_name="person"
+        )
+        person_details = await run_step(clean_person_details, person_id, person_details)
+        person_details_batch.append(person_details | {"enriched_at": datetime.now(timezone.utc).isoformat()})
 
-    # try:
-    await asyncio.gather(*futures)
+        if len(person_details_batch) >= batch_size:
+            await flush_batch()
 
-    # except Exception as e:
-    #     logger.error(f"Error processing movie: {e}")
-    #     logger.warning("Rollback current movie")
-    #     rollback_movie(movie_id, engine)
-    
-    # finally:
-    #     await asyncio.sleep(5)
\ No newline at end of file
+    async def flush_batch():
+        rows = person_details_batch[:]
+        person_details_batch.clear()
+        if rows == []:
+            return
+
+        # a failed upsert is reported for every person of the batch, not the one that filled it
+        try:
+            await run_step(
+                load_entity_batch_to_kg,
+                node_label="Person",
+                primary_key="person_id",
+                node_properties=rows,
+                driver=get_driver(),
+                date_keys=["birthday", "deathday", "enriched_at"]
+            )
+        except Exception as e:
+            batch_failures.append(([row["person_id"] for row in rows], e))
+
+    failures = await run_worker_pool(person_ids, enrich_person, enrich_workers)
+    await flush_batch()
+
+    for person_id, error in failures:
+        logger.warning(f"Failed enriching person {person_id}: {error!r}")
+    for batch_person_ids, error in batch_failures:
+        logger.warning(f"Failed writing a batch of {len(batch_person_ids)} persons {batch_person_ids}: {error!r}")
+
+    return {
+        "person_ids": len(person_ids),
+        "failed_person_ids": [person_id for person_id, _ in failures] + [
+            person_id for batch_person_ids, _ in batch_failures for person_id in batch_person_ids
+        ]
+    }
+
+async def run_movie_pipeline(
+    movie_ids: List,
+    external_data: bool=False,
+    stage_workers: Dict=None,
+    queue_size: int=10,
+    credit_filter: Dict=None
+) -> List:
+    stage_workers = {"fetch": 4, "clean": 2, "nodes": 2, "edges": 4} | (stage_workers or {})
+
+    async def load_edges(movie):
+        await load_movie_edges_stage(movie, external_data=external_data, credit_filter=credit_filter)
+
+    failures = await run_pipeline(
+        movie_ids,
+        stages=[
+            ("fetch", fetch_movie_stage, stage_workers["fetch"]),
+            ("clean", clean_movie_stage, stage_workers["clean"]),
+            ("nodes", load_movie_nodes_stage, stage_workers["nodes"]),
+            ("edges", load_edges, stage_workers["edges"])
+        ],
+        queue_size=queue_size
+    )
+
+    return [(movie if isinstance(movie, int) else movie["movie_id"], stage, error) for movie, stage, error in failures]
@@ -1,19 +1,26 @@
-from neo4j import GraphDatabase
-import os
 from typing import List, Dict
-import pandas as pd
-from dotenv import load_dotenv
-from prefect import flow
+import asyncio
+import os
+from datetime import datetime, timezone
+from prefect import flow, get_run_logger
 
 from src.movie_etl.utils.etl import load_to_csv
-from src.movie_etl.tasks.kg_task import load_entity_from_csv_to_kg, load_entity_to_kg
-
-load_dotenv()
-
-driver = GraphDatabase.driver(
-    uri=f"bolt://{os.getenv('NEO4J_HOST')}:{os.getenv('NEO4J_PORT')}",
-    auth=(os.getenv("NEO4J_USER"), os.getenv("NEO4J_PASSWORD"))
+from src.movie_etl.utils.connections import get_driver
+from src.movie_etl.utils.export import (
+    PartWriter,
+    load_graph_schema,
+    get_database_time,
+    shift_database_time,
+    export_nodes,
+    export_relationships,
+    load_manifest,
+    save_manifest,
+    read_export,
+    resolve_edges,
+    build_csr,
+    write_csr
 )
+from src.movie_etl.tasks.kg_task import load_entity_from_csv_to_kg
 
 @flow(
     name="Bulk Entity Flow",
@@ -24,8 +31,92 @@ def bulk_entity_flow(
     node_label: str,
     property_columns: List=None,
     path: str=None,
-    df: pd.DataFrame=None
+    # a pandas DataFrame, left unannotated so importing the flows doesn't load pandas
+    df=None
 ):
     load_to_csv(path, df, property_columns)
 
-    load_entity_from_csv_to_kg(path, node_label, property_columns, driver)
\ No newline at end of file
+    load_entity_from_csv_to_kg(path, node_label, property_columns, get_driver())
+
+@flow(
+    name="Graph Export Flow",
+    log_prints=True,
+    validate_parameters=False
+)
+async def graph_export_flow(
+    export_dir: str="graph_export",
+    full: bool=False,
+    build_adjacency: bool=True,
+    part_rows: int=100000,
+    overlap_seconds: int=300
+) -> Dict:
+    if overlap_seconds < 0:
+        raise ValueError(f"overlap_seconds must be at least 0, got {overlap_seconds}")
+
+    logger = get_run_logger()
+    schema = load_graph_schema()
+    driver = get_driver()
+
+    os.makedirs(export_dir, exist_ok=True)
+    manifest = load_manifest(export_dir)
+    if full:
+        manifest = {"exports": []}
+    since = manifest["exports"][-1]["watermark"] if manifest["exports"] != [] else None
+
+    export_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    watermark = await asyncio.to_thread(get_database_time, driver)
+    # Writers stamp updated_at = datetime() when a statement runs but commit later,
+    # so a write stamped before the previous watermark can become visible after
+    # that export read past it. Re-reading the overlap catches it, and the rows it
+    # exports again are harmless since a node and its edges are replaced as a unit.
+    if since != None and overlap_seconds > 0:
+        since = await asyncio.to_thread(shift_database_time, driver, since, -overlap_seconds)
+    logger.info(f"Exporting graph changes since {since or 'the beginning'} as {export_id}")
+
+    # one read query at a time, so an export doesn't compete with the ETL for the database
+    node_writer = PartWriter(export_dir, "nodes", export_id, part_rows)
+    edge_writer = PartWriter(export_dir, "edges", export_id, part_rows)
+    skipped = 0
+    for node_label, primary_key in schema["node_keys"].items():
+        await asyncio.to_thread(export_nodes, node_label, primary_key, since, node_writer, driver)
+        skipped += await asyncio.to_thread(
+            export_relationships,
+            node_label,
+            schema["node_keys"],
+            schema["relationship_types"],
+            since,
+            edge_writer,
+            driver
+        )
+    await asyncio.to_thread(node_writer.flush)
+    await asyncio.to_thread(edge_writer.flush)
+
+    if skipped > 0:
+        logger.warning(f"Skipped {skipped} relationships whose type has no constraint in 1_constraints.cypher")
+
+    export = {
+        "export_id": export_id,
+        "since": since,
+        "watermark": watermark,
+        "nodes": node_writer.get_summary(),
+        "edges": edge_writer.get_summary()
+    }
+    manifest["exports"].append(export)
+    save_manifest(export_dir, manifest)
+    logger.info(
+        f"Exported {sum(summary['rows'] for summary in export['nodes'].values())} nodes and "
+        f"{sum(summary['rows'] for summary in export['edges'].values())} relationships"
+    )
+
+    if build_adjacency:
+        # rebuilt from the exported parts, not from the database
+        exports = [
+            await asyncio.to_thread(read_export, export_dir, past_export, schema["node_keys"])
+            for past_export in manifest["exports"]
+        ]
+        nodes, edges = resolve_edges(exports)
+        csr = await asyncio.to_thread(build_csr, nodes, edges, schema["relationship_types"])
+        csr_dir = await asyncio.to_thread(write_csr, export_dir, csr, schema["relationship_types"])
+        logger.info(f"Wrote CSR adjacency of {len(csr['nodes'])} nodes and {len(csr['indices'])} edges to {csr_dir}")
+
+    return export
@@ -1,16 +1,35 @@
-import numpy as np
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, TYPE_CHECKING
 import requests
 import os
+import json
 import asyncio
-from sqlalchemy.engine.base import Engine
+from datetime import datetime, timedelta, timezone
 from prefect import task, get_run_logger
 from prefect.cache_policies import NONE
 from bs4 import BeautifulSoup
 import re
 from collections import defaultdict
+from urllib.parse import urlparse
+
+from src.movie_etl.utils.etl import (
+    map_gender,
+    extract_metacritic_data,
+    get_existing_node_ids,
+    get_existing_primary_keys,
+    parse_casts,
+    parse_crews
+)
+from src.movie_etl.utils.scheduler import scheduler
+from src.movie_etl.utils.metrics import increment, timed
+from src.movie_etl.utils.archive import raw_archive, get_request_key
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine.base import Engine
+    from neo4j import Driver
 
-from src.movie_etl.utils.etl import map_gender, extract_metacritic_data
+TMDB_API_URL = os.getenv("TMDB_API_URL", "https://api.themoviedb.org/3")
+
+SKIP_SOURCES = {"kg", "db"}
 
 tmdb_headers = {
     "accept": "application/json",
@@ -21,6 +40,11 @@ headers = {
     'User-Agent': 'Mozilla/5.0'
 }
 
+async def pace(seconds: float=2):
+    # spaces out calls to TMDB, the ratings sites and the databases, a replay runs at full speed
+    if not raw_archive.replaying:
+        await asyncio.sleep(seconds)
+
 @task(
     name="Retrieve Movie IDs",
     log_prints=True,
@@ -30,7 +54,7 @@ headers = {
 async def get_movie_ids(
     start_date: str=None,
     end_date: str=None,
-    url: str="https://api.themoviedb.org/3/discover/movie",
+    url: str=f"{TMDB_API_URL}/discover/movie",
     vote_count_minimum: int=10,
     original_language: str=""
 ) -> List:
@@ -39,7 +63,7 @@ async def get_movie_ids(
 
     movie_ids = []
     page = 1
-    total_pages = np.inf
+    total_pages = float("inf")
     
     while page <= total_pages:
         params = {
@@ -54,11 +78,15 @@ async def get_movie_ids(
             "with_original_language": original_language
         }
 
-        response = requests.get(
-            url,
-            headers=tmdb_headers,
-            params=params
-        )
+        async with scheduler.acquire("tmdb"):
+            with timed("tmdb_request_seconds", endpoint="discover"):
+                response = await asyncio.to_thread(
+                    requests.get,
+                    url,
+                    headers=tmdb_headers,
+                    params=params
+                )
+        increment("api_calls", labels={"endpoint": "discover", "status": response.status_code})
 
         try:
             response.raise_for_status()
@@ -75,6 +103,39 @@ async def get_movie_ids(
     await asyncio.sleep(2)
     return movie_ids
 
+@task(
+    name="Filter Loaded Movie IDs",
+    log_prints=True,
+    cache_policy=NONE
+)
+async def filter_loaded_movie_ids(
+    movie_ids: List,
+    driver: "Driver"=None,
+    engine: "Engine"=None,
+    stale_after_days: int=None,
+    force: bool=False,
+    skip_source: str="kg"
+) -> List:
+    logger = get_run_logger()
+
+    if skip_source not in SKIP_SOURCES:
+        raise ValueError(f"Unknown skip_source {skip_source!r}, expected one of {sorted(SKIP_SOURCES)}")
+    if skip_source == "db" and stale_after_days != None:
+        # the movies table has no load timestamp, only Movie nodes carry loaded_at
+        raise ValueError("stale_after_days needs skip_source='kg'")
+
+    if force or movie_ids == []:
+        return movie_ids
+
+    if skip_source == "kg":
+        loaded_after = datetime.now(timezone.utc) - timedelta(days=stale_after_days) if stale_after_days != None else None
+        loaded_ids = get_existing_node_ids("Movie", "movie_id", movie_ids, driver, loaded_after=loaded_after)
+    else:
+        loaded_ids = get_existing_primary_keys(movie_ids, "movie_id", "movies", engine)
+
+    logger.info(f"Skipping {len(loaded_ids)} of {len(movie_ids)} movie_ids already loaded")
+    return [movie_id for movie_id in movie_ids if movie_id not in loaded_ids]
+
 @task(
     name="Retrieve Data from TMDB API",
     log_prints=True,
@@ -87,25 +148,43 @@ async def get_data_from_tmdb_api(
     endpoint_name: str,
     params: Dict=None
 ) -> Dict:
-    if id == None:
-        response = requests.get(
-            url,
-            headers=tmdb_headers,
-            params=params
-        )
-    else:
-        response = requests.get(
-            f"{url}/{id}",
-            headers=tmdb_headers,
-            params=params
-        )
+    request_url = f"{url}/{id}" if id != None else url
+    request_key = get_request_key(request_url.removeprefix(TMDB_API_URL), params)
+
+    if raw_archive.replaying:
+        content = await asyncio.to_thread(raw_archive.load, request_key)
+        if content == None:
+            raise LookupError(f"{request_key} is not in the raw archive")
+        increment("archive_replays", labels={"endpoint": endpoint_name})
+        return json.loads(content)
+
+    async with scheduler.acquire("tmdb"):
+        with timed("tmdb_request_seconds", endpoint=endpoint_name):
+            if id == None:
+                response = await asyncio.to_thread(
+                    requests.get,
+                    url,
+                    headers=tmdb_headers,
+                    params=params
+                )
+            else:
+                response = await asyncio.to_thread(
+                    requests.get,
+                    f"{url}/{id}",
+                    headers=tmdb_headers,
+                    params=params
+                )
+        increment("api_calls", labels={"endpoint": endpoint_name, "status": response.status_code})
     
     try:
         response.raise_for_status()
     except requests.exceptions.HTTPError as e:
         raise e
 
-    await asyncio.sleep(2)
+    if raw_archive.recording:
+        await asyncio.to_thread(raw_archive.save, f"tmdb/{endpoint_name}", id, request_key, response.content)
+
+    await pace()
     return response.json()
 
 @task(
@@ -122,17 +201,30 @@ async def scrape_html_content(
     suffix: str=None
 ) -> BeautifulSoup:
     # logger = get_run_logger()
-
-    if suffix != None:
-        response = requests.get(
-            f"{url}/{id}/{suffix}",
-            headers=headers
-        )
-    else:
-        response = requests.get(
-            f"{url}/{id}",
-            headers=headers
-        )
+    request_key = f"{url}/{id}/{suffix}" if suffix != None else f"{url}/{id}"
+
+    if raw_archive.replaying:
+        content = await asyncio.to_thread(raw_archive.load, request_key)
+        if content == None:
+            raise LookupError(f"{request_key} is not in the raw archive")
+        increment("archive_replays", labels={"endpoint": source})
+        return BeautifulSoup(content, "html.parser")
+
+    async with scheduler.acquire(f"scrape:{urlparse(url).netloc}"):
+        with timed("scrape_request_seconds", source=source):
+            if suffix != None:
+                response = await asyncio.to_thread(
+                    requests.get,
+                    f"{url}/{id}/{suffix}",
+                    headers=headers
+                )
+            else:
+                response = await asyncio.to_thread(
+                    requests.get,
+                    f"{url}/{id}",
+                    headers=headers
+                )
+        increment("scrape_calls", labels={"source": source, "status": response.status_code})
 
     try:
         response.raise_for_status()
@@ -140,7 +232,10 @@ async def scrape_html_content(
         # logger.error(f"Error scraping data from {source}: {e}", exc_info=True)
         raise e
 
-    await asyncio.sleep(2)
+    if raw_archive.recording:
+        await asyncio.to_thread(raw_archive.save, f"scrape/{source}", id, request_key, response.content)
+
+    await pace()
     return BeautifulSoup(response.content, "html.parser")
 
 @task(
@@ -152,24 +247,9 @@ async def clean_movie_details(
     movie_id: int,
     movie_details: Dict
 ) -> Dict:
-    casts = [
-        {
-            "person_id": cast["id"],
-            "name": cast["name"],
-            "gender": map_gender(cast["gender"]),
-            "character": cast["character"] #if cast["character"] != "" else None
-        } for cast in movie_details["credits"]["cast"]
-    ]
-
-    crews = [
-        {
-            "person_id": crew["id"],
-            "name": crew["name"],
-            "gender": map_gender(crew["gender"]),
-            "job": crew["job"],
-            "department": crew["department"]
-        } for crew in movie_details["credits"]["crew"]
-    ]
+    casts = parse_casts(movie_details["credits"]["cast"])
+
+    crews = parse_crews(movie_details["credits"]["crew"])
 
     production_companies = [company["id"] for company in movie_details["production_companies"]]
 
@@ -181,7 +261,7 @@ async def clean_movie_details(
 
     watch_providers = movie_details["watch/providers"]
 
-    await asyncio.sleep(2)
+    await pace()
     return {
         "collection_id": movie_details["belongs_to_collection"]["id"] if movie_details["belongs_to_collection"] != None else None,
         "movie_id": movie_details["id"],
@@ -202,6 +282,20 @@ async def clean_movie_details(
         "watch_providers": watch_providers
     }
 
+@task(
+    name="Clean Movie Credits",
+    log_prints=True,
+    task_run_name="clean-movie-credits-of-{movie_id}"
+)
+async def clean_movie_credits(
+    movie_id: int,
+    movie_credits: Dict
+) -> Dict:
+    return {
+        "casts": parse_casts(movie_credits["cast"]),
+        "crews": parse_crews(movie_credits["crew"])
+    }
+
 @task(
     name="Clean Collection Details",
     log_prints=True,
@@ -211,7 +305,7 @@ async def clean_collection_details(
     collection_id: int,
     collection_details: Dict
 ) -> Dict:
-    await asyncio.sleep(2)
+    await pace()
     return {
         "collection_id": collection_details["id"],
         "name": collection_details["name"],
@@ -227,7 +321,7 @@ async def clean_company_details(
     company_id: int,
     company_details: Dict
 ) -> Dict:
-    await asyncio.sleep(2)
+    await pace()
     return {
         "company_id": company_details["id"],
         "parent_company_id": company_details["parent_company"]["id"] if company_details["parent_company"] != None else None,
@@ -246,7 +340,7 @@ async def clean_person_details(
     person_id: int,
     person_details: Dict
 ) -> Dict:
-    await asyncio.sleep(2)
+    await pace()
     return {
         "person_id": person_details["id"],
         "name": person_details["name"],
@@ -266,7 +360,7 @@ async def clean_person_details(
 async def clean_watch_providers(
     movie_id: int,
     watch_providers: Dict
-) -> List[Tuple]:
+) -> Dict:
     providers = defaultdict(lambda: {"buy": [], "rent": [], "subscription": []})
 
     for region, details in watch_providers["results"].items():
@@ -278,10 +372,13 @@ async def clean_watch_providers(
                         providers[provider_id]['subscription'].append(region)
                     else:
                         providers[provider_id][key].append(region)
-    for provider in providers.values():
-        provider = {key: value for key, value in provider.items() if value}
 
-    await asyncio.sleep(2)
+    providers = {
+        provider_id: {key: sorted(set(regions)) for key, regions in provider.items() if regions}
+        for provider_id, provider in providers.items()
+    }
+
+    await pace()
     return providers
 
 @task(
@@ -295,7 +392,7 @@ async def clean_genres(
 ) -> List[Tuple]:
     genres = [(movie_id, genre_id) for genre_id in movie_genres]
 
-    await asyncio.sleep(2)
+    await pace()
     return genres
 
 @task(
@@ -309,7 +406,7 @@ async def clean_languages(
 ) -> List[Tuple]:
     languages = [(movie_id, language_id) for language_id in movie_languages]
 
-    await asyncio.sleep(2)
+    await pace()
     return languages
 
 @task(
@@ -323,7 +420,7 @@ async def clean_production_countries(
 ) -> List[Tuple]:
     countries = [(movie_id, language_id) for language_id in production_countries]
 
-    await asyncio.sleep(2)
+    await pace()
     return countries
 
 @task(
@@ -339,7 +436,7 @@ async def clean_wikidata(
     metacritic_id = soup.find("div", id="P1712").find("a", class_="wb-external-id external").text
     rotten_tomatoes_id = soup.find("div", id="P1258").find("a", class_="wb-external-id external").text
 
-    await asyncio.sleep(2)
+    await pace()
     return {
         "imdb_id": imdb_id,
         "metacritic_id": metacritic_id,
@@ -372,7 +469,7 @@ async def clean_imdb_ratings(
     else:
         num_score = float(n_score)
 
-    await asyncio.sleep(2)
+    await pace()
     return {
         "imdb_id": imdb_id,
         "user_score": int(float(score)*10),
@@ -458,35 +555,44 @@ async def load_single_row_to_db(
     table_name: str,
     primary_key_id: int,
     data: Dict,
-    engine: Engine
+    engine: "Engine"
 ):
     logger = get_run_logger()
-    connection = engine.raw_connection()
     
     column_names = ", ".join(data.keys())
     column_values = ", ".join([f"%({key})s" for key in data.keys()])
+
+    def insert_row():
+        connection = engine.raw_connection()
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""INSERT INTO {table_name} (
+                        {column_names}
+                    ) VALUES (
+                        {column_values}
+                    )""",
+                    data
+                )
+            connection.commit()
+
+        finally:
+            connection.close()
+
     try:
-        with connection.cursor() as cursor:
-            cursor.execute(
-                f"""INSERT INTO {table_name} (
-                    {column_names}
-                ) VALUES (
-                    {column_values}
-                )""",
-                data
-            )
-        connection.commit()
+        async with scheduler.acquire("postgres"):
+            with timed("postgres_write_seconds", table=table_name):
+                await asyncio.to_thread(insert_row)
+        increment("rows_written", labels={"table": table_name})
     
     except Exception as e:
         if "duplicate key value violates unique constraint" in str(e):
             logger.warning(f"Row already exist!")
         else:
             raise e
-    
-    finally:
-        connection.close()
 
-    await asyncio.sleep(2)
+    await pace()
 
 @task(
     name="Load Multi Row to DB",
@@ -498,27 +604,35 @@ async def load_multi_row_to_db(
     table_name: str,
     columns: List,
     data: List,
-    engine: Engine
+    engine: "Engine"
 ):
     logger = get_run_logger()
-    connection = engine.raw_connection()
+
+    def insert_rows():
+        connection = engine.raw_connection()
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""INSERT INTO {table_name}
+                    ({", ".join(columns)})
+                    VALUES
+                    {str(data)[1:-1]}
+                    ON CONFLICT DO NOTHING"""
+                )
+            connection.commit()
+
+        finally:
+            connection.close()
     
     try:
-        with connection.cursor() as cursor:
-            cursor.execute(
-                f"""INSERT INTO {table_name}
-                ({", ".join(columns)})
-                VALUES
-                {str(data)[1:-1]}
-                ON CONFLICT DO NOTHING"""
-            )
-        connection.commit()
+        async with scheduler.acquire("postgres"):
+            with timed("postgres_write_seconds", table=table_name):
+                await asyncio.to_thread(insert_rows)
+        increment("rows_written", len(data), labels={"table": table_name})
 
     except Exception as e:
         logger.error(f"Error inserting row: {e}")
         raise e
-    
-    finally:
-        connection.close()
 
-    await asyncio.sleep(2)
\ No newline at end of file
+    await pace()
\ No newline at end of file
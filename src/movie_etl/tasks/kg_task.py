@@ -1,10 +1,16 @@
-from typing import List, Dict
+from typing import List, Dict, TYPE_CHECKING
 from prefect.cache_policies import NONE
 from prefect import task, get_run_logger
-from neo4j import Driver
 import asyncio
 
 from src.movie_etl.utils.etl import parse_property
+from src.movie_etl.utils.scheduler import scheduler
+from src.movie_etl.utils.metrics import increment, timed
+from src.movie_etl.utils.graph_stats import run_write
+from src.movie_etl.tasks.etl_task import pace
+
+if TYPE_CHECKING:
+    from neo4j import Driver
 
 @task(
     name="Load Single Entity to KG",
@@ -14,26 +20,41 @@ from src.movie_etl.utils.etl import parse_property
 async def load_entity_to_kg(
     node_label: str,
     node_property: Dict,
-    driver: Driver,
-    date_keys: List=[]
+    driver: "Driver",
+    date_keys: List=[],
+    primary_key: str=None
 ):
     logger = get_run_logger()
     node_property_str = parse_property(node_property, date_keys=date_keys)
 
-    try:
+    if primary_key != None:
+        query = f"""MERGE (n:{node_label} {{{primary_key}: ${primary_key}}})
+            SET n += {{{node_property_str}}}, n.updated_at = datetime()"""
+    else:
+        query = f"""CREATE (n:{node_label} {{{node_property_str}}})
+            SET n.updated_at = datetime()"""
+
+    def write_node():
         with driver.session() as session:
-            session.run(
-                f"""CREATE (n:{node_label} {{{node_property_str}}})""",
+            run_write(
+                session,
+                query,
                 parameters=node_property
             )
 
+    try:
+        async with scheduler.acquire("neo4j"):
+            with timed("neo4j_write_seconds", label=node_label):
+                await asyncio.to_thread(write_node)
+        increment("nodes_written", labels={"label": node_label})
+
     except Exception as e:
         if "already exists with label" in str(e):
             logger.warning(f"Node already exist!")
         else:
             raise e
 
-    await asyncio.sleep(2)
+    await pace()
 
 @task(
     name="Load Single Relationship to KG",
@@ -49,35 +70,164 @@ async def load_relationship_to_kg(
     driver,
     relationship_property: Dict={},
     head_map_key: Dict={},
-    tail_map_key: Dict={}
+    tail_map_key: Dict={},
+    append_keys: List=[]
 ):
     logger = get_run_logger()
-    
-    relationship_property_str = f"relationship_id: $relationship_id"
 
-    if relationship_property != {}:
-        relationship_property_str += ", " + parse_property(relationship_property)
-        
-    relationship_property["relationship_id"] = f"{next(iter(head_property_id.values()))}-{next(iter(tail_property_id.values()))}"
+    # MERGE on relationship_id, so a replay or a rerun rewrites the edge in place.
+    # List properties in append_keys are extended instead, keeping values already set.
+    replaced_property = {k: v for k, v in relationship_property.items() if k not in append_keys}
+    set_property_str = ""
+    if replaced_property != {}:
+        set_property_str = f"r += {{{parse_property(replaced_property)}}}, "
+    for k in append_keys:
+        if k in relationship_property:
+            set_property_str += f"r.{k} = coalesce(r.{k}, []) + [value IN ${k} WHERE NOT value IN coalesce(r.{k}, [])], "
+
+    relationship_id = f"{next(iter(head_property_id.values()))}-{next(iter(tail_property_id.values()))}"
 
     head_property_str = parse_property(head_property_id, map_keys=head_map_key)
     tail_property_str = parse_property(tail_property_id, map_keys=tail_map_key)
 
-    try:
+    def write_relationship():
         with driver.session() as session:
-            session.run(
+            run_write(
+                session,
                 f"""MATCH (h:{head_label} {{{head_property_str}}}), (t:{tail_label} {{{tail_property_str}}})
-                CREATE (h)-[r:{relationship_label} {{{relationship_property_str}}}]->(t)""",
-                parameters=head_property_id | tail_property_id | relationship_property
+                MERGE (h)-[r:{relationship_label} {{relationship_id: $relationship_id}}]->(t)
+                SET {set_property_str}h.updated_at = datetime()""",
+                parameters=head_property_id | tail_property_id | relationship_property | {"relationship_id": relationship_id}
             )
 
+    try:
+        async with scheduler.acquire("neo4j"):
+            with timed("neo4j_write_seconds", relationship=relationship_label):
+                await asyncio.to_thread(write_relationship)
+        increment("edges_written", labels={"relationship": relationship_label})
+
     except Exception as e:
         if "already exists with type" in str(e):
             logger.warning(f"Relationship already exist!")
         else:
             raise e
     
-    await asyncio.sleep(2)
+    await pace()
+
+@task(
+    name="Load Entity Batch to KG",
+    log_prints=True,
+    cache_policy=NONE,
+    task_run_name="load-{node_label}-batch-to-kg"
+)
+async def load_entity_batch_to_kg(
+    node_label: str,
+    primary_key: str,
+    node_properties: List[Dict],
+    driver: "Driver",
+    date_keys: List=[]
+):
+    if node_properties == []:
+        return
+
+    # updated_at drives the incremental graph export
+    set_property_str = ", ".join([
+        f"n.{k} = datetime(row.{k})" if k in date_keys else f"n.{k} = row.{k}"
+        for k in node_properties[0].keys() if k != primary_key
+    ] + ["n.updated_at = datetime()"])
+
+    def write_nodes():
+        with driver.session() as session:
+            run_write(
+                session,
+                f"""UNWIND $rows AS row
+                MERGE (n:{node_label} {{{primary_key}: row.{primary_key}}})
+                SET {set_property_str}""",
+                parameters={"rows": node_properties}
+            )
+
+    async with scheduler.acquire("neo4j"):
+        with timed("neo4j_write_seconds", label=node_label, batch=True):
+            await asyncio.to_thread(write_nodes)
+    increment("nodes_written", len(node_properties), labels={"label": node_label})
+
+@task(
+    name="Load Relationship Batch to KG",
+    log_prints=True,
+    cache_policy=NONE,
+    task_run_name="load-{relationship_label}-batch-to-kg"
+)
+async def load_relationship_batch_to_kg(
+    relationship_label: str,
+    head_label: str,
+    tail_label: str,
+    head_key: str,
+    tail_key: str,
+    relationships: List[Dict],
+    driver: "Driver"
+):
+    if relationships == []:
+        return
+
+    set_property_str = ", ".join([
+        f"r.{k} = row.{k}" for k in relationships[0].keys() if k not in ["head_id", "tail_id"]
+    ])
+    if set_property_str != "":
+        set_property_str = ", " + set_property_str
+
+    def write_relationships():
+        with driver.session() as session:
+            run_write(
+                session,
+                f"""UNWIND $rows AS row
+                MATCH (h:{head_label} {{{head_key}: row.head_id}}), (t:{tail_label} {{{tail_key}: row.tail_id}})
+                MERGE (h)-[r:{relationship_label}]->(t)
+                SET r.relationship_id = toString(row.head_id) + "-" + toString(row.tail_id){set_property_str}, h.updated_at = datetime()
+                RETURN count(r) AS matched""",
+                parameters={"rows": relationships},
+                rows=len(relationships)
+            )
+
+    async with scheduler.acquire("neo4j"):
+        with timed("neo4j_write_seconds", relationship=relationship_label, batch=True):
+            await asyncio.to_thread(write_relationships)
+    increment("edges_written", len(relationships), labels={"relationship": relationship_label})
+
+@task(
+    name="Delete Relationship Batch from KG",
+    log_prints=True,
+    cache_policy=NONE,
+    task_run_name="delete-{relationship_label}-batch-from-kg"
+)
+async def delete_relationship_batch_from_kg(
+    relationship_label: str,
+    head_label: str,
+    tail_label: str,
+    head_key: str,
+    tail_key: str,
+    relationships: List[Dict],
+    driver: "Driver"
+):
+    if relationships == []:
+        return
+
+    def delete_relationships():
+        with driver.session() as session:
+            run_write(
+                session,
+                f"""UNWIND $rows AS row
+                MATCH (h:{head_label} {{{head_key}: row.head_id}})-[r:{relationship_label}]->(t:{tail_label} {{{tail_key}: row.tail_id}})
+                SET h.updated_at = datetime()
+                DELETE r
+                RETURN count(*) AS matched""",
+                parameters={"rows": relationships},
+                rows=len(relationships)
+            )
+
+    async with scheduler.acquire("neo4j"):
+        with timed("neo4j_write_seconds", relationship=relationship_label, delete=True):
+            await asyncio.to_thread(delete_relationships)
+    increment("edges_deleted", len(relationships), labels={"relationship": relationship_label})
 
 @task(
     name="Load Bulk Entity to KG",
@@ -93,7 +243,8 @@ def load_entity_from_csv_to_kg(
 
     try:
         with driver.session() as session:
-            session.run(
+            run_write(
+                session,
                 f"""LOAD CSV WITH HEADERS FROM '{path}' AS row
                 MERGE (n:{node_label} {{{node_property}}})"""
             )
@@ -117,7 +268,8 @@ def load_relationship_from_csv_to_kg(
 
     try:
         with driver.session() as session:
-            session.run(
+            run_write(
+                session,
                 f"""LOAD CSV WITH HEADERS FROM 'file:///{path}' AS row
                 MATCH (h:{head_label}{{head_id: row.id}})
                 MATCH (t:{tail_label}{{tail_id: row.id}})
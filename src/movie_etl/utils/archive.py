@@ -0,0 +1,155 @@
+import gzip
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List
+from urllib.parse import urlencode
+
+ARCHIVE_MODES = {"off", "record", "replay"}
+
+def get_request_key(
+    url: str,
+    params: Dict=None
+) -> str:
+    # the TMDB key travels in a header, so the key never contains credentials
+    if not params:
+        return url
+
+    return f"{url}?{urlencode(sorted(params.items()))}"
+
+class RawArchive:
+    # Append-only raw zone. Each response is one gzip member appended to
+    # <root>/<source>/<endpoint>/<date>.gz, and a SQLite index maps request
+    # keys to (path, offset, length), so a replay reads one member per request.
+    # A crash between the two writes leaves an unindexed tail, which is ignored.
+    def __init__(self):
+        self.root_dir = None
+        self.mode = "off"
+        self.lock = threading.Lock()
+        self._connection = None
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def configure(
+        self,
+        root_dir: str=None,
+        mode: str="off"
+    ):
+        if mode not in ARCHIVE_MODES:
+            raise ValueError(f"Unknown archive mode {mode!r}, expected one of {sorted(ARCHIVE_MODES)}")
+        if mode != "off" and root_dir == None:
+            raise ValueError(f"Archive mode {mode!r} needs an archive directory")
+
+        self.close()
+        self.root_dir = root_dir
+        self.mode = mode
+
+        if mode != "off":
+            os.makedirs(root_dir, exist_ok=True)
+            self._connection = sqlite3.connect(os.path.join(root_dir, "index.sqlite"), check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    request_key TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    entity_id TEXT,
+                    fetched_at TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL
+                )"""
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_by_key ON responses (request_key, fetched_at)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_by_endpoint ON responses (endpoint, entity_id)")
+            self._connection.commit()
+
+    def get_partition_path(
+        self,
+        endpoint: str,
+        fetched_at: datetime
+    ) -> str:
+        parts = [re.sub(r"[^\w-]+", "_", part) for part in endpoint.split("/")]
+        return os.path.join(*parts, f"{fetched_at.strftime('%Y-%m-%d')}.gz")
+
+    def save(
+        self,
+        endpoint: str,
+        entity_id,
+        request_key: str,
+        content: bytes
+    ):
+        fetched_at = datetime.now(timezone.utc)
+        path = self.get_partition_path(endpoint, fetched_at)
+        member = gzip.compress(content)
+
+        with self.lock:
+            full_path = os.path.join(self.root_dir, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "ab") as fp:
+                offset = fp.tell()
+                fp.write(member)
+
+            self._connection.execute(
+                "INSERT INTO responses (request_key, endpoint, entity_id, fetched_at, path, offset, length) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (request_key, endpoint, str(entity_id) if entity_id != None else None, fetched_at.isoformat(), path, offset, len(member))
+            )
+            self._connection.commit()
+
+    def load(
+        self,
+        request_key: str
+    ) -> bytes:
+        with self.lock:
+            row = self._connection.execute(
+                "SELECT path, offset, length FROM responses WHERE request_key = ? ORDER BY fetched_at DESC, rowid DESC LIMIT 1",
+                (request_key,)
+            ).fetchone()
+
+        if row == None:
+            return None
+
+        path, offset, length = row
+        with open(os.path.join(self.root_dir, path), "rb") as fp:
+            fp.seek(offset)
+            return gzip.decompress(fp.read(length))
+
+    def contains(
+        self,
+        request_key: str
+    ) -> bool:
+        with self.lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM responses WHERE request_key = ? LIMIT 1",
+                (request_key,)
+            ).fetchone()
+
+        return row != None
+
+    def get_entity_ids(
+        self,
+        endpoint: str
+    ) -> List[str]:
+        with self.lock:
+            rows = self._connection.execute(
+                "SELECT DISTINCT entity_id FROM responses WHERE endpoint = ? AND entity_id IS NOT NULL ORDER BY entity_id",
+                (endpoint,)
+            ).fetchall()
+
+        return [row[0] for row in rows]
+
+    def close(self):
+        with self.lock:
+            if self._connection != None:
+                self._connection.close()
+                self._connection = None
+        self.mode = "off"
+
+raw_archive = RawArchive()
@@ -0,0 +1,166 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, TYPE_CHECKING
+
+from src.movie_etl.utils.etl import insert_rows
+from src.movie_etl.utils.connections import get_engine
+from src.movie_etl.utils.scheduler import scheduler
+from src.movie_etl.utils.metrics import increment, timed
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine.base import Engine
+
+class RowBuffer:
+    def __init__(
+        self,
+        engine: "Engine"=None,
+        max_rows: int=500,
+        max_seconds: float=30.0,
+        retries: int=2,
+        retry_delay_seconds: float=2
+    ):
+        self.engine = engine
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.retries = retries
+        self.retry_delay_seconds = retry_delay_seconds
+        self.dead_letters = []
+        self._rows = defaultdict(list)
+        self._pending = defaultdict(int)
+        self._failed_movie_ids = set()
+        self._on_written = {}
+        self._first_added_at = {}
+        self._flusher = None
+
+    def start(
+        self,
+        max_rows: int=None,
+        max_seconds: float=None
+    ):
+        if max_rows != None:
+            self.max_rows = max_rows
+        if max_seconds != None:
+            self.max_seconds = max_seconds
+
+        if self._flusher == None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def add(
+        self,
+        table_name: str,
+        row: Dict
+    ):
+        if table_name not in self._first_added_at:
+            self._first_added_at[table_name] = time.monotonic()
+        self._rows[table_name].append(row)
+        self._pending[row.get("movie_id")] += 1
+
+        if len(self._rows[table_name]) >= self.max_rows or self._is_expired(table_name):
+            await self.flush(table_name)
+
+    def when_written(
+        self,
+        movie_id: int,
+        callback: Callable
+    ):
+        # Calls back once every row queued for the movie so far is in Postgres,
+        # right away if none is pending. Never called if one of them was dead-lettered.
+        if movie_id in self._failed_movie_ids:
+            return
+        if self._pending[movie_id] == 0:
+            callback()
+        else:
+            self._on_written[movie_id] = callback
+
+    async def flush(
+        self,
+        table_name: str=None
+    ):
+        # Never raises: a batch that still fails after its retries is moved to
+        # dead_letters with its rows, so the error is reported against the movies
+        # the rows belong to instead of the one whose add() triggered the flush.
+        table_names = [table_name] if table_name != None else list(self._rows.keys())
+
+        for name in table_names:
+            rows = self._rows.pop(name, [])
+            self._first_added_at.pop(name, None)
+
+            batches = defaultdict(list)
+            for row in rows:
+                batches[tuple(row.keys())].append(row)
+
+            for columns, batch in batches.items():
+                try:
+                    await self._insert(name, list(columns), [tuple(row.values()) for row in batch])
+                except Exception as e:
+                    self.dead_letters.extend((name, row, e) for row in batch)
+                    increment("rows_dead_lettered", len(batch), labels={"table": name})
+                    self._settle(batch, written=False)
+                    continue
+
+                increment("rows_written", len(batch), labels={"table": name})
+                self._settle(batch, written=True)
+
+    def _settle(
+        self,
+        rows: List[Dict],
+        written: bool
+    ):
+        for row in rows:
+            movie_id = row.get("movie_id")
+            self._pending[movie_id] -= 1
+            if not written:
+                self._failed_movie_ids.add(movie_id)
+                self._on_written.pop(movie_id, None)
+            elif self._pending[movie_id] == 0 and movie_id in self._on_written:
+                self._on_written.pop(movie_id)()
+
+    async def _insert(
+        self,
+        table_name: str,
+        columns: List,
+        values: List
+    ):
+        for attempt in range(self.retries + 1):
+            try:
+                async with scheduler.acquire("postgres"):
+                    with timed("postgres_write_seconds", table=table_name):
+                        await asyncio.to_thread(insert_rows, table_name, columns, values, self.get_engine())
+                return
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self.retry_delay_seconds)
+
+    def get_engine(self) -> "Engine":
+        # the shared engine is only created once a row is actually flushed
+        return self.engine if self.engine != None else get_engine()
+
+    async def close(self) -> List:
+        if self._flusher != None:
+            self._flusher.cancel()
+            self._flusher = None
+
+        await self.flush()
+
+        # (table_name, row, error) of every row that could not be written this run
+        dead_letters, self.dead_letters = self.dead_letters, []
+        self._pending.clear()
+        self._failed_movie_ids.clear()
+        self._on_written.clear()
+        return dead_letters
+
+    def _is_expired(
+        self,
+        table_name: str
+    ) -> bool:
+        return time.monotonic() - self._first_added_at[table_name] >= self.max_seconds
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.max_seconds)
+
+            expired = [name for name in list(self._rows.keys()) if self._is_expired(name)]
+            for name in expired:
+                await self.flush(name)
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+class CollectionCache:
+    def __init__(self):
+        self.path = None
+        self.ttl = None
+        self.loaded_ids = set()
+        self._connection = None
+        self._locks = {}
+        self._loop = None
+
+    def configure(
+        self,
+        path: str=None,
+        ttl_days: int=30
+    ):
+        self.close()
+        self.path = path
+        self.ttl = timedelta(days=ttl_days) if ttl_days != None else None
+        self.loaded_ids = set()
+
+        if path != None:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS collections (
+                    collection_id INTEGER PRIMARY KEY,
+                    details TEXT NOT NULL,
+                    fetched_at TEXT NOT NULL
+                )"""
+            )
+            self._connection.commit()
+
+    def lock(
+        self,
+        collection_id: int
+    ) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._locks = {}
+
+        if collection_id not in self._locks:
+            self._locks[collection_id] = asyncio.Lock()
+
+        return self._locks[collection_id]
+
+    def is_loaded(
+        self,
+        collection_id: int
+    ) -> bool:
+        return collection_id in self.loaded_ids
+
+    def mark_loaded(
+        self,
+        collection_id: int
+    ):
+        self.loaded_ids.add(collection_id)
+
+    def get_details(
+        self,
+        collection_id: int
+    ) -> Dict:
+        if self._connection == None:
+            return None
+
+        row = self._connection.execute(
+            "SELECT details, fetched_at FROM collections WHERE collection_id = ?",
+            (collection_id,)
+        ).fetchone()
+
+        if row == None:
+            return None
+
+        if self.ttl != None and datetime.fromisoformat(row[1]) < datetime.now(timezone.utc) - self.ttl:
+            return None
+
+        return json.loads(row[0])
+
+    def save_details(
+        self,
+        collection_id: int,
+        details: Dict
+    ):
+        if self._connection == None:
+            return
+
+        self._connection.execute(
+            "INSERT OR REPLACE INTO collections (collection_id, details, fetched_at) VALUES (?, ?, ?)",
+            (collection_id, json.dumps(details), datetime.now(timezone.utc).isoformat())
+        )
+        self._connection.commit()
+
+    def close(self):
+        if self._connection != None:
+            self._connection.close()
+            self._connection = None
+
+collection_cache = CollectionCache()
@@ -0,0 +1,198 @@
+import json
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Callable, List, Dict
+
+MOVIE_STAGES = ["fetched", "cleaned", "nodes", "edges", "ratings"]
+
+current_checkpoint = ContextVar("current_checkpoint", default=None)
+
+class CheckpointStore:
+    def __init__(
+        self,
+        path: str
+    ):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            """CREATE TABLE IF NOT EXISTS runs (
+                run_key TEXT PRIMARY KEY,
+                parameters TEXT NOT NULL,
+                movie_ids TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS stages (
+                run_key TEXT NOT NULL,
+                movie_id INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                completed_at TEXT NOT NULL,
+                PRIMARY KEY (run_key, movie_id, stage)
+            );
+            CREATE TABLE IF NOT EXISTS payloads (
+                run_key TEXT NOT NULL,
+                movie_id INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                PRIMARY KEY (run_key, movie_id, stage)
+            );"""
+        )
+        self._connection.commit()
+
+    def get_run(
+        self,
+        run_key: str
+    ) -> Dict:
+        row = self._connection.execute(
+            "SELECT parameters, movie_ids FROM runs WHERE run_key = ?",
+            (run_key,)
+        ).fetchone()
+
+        if row == None:
+            return None
+
+        return {
+            "parameters": json.loads(row[0]),
+            "movie_ids": json.loads(row[1])
+        }
+
+    def save_run(
+        self,
+        run_key: str,
+        parameters: Dict,
+        movie_ids: List
+    ):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO runs (run_key, parameters, movie_ids, created_at) VALUES (?, ?, ?, ?)",
+            (run_key, json.dumps(parameters, default=str), json.dumps(movie_ids), datetime.now(timezone.utc).isoformat())
+        )
+        self._connection.commit()
+
+    def get_completed_stages(
+        self,
+        run_key: str,
+        movie_id: int
+    ) -> set:
+        rows = self._connection.execute(
+            "SELECT stage FROM stages WHERE run_key = ? AND movie_id = ?",
+            (run_key, movie_id)
+        ).fetchall()
+
+        return {row[0] for row in rows}
+
+    def mark_stage(
+        self,
+        run_key: str,
+        movie_id: int,
+        stage: str,
+        payload: Dict=None
+    ):
+        if payload != None:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO payloads (run_key, movie_id, stage, payload) VALUES (?, ?, ?, ?)",
+                (run_key, movie_id, stage, json.dumps(payload))
+            )
+        self._connection.execute(
+            "INSERT OR REPLACE INTO stages (run_key, movie_id, stage, completed_at) VALUES (?, ?, ?, ?)",
+            (run_key, movie_id, stage, datetime.now(timezone.utc).isoformat())
+        )
+        self._connection.commit()
+
+    def get_payload(
+        self,
+        run_key: str,
+        movie_id: int,
+        stage: str
+    ) -> Dict:
+        row = self._connection.execute(
+            "SELECT payload FROM payloads WHERE run_key = ? AND movie_id = ? AND stage = ?",
+            (run_key, movie_id, stage)
+        ).fetchone()
+
+        return json.loads(row[0]) if row != None else None
+
+    def drop_payload(
+        self,
+        run_key: str,
+        movie_id: int,
+        stage: str
+    ):
+        self._connection.execute(
+            "DELETE FROM payloads WHERE run_key = ? AND movie_id = ? AND stage = ?",
+            (run_key, movie_id, stage)
+        )
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+@contextmanager
+def use_checkpoint(
+    store: CheckpointStore,
+    run_key: str
+):
+    token = current_checkpoint.set((store, run_key) if store != None else None)
+
+    try:
+        yield store
+
+    finally:
+        current_checkpoint.reset(token)
+
+def get_completed_stages(
+    movie_id: int
+) -> set:
+    checkpoint = current_checkpoint.get()
+    if checkpoint == None:
+        return set()
+
+    store, run_key = checkpoint
+    return store.get_completed_stages(run_key, movie_id)
+
+def mark_stage(
+    movie_id: int,
+    stage: str,
+    payload: Dict=None
+):
+    checkpoint = current_checkpoint.get()
+    if checkpoint == None:
+        return
+
+    store, run_key = checkpoint
+    store.mark_stage(run_key, movie_id, stage, payload)
+
+def bind_mark_stage(
+    movie_id: int,
+    stage: str
+) -> Callable:
+    # for stages that complete later, outside the context of the movie's run
+    checkpoint = current_checkpoint.get()
+    if checkpoint == None:
+        return lambda: None
+
+    store, run_key = checkpoint
+    return lambda: store.mark_stage(run_key, movie_id, stage)
+
+def get_stage_payload(
+    movie_id: int,
+    stage: str
+) -> Dict:
+    checkpoint = current_checkpoint.get()
+    if checkpoint == None:
+        return None
+
+    store, run_key = checkpoint
+    return store.get_payload(run_key, movie_id, stage)
+
+def drop_stage_payload(
+    movie_id: int,
+    stage: str
+):
+    checkpoint = current_checkpoint.get()
+    if checkpoint == None:
+        return
+
+    store, run_key = checkpoint
+    store.drop_payload(run_key, movie_id, stage)
@@ -0,0 +1,88 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class LazyResource:
+    # Builds its resource on first use instead of at import, so a worker that
+    # imports the flows pays for drivers and pools only when a run needs them.
+    def __init__(
+        self,
+        factory: Callable,
+        closer: Callable=None
+    ):
+        self.factory = factory
+        self.closer = closer
+        self.lock = threading.Lock()
+        self.instance = None
+
+    @property
+    def created(self) -> bool:
+        return self.instance is not None
+
+    def get(self):
+        if self.instance is None:
+            with self.lock:
+                if self.instance is None:
+                    self.instance = self.factory()
+
+        return self.instance
+
+    @contextmanager
+    def override(
+        self,
+        instance
+    ):
+        with self.lock:
+            previous, self.instance = self.instance, instance
+        try:
+            yield instance
+        finally:
+            with self.lock:
+                self.instance = previous
+
+    def close(self):
+        with self.lock:
+            instance, self.instance = self.instance, None
+
+        if instance is not None and self.closer != None:
+            self.closer(instance)
+
+def create_postgres_engine():
+    from sqlalchemy import create_engine, URL
+
+    url_object = URL.create(
+        "postgresql+psycopg2",
+        username=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST"),
+        database=os.getenv("POSTGRES_DB"),
+        port=os.getenv("POSTGRES_PORT")
+    )
+
+    return create_engine(url_object)
+
+def create_neo4j_driver():
+    from neo4j import GraphDatabase
+
+    return GraphDatabase.driver(
+        uri=f"bolt://{os.getenv('NEO4J_HOST')}:{os.getenv('NEO4J_PORT')}",
+        auth=(os.getenv("NEO4J_USER"), os.getenv("NEO4J_PASSWORD"))
+    )
+
+postgres_engine = LazyResource(create_postgres_engine, lambda engine: engine.dispose())
+neo4j_driver = LazyResource(create_neo4j_driver, lambda driver: driver.close())
+
+def get_engine():
+    return postgres_engine.get()
+
+def get_driver():
+    return neo4j_driver.get()
+
+def close_connections():
+    postgres_engine.close()
+    neo4j_driver.close()
@@ -1,11 +1,13 @@
-from sqlalchemy.engine.base import Engine
 import re
 from bs4 import BeautifulSoup
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from prefect.runtime import flow_run
-import pandas as pd
-from neo4j import Driver
-from typing import List, Dict
+from typing import List, Dict, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine.base import Engine
+    from neo4j import Driver
+    import pandas as pd
 
 gender_dict = {
     0: "Not specified",
@@ -28,6 +30,8 @@ departement_dict = {
     "Visual Effects": "VISUAL_EFFECTS_BY"
 }
 
+WATCH_TYPES = ["buy", "rent", "subscription"]
+
 def map_gender(
     gender_id: int
 ) -> str:
@@ -38,11 +42,94 @@ def map_departement(
 ) -> str:
     return departement_dict[departement]
 
+def parse_casts(
+    casts: List[Dict]
+) -> List[Dict]:
+    return [
+        {
+            "person_id": cast["id"],
+            "name": cast["name"],
+            "gender": map_gender(cast["gender"]),
+            "character": cast["character"], #if cast["character"] != "" else None
+            "order": cast["order"]
+        } for cast in casts
+    ]
+
+def parse_crews(
+    crews: List[Dict]
+) -> List[Dict]:
+    return [
+        {
+            "person_id": crew["id"],
+            "name": crew["name"],
+            "gender": map_gender(crew["gender"]),
+            "job": crew["job"],
+            "department": crew["department"]
+        } for crew in crews
+    ]
+
+def split_credits(
+    casts: List[Dict],
+    crews: List[Dict],
+    cast_limit: int=None,
+    crew_departments: List=None
+) -> Tuple[Dict, Dict]:
+    crew_departments = crew_departments if crew_departments != None else list(departement_dict.keys())
+
+    is_cast_kept = lambda cast: cast_limit == None or cast["order"] < cast_limit
+    is_crew_kept = lambda crew: crew["department"] in crew_departments and crew["department"] in departement_dict
+
+    kept_credits = {
+        "casts": [cast for cast in casts if is_cast_kept(cast)],
+        "crews": [crew for crew in crews if is_crew_kept(crew)]
+    }
+    deferred_credits = {
+        "casts": [cast for cast in casts if not is_cast_kept(cast)],
+        "crews": [crew for crew in crews if not is_crew_kept(crew) and crew["department"] in departement_dict]
+    }
+
+    return kept_credits, deferred_credits
+
+def aggregate_casts(
+    casts: List[Dict]
+) -> List[Dict]:
+    aggregated_casts = {}
+
+    for cast in casts:
+        if cast["person_id"] not in aggregated_casts:
+            aggregated_casts[cast["person_id"]] = {
+                k: v for k, v in cast.items() if k != "character"
+            } | {"characters": []}
+
+        characters = aggregated_casts[cast["person_id"]]["characters"]
+        if cast["character"] != "" and cast["character"] not in characters:
+            characters.append(cast["character"])
+
+    return list(aggregated_casts.values())
+
+def aggregate_crews(
+    crews: List[Dict]
+) -> List[Dict]:
+    aggregated_crews = {}
+
+    for crew in crews:
+        key = (crew["person_id"], crew["department"])
+        if key not in aggregated_crews:
+            aggregated_crews[key] = {
+                k: v for k, v in crew.items() if k != "job"
+            } | {"jobs": []}
+
+        jobs = aggregated_crews[key]["jobs"]
+        if crew["job"] != "" and crew["job"] not in jobs:
+            jobs.append(crew["job"])
+
+    return list(aggregated_crews.values())
+
 def is_primary_key_exist_in_table(
     primary_key,
     primary_key_name: str,
     table_name: str,
-    engine: Engine
+    engine: "Engine"
 ):
     connection = engine.raw_connection()
     if type(primary_key) == str:
@@ -56,6 +143,25 @@ def is_primary_key_exist_in_table(
             return True
         else:
             return False
+
+def get_existing_primary_keys(
+    primary_keys: List,
+    primary_key_name: str,
+    table_name: str,
+    engine: "Engine"
+) -> set:
+    connection = engine.raw_connection()
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {primary_key_name} FROM {table_name} WHERE {primary_key_name} = ANY(%(primary_keys)s)",
+                {"primary_keys": list(primary_keys)}
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    finally:
+        connection.close()
         
 def extract_metacritic_data(
     reviews_soup: BeautifulSoup
@@ -84,9 +190,33 @@ def extract_metacritic_data(
         "percent_negative": percent_negative
     }
 
+def insert_rows(
+    table_name: str,
+    columns: List,
+    rows: List[Tuple],
+    engine: "Engine"
+):
+    from psycopg2.extras import execute_values
+
+    connection = engine.raw_connection()
+
+    try:
+        with connection.cursor() as cursor:
+            execute_values(
+                cursor,
+                f"""INSERT INTO {table_name} ({", ".join(columns)})
+                VALUES %s
+                ON CONFLICT DO NOTHING""",
+                rows
+            )
+        connection.commit()
+
+    finally:
+        connection.close()
+
 def rollback_movie(
     movie_id: int,
-    engine: Engine
+    engine: "Engine"
 ):
     tables = [
         "movie_production",
@@ -126,6 +256,24 @@ def get_previous_week(
 
     return previous_date
 
+def split_date_range(
+    start_date: date,
+    end_date: date,
+    window_days: int
+) -> List[Tuple[str, str]]:
+    if window_days < 1:
+        raise ValueError(f"window_days must be at least 1, got {window_days}")
+
+    windows = []
+    window_start = start_date
+
+    while window_start <= end_date:
+        window_end = min(window_start + timedelta(days=window_days - 1), end_date)
+        windows.append((window_start.strftime("%Y-%m-%d"), window_end.strftime("%Y-%m-%d")))
+        window_start = window_end + timedelta(days=1)
+
+    return windows
+
 def generate_flow_run_name():
     parameters = flow_run.parameters
     start_date = parameters["start_date"]
@@ -139,7 +287,7 @@ def generate_flow_run_name():
 
 def load_to_csv(
     path: str,
-    df: pd.DataFrame,
+    df: "pd.DataFrame",
     property_columns: List
 ):
     df[property_columns].to_csv(path, index=False)
@@ -170,7 +318,7 @@ def is_node_exist(
     node_label:str,
     property_id_name: str,
     property_id: int,
-    driver: Driver
+    driver: "Driver"
 ):
     with driver.session() as session:
         result = session.run(f"MATCH (n: {node_label} {{{property_id_name}: {property_id}}}) RETURN n").single()
@@ -178,4 +326,86 @@ def is_node_exist(
         if result == None:
             return False
 
-    return True
\ No newline at end of file
+    return True
+
+def get_unenriched_person_ids(
+    movie_ids: List,
+    driver: "Driver",
+    enriched_after: datetime=None
+) -> List:
+    with driver.session() as session:
+        result = session.run(
+            """MATCH (m:Movie)--(p:Person) WHERE m.movie_id IN $movie_ids
+            AND (p.enriched_at IS NULL OR ($enriched_after IS NOT NULL AND p.enriched_at < datetime($enriched_after)))
+            RETURN DISTINCT p.person_id AS person_id""",
+            parameters={
+                "movie_ids": list(movie_ids),
+                "enriched_after": enriched_after.isoformat() if enriched_after != None else None
+            }
+        )
+
+        return [record["person_id"] for record in result]
+
+def get_existing_node_ids(
+    node_label: str,
+    property_id_name: str,
+    property_ids: List,
+    driver: "Driver",
+    loaded_after: datetime=None,
+    timestamp_key: str="loaded_at"
+) -> set:
+    # a node without the timestamp was created by a run that failed before stamping it
+    with driver.session() as session:
+        result = session.run(
+            f"""MATCH (n:{node_label}) WHERE n.{property_id_name} IN $property_ids
+            AND n.{timestamp_key} IS NOT NULL
+            AND ($loaded_after IS NULL OR n.{timestamp_key} >= datetime($loaded_after))
+            RETURN n.{property_id_name} AS property_id""",
+            parameters={
+                "property_ids": list(property_ids),
+                "loaded_after": loaded_after.isoformat() if loaded_after != None else None
+            }
+        )
+
+        return {record["property_id"] for record in result}
+
+def get_provider_edges(
+    movie_ids: List,
+    driver: "Driver"
+) -> Dict:
+    with driver.session() as session:
+        result = session.run(
+            """MATCH (m:Movie)-[r:AVAILABLE_ON]->(p:WatchProvider) WHERE m.movie_id IN $movie_ids
+            RETURN m.movie_id AS movie_id, p.provider_id AS provider_id, r.buy AS buy, r.rent AS rent, r.subscription AS subscription""",
+            parameters={"movie_ids": list(movie_ids)}
+        )
+
+        provider_edges = {movie_id: {} for movie_id in movie_ids}
+        for record in result:
+            provider_edges[record["movie_id"]][record["provider_id"]] = {
+                watch_type: sorted(record[watch_type]) for watch_type in WATCH_TYPES if record[watch_type]
+            }
+
+        return provider_edges
+
+def diff_provider_edges(
+    stored_edges: Dict,
+    fresh_edges: Dict
+) -> Tuple[List[Dict], List[Dict]]:
+    # both map movie_id -> {provider_id: {watch_type: [regions]}}
+    upserts = []
+    removals = []
+
+    for movie_id, fresh_providers in fresh_edges.items():
+        stored_providers = stored_edges.get(movie_id, {})
+
+        for provider_id, regions in fresh_providers.items():
+            if stored_providers.get(provider_id) != regions:
+                upserts.append(
+                    {"head_id": movie_id, "tail_id": provider_id} | {watch_type: regions.get(watch_type) for watch_type in WATCH_TYPES}
+                )
+
+        for provider_id in stored_providers.keys() - fresh_providers.keys():
+            removals.append({"head_id": movie_id, "tail_id": provider_id})
+
+    return upserts, removals
@@ -0,0 +1,137 @@
+import asyncio
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Tuple
+from prefect import get_run_logger
+
+from src.movie_etl.utils.metrics import observe
+
+lightweight_mode = ContextVar("lightweight_mode", default=False)
+step_timings = ContextVar("step_timings", default=None)
+
+def get_retry_delay(step) -> float:
+    retry_delay_seconds = getattr(step, "retry_delay_seconds", None)
+
+    if isinstance(retry_delay_seconds, (int, float)):
+        return retry_delay_seconds
+    if isinstance(retry_delay_seconds, list) and retry_delay_seconds != []:
+        return retry_delay_seconds[0]
+
+    return 0
+
+async def run_step(step, *args, **kwargs):
+    start = time.perf_counter()
+
+    try:
+        if not lightweight_mode.get():
+            return await step(*args, **kwargs)
+
+        retries = getattr(step, "retries", None) or 0
+        for attempt in range(retries + 1):
+            try:
+                return await step.fn(*args, **kwargs)
+            except Exception:
+                if attempt == retries:
+                    raise
+                await asyncio.sleep(get_retry_delay(step))
+
+    finally:
+        duration = time.perf_counter() - start
+        observe("step_seconds", duration, {"step": step.name})
+
+        timings = step_timings.get()
+        if timings != None:
+            timings[step.name].append(duration)
+
+@contextmanager
+def lightweight_steps(run_name: str):
+    logger = get_run_logger()
+    timings = defaultdict(list)
+
+    mode_token = lightweight_mode.set(True)
+    timings_token = step_timings.set(timings)
+
+    try:
+        yield timings
+
+    finally:
+        lightweight_mode.reset(mode_token)
+        step_timings.reset(timings_token)
+
+        for name, durations in sorted(timings.items(), key=lambda item: -sum(item[1])):
+            logger.info(
+                f"{run_name} | {name}: {len(durations)} calls, "
+                f"{sum(durations):.2f}s total, {max(durations):.2f}s max"
+            )
+
+async def run_pipeline(
+    items,
+    stages: List[Tuple],
+    queue_size: int=10
+) -> List[Tuple]:
+    # Each stage is (name, coroutine function, worker count). Stages are linked by
+    # bounded queues, so a slow stage blocks its producers instead of buffering
+    # every item in memory.
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+    failures = []
+    done = object()
+
+    async def feed():
+        for item in items:
+            await queues[0].put(item)
+
+    async def work(stage_index: int):
+        name, stage, _ = stages[stage_index]
+        is_last = stage_index == len(stages) - 1
+
+        while True:
+            item = await queues[stage_index].get()
+            if item is done:
+                return
+
+            try:
+                result = await stage(item)
+            except Exception as e:
+                failures.append((item, name, e))
+                continue
+
+            if not is_last:
+                await queues[stage_index + 1].put(result)
+
+    async def run_stage(stage_index: int, upstream):
+        workers = [asyncio.create_task(work(stage_index)) for _ in range(stages[stage_index][2])]
+
+        await upstream
+        for _ in workers:
+            await queues[stage_index].put(done)
+        await asyncio.gather(*workers)
+
+    upstream = asyncio.create_task(feed())
+    for stage_index in range(len(stages)):
+        upstream = asyncio.create_task(run_stage(stage_index, upstream))
+    await upstream
+
+    return failures
+
+async def run_worker_pool(
+    items,
+    worker,
+    concurrency: int
+) -> List[Tuple]:
+    # Workers pull from a shared iterator, so only `concurrency` items are ever
+    # in flight and nothing is kept once an item has been processed.
+    iterator = iter(items)
+    failures = []
+
+    async def work():
+        for item in iterator:
+            try:
+                await worker(item)
+            except Exception as e:
+                failures.append((item, e))
+
+    await asyncio.gather(*[work() for _ in range(concurrency)])
+
+    return failures
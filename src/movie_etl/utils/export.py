@@ -0,0 +1,287 @@
+import json
+import os
+import pathlib
+import re
+from collections import defaultdict
+from typing import Dict, List, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from neo4j import Driver
+
+CONSTRAINTS_SCRIPT = pathlib.Path(__file__).resolve().parents[3] / "kg_scripts" / "1_constraints.cypher"
+
+NODE_CONSTRAINT_PATTERN = re.compile(r"FOR \(n: ?(\w+)\) REQUIRE n\.(\w+) IS UNIQUE")
+RELATIONSHIP_CONSTRAINT_PATTERN = re.compile(r"FOR \(\)-\[r: ?(\w+)\]-\(\) REQUIRE")
+
+def load_graph_schema(path: pathlib.Path=CONSTRAINTS_SCRIPT) -> Dict:
+    with open(path, "r") as fp:
+        script = fp.read()
+
+    return {
+        "node_keys": dict(NODE_CONSTRAINT_PATTERN.findall(script)),
+        "relationship_types": sorted(set(RELATIONSHIP_CONSTRAINT_PATTERN.findall(script)))
+    }
+
+def to_native(value):
+    # neo4j temporal values, which pyarrow can't convert on its own
+    if hasattr(value, "to_native"):
+        return value.to_native()
+    if isinstance(value, list):
+        return [to_native(item) for item in value]
+
+    return value
+
+def get_database_time(driver: "Driver") -> str:
+    # the watermark comes from the server clock, the one updated_at is stamped with
+    with driver.session() as session:
+        return session.run("RETURN toString(datetime()) AS now").single()["now"]
+
+def shift_database_time(
+    driver: "Driver",
+    time: str,
+    seconds: int
+) -> str:
+    with driver.session() as session:
+        return session.run(
+            "RETURN toString(datetime($time) + duration({seconds: $seconds})) AS shifted",
+            parameters={"time": time, "seconds": seconds}
+        ).single()["shifted"]
+
+class PartWriter:
+    # Buffers rows per partition (a label or a relationship type) and writes
+    # every full buffer as its own Parquet file, so each part has a schema
+    # inferred from its own rows and memory stays bounded on a full export.
+    def __init__(
+        self,
+        root_dir: str,
+        kind: str,
+        export_id: str,
+        part_rows: int=100000
+    ):
+        self.root_dir = root_dir
+        self.kind = kind
+        self.export_id = export_id
+        self.part_rows = part_rows
+        self.buffers = defaultdict(list)
+        self.files = defaultdict(list)
+        self.rows = defaultdict(int)
+
+    def add(
+        self,
+        partition: str,
+        row: Dict
+    ):
+        self.buffers[partition].append(row)
+        if len(self.buffers[partition]) >= self.part_rows:
+            self.flush(partition)
+
+    def flush(
+        self,
+        partition: str=None
+    ):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        for name in [partition] if partition != None else list(self.buffers.keys()):
+            rows = self.buffers.pop(name, [])
+            if rows == []:
+                continue
+
+            path = os.path.join(self.kind, name, f"{self.export_id}-{len(self.files[name]):05d}.parquet")
+            os.makedirs(os.path.join(self.root_dir, self.kind, name), exist_ok=True)
+            # from_pylist takes its columns from the first row only, and properties are
+            # sparse (None values are never set), so columns are the union of all keys
+            columns = list(dict.fromkeys(key for row in rows for key in row))
+            table = pa.Table.from_pydict({column: [row.get(column) for row in rows] for column in columns})
+            pq.write_table(table, os.path.join(self.root_dir, path), compression="zstd")
+
+            self.files[name].append(path)
+            self.rows[name] += len(rows)
+
+    def get_summary(self) -> Dict:
+        return {name: {"rows": self.rows[name], "files": self.files[name]} for name in self.files}
+
+def export_nodes(
+    node_label: str,
+    primary_key: str,
+    since: str,
+    writer: PartWriter,
+    driver: "Driver"
+):
+    with driver.session(default_access_mode="READ") as session:
+        result = session.run(
+            f"""MATCH (n:{node_label})
+            WHERE $since IS NULL OR n.updated_at >= datetime($since)
+            RETURN properties(n) AS properties""",
+            since=since
+        )
+        for record in result:
+            properties = {key: to_native(value) for key, value in record["properties"].items()}
+            # the primary key leads, so a part can be read for its ids alone
+            writer.add(node_label, {primary_key: properties.pop(primary_key, None)} | properties)
+
+def export_relationships(
+    head_label: str,
+    node_keys: Dict,
+    relationship_types: List,
+    since: str,
+    writer: PartWriter,
+    driver: "Driver"
+) -> int:
+    # Every outgoing relationship of a changed head is exported, not only the
+    # changed ones. Writers stamp the head whenever one of its relationships is
+    # created or deleted, so replacing a head's edges with the latest export
+    # that contains the head reproduces the graph.
+    skipped = 0
+
+    with driver.session(default_access_mode="READ") as session:
+        result = session.run(
+            f"""MATCH (h:{head_label})
+            WHERE $since IS NULL OR h.updated_at >= datetime($since)
+            MATCH (h)-[r]->(t)
+            RETURN h[$head_key] AS head_id, type(r) AS type, labels(t)[0] AS tail_label,
+                [key IN $keys WHERE t[key] IS NOT NULL | t[key]][0] AS tail_id, properties(r) AS properties""",
+            since=since,
+            head_key=node_keys[head_label],
+            keys=list(node_keys.values())
+        )
+        for record in result:
+            if record["type"] not in relationship_types:
+                skipped += 1
+                continue
+
+            properties = {key: to_native(value) for key, value in record["properties"].items()}
+            writer.add(record["type"], {
+                "head_label": head_label,
+                "head_id": record["head_id"],
+                "tail_label": record["tail_label"],
+                "tail_id": record["tail_id"]
+            } | properties)
+
+    return skipped
+
+def load_manifest(export_dir: str) -> Dict:
+    path = os.path.join(export_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {"exports": []}
+
+    with open(path, "r") as fp:
+        return json.load(fp)
+
+def save_manifest(
+    export_dir: str,
+    manifest: Dict
+):
+    # written last and atomically: an interrupted export leaves unreferenced
+    # parts behind but never moves the watermark
+    path = os.path.join(export_dir, "manifest.json")
+    with open(f"{path}.tmp", "w") as fp:
+        json.dump(manifest, fp, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def resolve_edges(
+    exports: List[Dict]
+) -> Tuple[set, Dict]:
+    # exports are (changed heads, edges) in export order; returns every node
+    # seen and the current outgoing edges of each head
+    nodes = set()
+    edges = {}
+
+    for export in exports:
+        # a head updated between the node and edge queries only shows up in the
+        # edges, and still has to replace what the earlier exports held
+        heads = set(export["heads"]) | {head for head, _, _ in export["edges"]}
+        nodes.update(export["heads"])
+        for head in heads:
+            edges.pop(head, None)
+
+        for head, relationship_type, tail in export["edges"]:
+            nodes.update([head, tail])
+            edges.setdefault(head, []).append((relationship_type, tail))
+
+    return nodes, edges
+
+def read_export(
+    export_dir: str,
+    export: Dict,
+    node_keys: Dict
+) -> Dict:
+    import pyarrow.parquet as pq
+
+    heads = set()
+    for node_label, summary in export["nodes"].items():
+        for path in summary["files"]:
+            ids = pq.read_table(os.path.join(export_dir, path), columns=[node_keys[node_label]]).column(0).to_pylist()
+            heads.update((node_label, node_id) for node_id in ids)
+
+    edges = []
+    for relationship_type, summary in export["edges"].items():
+        for path in summary["files"]:
+            table = pq.read_table(os.path.join(export_dir, path), columns=["head_label", "head_id", "tail_label", "tail_id"])
+            for row in table.to_pylist():
+                edges.append(((row["head_label"], row["head_id"]), relationship_type, (row["tail_label"], row["tail_id"])))
+
+    return {"heads": heads, "edges": edges}
+
+def build_csr(
+    nodes: set,
+    edges: Dict,
+    relationship_types: List
+) -> Dict:
+    import numpy as np
+
+    node_list = sorted(nodes, key=lambda node: (node[0], str(node[1])))
+    node_index = {node: index for index, node in enumerate(node_list)}
+    type_index = {relationship_type: index for index, relationship_type in enumerate(relationship_types)}
+
+    index_dtype = np.int32 if len(node_list) < 2 ** 31 else np.int64
+    heads, tails, types = [], [], []
+    for head, head_edges in edges.items():
+        for relationship_type, tail in head_edges:
+            heads.append(node_index[head])
+            tails.append(node_index[tail])
+            types.append(type_index[relationship_type])
+
+    heads = np.asarray(heads, dtype=index_dtype)
+    tails = np.asarray(tails, dtype=index_dtype)
+    types = np.asarray(types, dtype=np.int16)
+
+    order = np.lexsort((tails, heads))
+    indptr = np.zeros(len(node_list) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(heads, minlength=len(node_list)), out=indptr[1:])
+
+    return {
+        "nodes": node_list,
+        "indptr": indptr,
+        "indices": tails[order],
+        "edge_types": types[order]
+    }
+
+def write_csr(
+    export_dir: str,
+    csr: Dict,
+    relationship_types: List
+) -> str:
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    csr_dir = os.path.join(export_dir, "csr")
+    os.makedirs(csr_dir, exist_ok=True)
+
+    # plain .npy files, so consumers can np.load(..., mmap_mode="r") them
+    for name in ["indptr", "indices", "edge_types"]:
+        np.save(os.path.join(csr_dir, f"{name}.npy"), csr[name])
+
+    pq.write_table(
+        pa.table({
+            "index": list(range(len(csr["nodes"]))),
+            "label": [node_label for node_label, _ in csr["nodes"]],
+            "id": [str(node_id) for _, node_id in csr["nodes"]]
+        }),
+        os.path.join(csr_dir, "nodes.parquet")
+    )
+    with open(os.path.join(csr_dir, "edge_types.json"), "w") as fp:
+        json.dump(relationship_types, fp)
+
+    return csr_dir
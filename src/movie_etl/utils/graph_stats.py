@@ -0,0 +1,169 @@
+import heapq
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict
+
+SUMMARY_COUNTERS = [
+    "nodes_created",
+    "nodes_deleted",
+    "relationships_created",
+    "relationships_deleted",
+    "properties_set"
+]
+
+def get_query_template(query: str) -> str:
+    # inlined ids (as in is_node_exist) would otherwise give every statement its own template
+    query = re.sub(r"\s+", " ", query).strip()
+    return re.sub(r"(?<![\w$.])-?\d+(\.\d+)?\b", "?", query)
+
+def summarize_parameters(
+    parameters: Dict,
+    max_length: int=200
+) -> str:
+    summary = ", ".join(
+        f"{key}=<{len(value)} rows>" if isinstance(value, list) else f"{key}={value!r}"
+        for key, value in (parameters or {}).items()
+    )
+    return summary if len(summary) <= max_length else summary[:max_length] + "..."
+
+class QueryStats:
+    def __init__(
+        self,
+        slow_query_ms: float=500.0,
+        slow_query_log_size: int=50
+    ):
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_log_size = slow_query_log_size
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.templates = defaultdict(lambda: defaultdict(float))
+        self.slow_queries = []
+        self.sequence = 0
+
+    def configure(
+        self,
+        slow_query_ms: float=None
+    ):
+        if slow_query_ms != None:
+            self.slow_query_ms = slow_query_ms
+
+    def record(
+        self,
+        query: str,
+        parameters: Dict,
+        summary,
+        client_seconds: float,
+        missed_rows: int=0
+    ):
+        template = get_query_template(query)
+        counters = summary.counters
+        server_ms = float(summary.result_available_after or 0) + float(summary.result_consumed_after or 0)
+        zero_effect = not counters.contains_updates
+
+        with self.lock:
+            stats = self.templates[template]
+            stats["count"] += 1
+            stats["zero_effect"] += zero_effect
+            stats["missed_rows"] += missed_rows
+            stats["client_seconds"] += client_seconds
+            stats["server_ms"] += server_ms
+            stats["server_ms_max"] = max(stats["server_ms_max"], server_ms)
+            for name in SUMMARY_COUNTERS:
+                stats[name] += int(getattr(counters, name))
+
+            elapsed_ms = max(client_seconds * 1000, server_ms)
+            if elapsed_ms >= self.slow_query_ms:
+                # keep only the slowest statements, so a bad run can't grow the log without bound
+                self.sequence += 1
+                entry = (elapsed_ms, self.sequence, {
+                    "template": template,
+                    "parameters": summarize_parameters(parameters),
+                    "client_ms": client_seconds * 1000,
+                    "server_ms": server_ms,
+                    "zero_effect": zero_effect,
+                    "missed_rows": missed_rows
+                })
+                if len(self.slow_queries) < self.slow_query_log_size:
+                    heapq.heappush(self.slow_queries, entry)
+                else:
+                    heapq.heappushpop(self.slow_queries, entry)
+
+    def get_report(self) -> Dict:
+        with self.lock:
+            templates = [
+                {"template": template} | {
+                    name: int(value) if name not in ["client_seconds", "server_ms", "server_ms_max"] else value
+                    for name, value in stats.items()
+                }
+                for template, stats in self.templates.items()
+            ]
+            slow_queries = [entry for _, _, entry in sorted(self.slow_queries, key=lambda item: -item[0])]
+
+        return {
+            "statements": sum(stats["count"] for stats in templates),
+            "zero_effect_writes": sum(stats["zero_effect"] for stats in templates),
+            "missed_rows": sum(stats["missed_rows"] for stats in templates),
+            "templates": sorted(templates, key=lambda stats: -stats["client_seconds"]),
+            "slow_queries": slow_queries
+        }
+
+query_stats = QueryStats()
+
+def run_write(
+    session,
+    query: str,
+    parameters: Dict=None,
+    rows: int=None
+):
+    # An UNWIND batch where only some rows MATCH still updates something, so it
+    # isn't zero effect. Batch statements pass their row count and return
+    # count(...) AS matched, and the rows that matched nothing are counted apart.
+    start = time.perf_counter()
+    result = session.run(query, parameters=parameters)
+    missed_rows = 0
+    if rows != None:
+        record = result.single()
+        missed_rows = rows - (record["matched"] if record != None else 0)
+    summary = result.consume()
+    query_stats.record(query, parameters, summary, time.perf_counter() - start, missed_rows=missed_rows)
+
+    return summary
+
+def write_query_report(
+    metrics_dir: str,
+    report: Dict
+):
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    with open(os.path.join(metrics_dir, "graph_queries.json"), "w") as fp:
+        json.dump(report, fp, indent=2)
+
+def format_query_report_markdown(report: Dict) -> str:
+    lines = [
+        f"{report['statements']} graph writes, {report['zero_effect_writes']} with zero effect, "
+        f"{report['missed_rows']} batch rows matched nothing",
+        "",
+        "| template | count | zero effect | missed rows | client (s) | server (ms) | max server (ms) | nodes created | relationships created | properties set |",
+        "| --- | --- | --- | --- | --- | --- | --- | --- | --- | --- |"
+    ]
+    lines += [
+        f"| `{stats['template'][:120]}` | {stats['count']} | {stats['zero_effect']} | {stats['missed_rows']} | {stats['client_seconds']:.2f} | "
+        f"{stats['server_ms']:.0f} | {stats['server_ms_max']:.0f} | {stats['nodes_created']} | "
+        f"{stats['relationships_created']} | {stats['properties_set']} |"
+        for stats in report["templates"]
+    ]
+
+    if report["slow_queries"] != []:
+        lines += ["", "## Slow queries", "", "| client (ms) | server (ms) | template | parameters |", "| --- | --- | --- | --- |"]
+        lines += [
+            f"| {entry['client_ms']:.0f} | {entry['server_ms']:.0f} | `{entry['template'][:120]}` | {entry['parameters']} |"
+            for entry in report["slow_queries"]
+        ]
+
+    return "\n".join(lines)
@@ -0,0 +1,287 @@
+import asyncio
+import bisect
+import copy
+import json
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+# upper bounds in seconds, from a fast Neo4j write to a throttled API retry
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf")]
+
+class Histogram:
+    def __init__(
+        self,
+        buckets: list=LATENCY_BUCKETS
+    ):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(
+        self,
+        value: float
+    ):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def subtract(
+        self,
+        other: "Histogram"
+    ) -> "Histogram":
+        histogram = Histogram(self.buckets)
+        histogram.counts = [count - other_count for count, other_count in zip(self.counts, other.counts)]
+        histogram.sum = self.sum - other.sum
+        histogram.count = self.count - other.count
+        return histogram
+
+    def get_percentile(
+        self,
+        percentile: float
+    ) -> float:
+        # linear interpolation inside the bucket holding the rank, as PromQL's histogram_quantile does
+        if self.count == 0:
+            return None
+
+        rank = percentile / 100 * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if cumulative + count >= rank and count > 0:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if self.buckets[index] != float("inf") else lower
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+
+        return self.buckets[-2]
+
+counters = Counter()
+labeled_counters = Counter()
+histograms = {}
+
+def get_key(
+    name: str,
+    labels: Dict=None
+) -> Tuple:
+    return (name, tuple(sorted((labels or {}).items())))
+
+def increment(
+    name: str,
+    value: int=1,
+    labels: Dict=None
+):
+    counters[name] += value
+    if labels != None:
+        labeled_counters[get_key(name, labels)] += value
+
+def get_counters() -> Dict:
+    return dict(counters)
+
+def observe(
+    name: str,
+    seconds: float,
+    labels: Dict=None
+):
+    key = get_key(name, labels)
+    if key not in histograms:
+        histograms[key] = Histogram()
+    histograms[key].observe(seconds)
+
+@contextmanager
+def timed(
+    name: str,
+    **labels
+):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, labels)
+
+def reset_metrics():
+    counters.clear()
+    labeled_counters.clear()
+    histograms.clear()
+
+def snapshot_metrics() -> Dict:
+    return {
+        "counters": Counter(labeled_counters),
+        "totals": Counter(counters),
+        "histograms": copy.deepcopy(histograms)
+    }
+
+def format_labels(labels: Tuple) -> str:
+    return ",".join(f"{key}={value}" for key, value in labels)
+
+def get_metrics_summary(
+    since: Dict=None
+) -> Dict:
+    since = since or {"counters": Counter(), "totals": Counter(), "histograms": {}}
+
+    totals = Counter(counters)
+    totals.subtract(since["totals"])
+    by_labels = Counter(labeled_counters)
+    by_labels.subtract(since["counters"])
+
+    summary = {
+        "counters": {name: value for name, value in sorted(totals.items()) if value != 0},
+        "labeled_counters": {},
+        "latency": {}
+    }
+
+    for (name, labels), value in sorted(by_labels.items(), key=str):
+        if value != 0:
+            summary["labeled_counters"].setdefault(name, {})[format_labels(labels)] = value
+
+    for (name, labels), histogram in sorted(histograms.items(), key=str):
+        if (name, labels) in since["histograms"]:
+            histogram = histogram.subtract(since["histograms"][(name, labels)])
+        if histogram.count == 0:
+            continue
+
+        summary["latency"].setdefault(name, {})[format_labels(labels)] = {
+            "count": histogram.count,
+            "sum": histogram.sum,
+            "mean": histogram.sum / histogram.count,
+            "p50": histogram.get_percentile(50),
+            "p95": histogram.get_percentile(95),
+            "p99": histogram.get_percentile(99)
+        }
+
+    return summary
+
+def get_step_percentiles() -> Dict:
+    return {
+        step.removeprefix("step="): {"count": stats["count"], "p50": stats["p50"], "p95": stats["p95"]}
+        for step, stats in get_metrics_summary()["latency"].get("step_seconds", {}).items()
+    }
+
+def format_prometheus_name(name: str) -> str:
+    return "movie_etl_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+def format_prometheus_labels(
+    labels: Tuple,
+    extra: Dict={}
+) -> str:
+    pairs = list(labels) + list(extra.items())
+    if pairs == []:
+        return ""
+
+    return "{" + ",".join(f'{key}={json.dumps(str(value))}' for key, value in pairs) + "}"
+
+def format_prometheus() -> str:
+    lines = []
+
+    labeled_names = {name for name, _ in labeled_counters}
+    for name in sorted(set(counters) | labeled_names):
+        metric_name = format_prometheus_name(name) + "_total"
+        lines.append(f"# TYPE {metric_name} counter")
+
+        labeled_total = 0
+        for (counter_name, labels), value in sorted(labeled_counters.items(), key=str):
+            if counter_name == name:
+                lines.append(f"{metric_name}{format_prometheus_labels(labels)} {value}")
+                labeled_total += value
+
+        # increments made without labels
+        if counters[name] != labeled_total or name not in labeled_names:
+            lines.append(f"{metric_name} {counters[name] - labeled_total}")
+
+    for name in sorted({name for name, _ in histograms}):
+        metric_name = format_prometheus_name(name)
+        lines.append(f"# TYPE {metric_name} histogram")
+
+        for (histogram_name, labels), histogram in sorted(histograms.items(), key=str):
+            if histogram_name != name:
+                continue
+
+            cumulative = 0
+            for bucket, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                le = "+Inf" if bucket == float("inf") else str(bucket)
+                lines.append(f"{metric_name}_bucket{format_prometheus_labels(labels, {'le': le})} {cumulative}")
+            lines.append(f"{metric_name}_sum{format_prometheus_labels(labels)} {histogram.sum}")
+            lines.append(f"{metric_name}_count{format_prometheus_labels(labels)} {histogram.count}")
+
+    return "\n".join(lines) + "\n"
+
+def write_metrics(
+    metrics_dir: str,
+    summary: Dict
+):
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    with open(os.path.join(metrics_dir, "metrics.prom"), "w") as fp:
+        fp.write(format_prometheus())
+    with open(os.path.join(metrics_dir, "metrics.json"), "w") as fp:
+        json.dump(summary, fp, indent=2)
+
+def format_metrics_markdown(summary: Dict) -> str:
+    lines = ["## Counters", "", "| counter | value |", "| --- | --- |"]
+    lines += [f"| {name} | {value} |" for name, value in summary["counters"].items()]
+
+    for name, by_labels in summary["labeled_counters"].items():
+        lines += ["", f"## {name}", "", "| labels | value |", "| --- | --- |"]
+        lines += [f"| {labels or '-'} | {value} |" for labels, value in by_labels.items()]
+
+    for name, by_labels in summary["latency"].items():
+        lines += ["", f"## {name}", "", "| labels | count | mean (s) | p50 (s) | p95 (s) | p99 (s) |", "| --- | --- | --- | --- | --- | --- |"]
+        lines += [
+            f"| {labels or '-'} | {stats['count']} | {stats['mean']:.3f} | {stats['p50']:.3f} | {stats['p95']:.3f} | {stats['p99']:.3f} |"
+            for labels, stats in by_labels.items()
+        ]
+
+    return "\n".join(lines)
+
+class ProgressReporter:
+    def __init__(
+        self,
+        total_movies: int,
+        interval: float=60.0
+    ):
+        self.total_movies = total_movies
+        self.interval = interval
+        self.started_at = time.monotonic()
+        self.initial_counters = Counter(counters)
+
+    def get_progress(self) -> Dict:
+        elapsed_minutes = max(time.monotonic() - self.started_at, 1e-9) / 60
+        delta = Counter(counters)
+        delta.subtract(self.initial_counters)
+
+        movies_done = delta["movies_loaded"]
+        movies_per_minute = movies_done / elapsed_minutes
+        remaining = max(self.total_movies - movies_done, 0)
+
+        return {
+            "movies_done": movies_done,
+            "total_movies": self.total_movies,
+            "movies_per_minute": movies_per_minute,
+            "api_calls_per_minute": delta["api_calls"] / elapsed_minutes,
+            "edges_written_per_minute": delta["edges_written"] / elapsed_minutes,
+            "eta_minutes": remaining / movies_per_minute if movies_per_minute > 0 else None
+        }
+
+    def format_progress(self) -> str:
+        progress = self.get_progress()
+        eta = f"{progress['eta_minutes']:.1f} min" if progress["eta_minutes"] != None else "unknown"
+
+        return (
+            f"{progress['movies_done']}/{progress['total_movies']} movies | "
+            f"{progress['movies_per_minute']:.1f} movies/min | "
+            f"{progress['api_calls_per_minute']:.1f} API calls/min | "
+            f"{progress['edges_written_per_minute']:.1f} edges/min | "
+            f"ETA {eta}"
+        )
+
+    async def report_periodically(
+        self,
+        logger
+    ):
+        while True:
+            await asyncio.sleep(self.interval)
+            logger.info(self.format_progress())
@@ -0,0 +1,258 @@
+import os
+import signal
+import sys
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Dict
+
+# frames whose locals identify the movie being processed
+MOVIE_FRAMES = {
+    "single_movie_flow",
+    "fetch_movie_stage",
+    "clean_movie_stage",
+    "load_movie_nodes_stage",
+    "load_movie_edges_stage"
+}
+
+PROFILE_MODES = {"cpu", "memory"}
+
+def get_profile_settings(
+    profile: str=None,
+    profile_dir: str=None,
+    profile_per_movie: bool=None
+) -> Dict:
+    # flow parameters win over MOVIE_ETL_PROFILE* environment variables
+    profile = profile if profile != None else os.getenv("MOVIE_ETL_PROFILE", "")
+    modes = {mode.strip() for mode in profile.split(",") if mode.strip() != ""}
+
+    unknown_modes = modes - PROFILE_MODES
+    if unknown_modes:
+        raise ValueError(f"Unknown profile modes {sorted(unknown_modes)}, expected a subset of {sorted(PROFILE_MODES)}")
+
+    if profile_per_movie == None:
+        profile_per_movie = os.getenv("MOVIE_ETL_PROFILE_PER_MOVIE", "") in ["1", "true", "yes"]
+
+    return {
+        "modes": modes,
+        "output_dir": profile_dir or os.getenv("MOVIE_ETL_PROFILE_DIR", "profiles"),
+        "per_movie": profile_per_movie
+    }
+
+def get_frame_movie_id(frame):
+    movie_id = frame.f_locals.get("movie_id")
+    if movie_id == None and isinstance(frame.f_locals.get("movie"), dict):
+        movie_id = frame.f_locals["movie"].get("movie_id")
+
+    return movie_id
+
+def format_frame(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class Profiler:
+    def __init__(
+        self,
+        run_name: str,
+        modes: set,
+        output_dir: str,
+        per_movie: bool=False,
+        interval: float=0.005,
+        top_n: int=25,
+        traceback_depth: int=10
+    ):
+        self.run_name = run_name
+        self.modes = modes
+        self.output_dir = output_dir
+        self.per_movie = per_movie
+        self.interval = interval
+        self.top_n = top_n
+        self.traceback_depth = traceback_depth
+
+        self.stacks = Counter()
+        self.movie_stacks = defaultdict(Counter)
+        self._stop = threading.Event()
+        self._sampler = None
+        self._signal_sampling = False
+        self._previous_handler = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        if "memory" in self.modes and not tracemalloc.is_tracing():
+            tracemalloc.start(self.traceback_depth)
+            self._started_tracemalloc = True
+
+        if "cpu" not in self.modes:
+            return
+
+        # SIGPROF fires per interval of process CPU time and its handler runs on
+        # the main thread, which runs the event loop, with the interrupted frame.
+        # A sampler thread only gets the GIL once the loop releases it, so its
+        # samples of the loop thread land in the selector instead of the code.
+        if hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread():
+            self._previous_handler = signal.signal(signal.SIGPROF, self.handle_signal)
+            self._signal_sampling = True
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self._sampler = threading.Thread(target=self.sample, name="movie-etl-profiler", daemon=True)
+            self._sampler.start()
+
+    def handle_signal(self, signum, frame):
+        self.record_frame(frame, threading.current_thread().name)
+
+    def sample(self):
+        # Fallback when profiling starts off the main thread: wall-clock sampling
+        # of every thread, biased towards the points where threads release the GIL.
+        own_thread_id = threading.get_ident()
+
+        while not self._stop.wait(self.interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_thread_id:
+                    self.record_frame(frame, thread_names.get(thread_id, str(thread_id)))
+
+    def record_frame(
+        self,
+        frame,
+        thread_name: str
+    ):
+        stack = []
+        movie_id = None
+        while frame != None:
+            if movie_id == None and frame.f_code.co_name in MOVIE_FRAMES:
+                movie_id = get_frame_movie_id(frame)
+            stack.append(format_frame(frame))
+            frame = frame.f_back
+
+        collapsed = ";".join([thread_name] + stack[::-1])
+        self.stacks[collapsed] += 1
+        if self.per_movie and movie_id != None:
+            self.movie_stacks[movie_id][collapsed] += 1
+
+    @contextmanager
+    def profile_movie(
+        self,
+        movie_id: int
+    ):
+        if not self.per_movie or "memory" not in self.modes:
+            yield
+            return
+
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            after = tracemalloc.take_snapshot()
+            self.write_memory_report(
+                os.path.join(self.get_movies_dir(), f"{movie_id}-memory.txt"),
+                after.compare_to(before, "lineno")[:self.top_n],
+                f"Top {self.top_n} allocation changes while movie {movie_id} was processed (includes concurrent movies)"
+            )
+
+    def get_movies_dir(self) -> str:
+        movies_dir = os.path.join(self.output_dir, f"{self.run_name}-movies")
+        os.makedirs(movies_dir, exist_ok=True)
+        return movies_dir
+
+    def write_collapsed(
+        self,
+        path: str,
+        stacks: Counter
+    ):
+        # one "frame;frame;frame count" line per stack, the input format of
+        # flamegraph.pl, speedscope and inferno
+        with open(path, "w") as fp:
+            for stack, count in stacks.most_common():
+                fp.write(f"{stack} {count}\n")
+
+    def write_memory_report(
+        self,
+        path: str,
+        statistics: list,
+        title: str
+    ):
+        with open(path, "w") as fp:
+            fp.write(title + "\n\n")
+            for statistic in statistics:
+                fp.write(f"{statistic}\n")
+
+    def stop(self) -> list:
+        paths = []
+
+        if self._signal_sampling:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+            self._signal_sampling = False
+
+        if self._sampler != None:
+            self._stop.set()
+            self._sampler.join()
+
+        if "cpu" in self.modes:
+            path = os.path.join(self.output_dir, f"{self.run_name}-cpu.collapsed")
+            self.write_collapsed(path, self.stacks)
+            paths.append(path)
+
+            for movie_id, stacks in self.movie_stacks.items():
+                self.write_collapsed(os.path.join(self.get_movies_dir(), f"{movie_id}-cpu.collapsed"), stacks)
+
+        if "memory" in self.modes and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            path = os.path.join(self.output_dir, f"{self.run_name}-memory.txt")
+            current, peak = tracemalloc.get_traced_memory()
+            self.write_memory_report(
+                path,
+                snapshot.statistics("lineno")[:self.top_n],
+                f"Top {self.top_n} live allocations at the end of {self.run_name} "
+                f"(traced current {current / 1024 / 1024:.1f} MB, peak {peak / 1024 / 1024:.1f} MB)"
+            )
+            paths.append(path)
+
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+        return paths
+
+active_profiler = None
+
+def start_profiling(
+    run_name: str,
+    modes: set,
+    output_dir: str,
+    per_movie: bool=False
+) -> Profiler:
+    global active_profiler
+
+    if modes == set():
+        return None
+
+    active_profiler = Profiler(run_name, modes, output_dir, per_movie=per_movie)
+    active_profiler.start()
+    return active_profiler
+
+def stop_profiling(
+    profiler: Profiler
+) -> list:
+    global active_profiler
+
+    if profiler == None:
+        return []
+
+    if active_profiler is profiler:
+        active_profiler = None
+    return profiler.stop()
+
+@contextmanager
+def profile_movie(
+    movie_id: int
+):
+    if active_profiler == None:
+        yield
+        return
+
+    with active_profiler.profile_movie(movie_id):
+        yield
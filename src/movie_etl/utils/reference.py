@@ -0,0 +1,58 @@
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from neo4j import Driver
+
+# static nodes seeded by kg_scripts/2_init_nodes.cypher
+REFERENCE_KEYS = {
+    "Genre": "genre_id",
+    "Language": "language_id",
+    "Country": "country_id",
+    "WatchProvider": "provider_id"
+}
+
+class ReferenceData:
+    def __init__(self):
+        self.ids = None
+        self.unknown_ids = defaultdict(set)
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.ids != None
+
+    def load(
+        self,
+        driver: "Driver",
+        reload: bool=False
+    ):
+        with self.lock:
+            if self.loaded and not reload:
+                return
+
+            ids = {}
+            with driver.session() as session:
+                for node_label, property_id_name in REFERENCE_KEYS.items():
+                    result = session.run(f"MATCH (n:{node_label}) RETURN n.{property_id_name} AS property_id")
+                    ids[node_label] = {record["property_id"] for record in result}
+
+            self.ids = ids
+            self.unknown_ids = defaultdict(set)
+
+    def validate(
+        self,
+        node_label: str,
+        property_ids: List
+    ) -> Tuple[List, List]:
+        known_ids = [property_id for property_id in property_ids if property_id in self.ids[node_label]]
+        unknown_ids = [property_id for property_id in property_ids if property_id not in self.ids[node_label]]
+        self.unknown_ids[node_label].update(unknown_ids)
+
+        return known_ids, unknown_ids
+
+    def get_unknown_ids(self) -> Dict:
+        return {node_label: sorted(ids, key=str) for node_label, ids in self.unknown_ids.items() if ids}
+
+reference_data = ReferenceData()
@@ -0,0 +1,117 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
+DEFAULT_LIMITS = {
+    "tmdb": 20,
+    "scrape": 2,
+    "neo4j": 10,
+    "postgres": 5
+}
+
+class ResourceBudget:
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        adaptive: bool=False,
+        min_limit: int=1,
+        latency_tolerance: float=2.0
+    ):
+        self.name = name
+        self.limit = limit
+        self.max_limit = limit
+        self.min_limit = min_limit
+        self.adaptive = adaptive
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.baseline_latency = None
+        self._completed_since_change = 0
+        self._condition = None
+        self._loop = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+
+        if self._loop is not loop:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+            self.in_flight = 0
+
+        return self._condition
+
+    @asynccontextmanager
+    async def acquire(self):
+        condition = self._get_condition()
+
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+        start = time.perf_counter()
+        try:
+            yield
+
+        finally:
+            elapsed = time.perf_counter() - start
+
+            async with condition:
+                self.in_flight -= 1
+                if self.adaptive:
+                    self._adapt(elapsed)
+                condition.notify_all()
+
+    def _adapt(
+        self,
+        elapsed: float
+    ):
+        # AIMD on observed latency: back off multiplicatively once the store slows
+        # down past the tolerated baseline, otherwise probe upward one slot at a time.
+        self.latency_ewma = elapsed if self.latency_ewma == None else 0.8 * self.latency_ewma + 0.2 * elapsed
+        self.baseline_latency = self.latency_ewma if self.baseline_latency == None else min(self.baseline_latency, self.latency_ewma)
+        self._completed_since_change += 1
+
+        if self._completed_since_change < self.limit:
+            return
+
+        self._completed_since_change = 0
+        if self.latency_ewma > self.baseline_latency * self.latency_tolerance:
+            self.limit = max(self.min_limit, int(self.limit * 0.75))
+        else:
+            self.limit = min(self.max_limit, self.limit + 1)
+
+class Scheduler:
+    def __init__(self):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.adaptive = False
+        self.budgets = {}
+
+    def configure(
+        self,
+        limits: Dict,
+        adaptive: bool=False
+    ):
+        self.limits.update({resource: limit for resource, limit in limits.items() if limit != None})
+        self.adaptive = adaptive
+        self.budgets = {}
+
+    def get_budget(
+        self,
+        resource: str
+    ) -> ResourceBudget:
+        if resource not in self.budgets:
+            # Per-host keys such as "scrape:www.imdb.com" share the limit of their resource.
+            limit = self.limits.get(resource, self.limits.get(resource.split(":")[0], 1))
+            self.budgets[resource] = ResourceBudget(resource, limit, adaptive=self.adaptive)
+
+        return self.budgets[resource]
+
+    def acquire(
+        self,
+        resource: str
+    ):
+        return self.get_budget(resource).acquire()
+
+scheduler = Scheduler()
@@ -0,0 +1,41 @@
+import asyncio
+import hashlib
+from typing import List, Dict
+
+def get_shard_index(
+    movie_id: int,
+    shard_count: int
+) -> int:
+    digest = hashlib.md5(str(movie_id).encode()).hexdigest()
+
+    return int(digest, 16) % shard_count
+
+def partition_movie_ids(
+    movie_ids: List,
+    shard_count: int
+) -> List[List]:
+    shards = [[] for _ in range(shard_count)]
+
+    for movie_id in movie_ids:
+        shards[get_shard_index(movie_id, shard_count)].append(movie_id)
+
+    return shards
+
+def run_shard(
+    entrypoint: str,
+    parameters: Dict
+) -> Dict:
+    # Runs inside a fresh worker process, so the flow module and its
+    # Postgres engine / Neo4j driver are created per shard.
+    from prefect.flows import load_flow_from_entrypoint
+
+    movies_flow = load_flow_from_entrypoint(entrypoint)
+
+    try:
+        return asyncio.run(movies_flow(**parameters))
+    except Exception as e:
+        return {
+            "movie_ids": len(parameters["movie_ids"]),
+            "failed_movie_ids": parameters["movie_ids"],
+            "error": repr(e)
+        }
@@ -3,7 +3,7 @@ import sys
 import pathlib
 import os
 import json
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 sys.path.append(str(pathlib.Path(os.path.dirname(os.path.realpath(__file__)), "src")))
 
@@ -16,8 +16,10 @@ from src.movie_etl.tasks.etl_task import (
     clean_person_details,
     clean_watch_providers,
     load_single_row_to_db,
-    load_multi_row_to_db
+    load_multi_row_to_db,
+    filter_loaded_movie_ids
 )
+from src.movie_etl.tasks.kg_task import load_entity_batch_to_kg, load_relationship_to_kg
 
 class UnitTestETLTask(unittest.IsolatedAsyncioTestCase):
     @patch("src.movie_etl.tasks.etl_task.requests.get")
@@ -152,9 +154,27 @@ class UnitTestETLTask(unittest.IsolatedAsyncioTestCase):
         
         self.assertCountEqual(clean_providers, expected_clean_providers)
 
-    @patch("src.movie_etl.tasks.etl_task.Engine")
+    @patch("src.movie_etl.tasks.etl_task.asyncio.sleep")
+    async def test_clean_watch_providers_compact_regions(self, mock_sleep):
+        mock_watch_providers = {"results": {
+            "US": {"flatrate": [{"provider_id": 8}], "buy": [{"provider_id": 2}]},
+            "DE": {"flatrate": [{"provider_id": 8}]},
+            "AT": {"flatrate": [{"provider_id": 8}], "rent": [{"provider_id": 2}]}
+        }}
+
+        clean_providers = await clean_watch_providers.fn(
+            movie_id=123,
+            watch_providers=mock_watch_providers
+        )
+
+        self.assertEqual(clean_providers, {
+            8: {"subscription": ["AT", "DE", "US"]},
+            2: {"buy": ["US"], "rent": ["AT"]}
+        })
+
     @patch("src.movie_etl.tasks.etl_task.get_run_logger")
-    async def test_load_single_row_to_db(self, mock_engine, mock_logger):
+    async def test_load_single_row_to_db(self, mock_logger):
+        mock_engine = MagicMock()
         mock_connection = MagicMock()
         mock_cursor = MagicMock()
         mock_logger_error = MagicMock()
@@ -191,9 +211,9 @@ class UnitTestETLTask(unittest.IsolatedAsyncioTestCase):
         mock_connection.commit.assert_called_once()
         mock_connection.close.assert_called_once()
 
-    @patch("src.movie_etl.tasks.etl_task.Engine")
     @patch("src.movie_etl.tasks.etl_task.get_run_logger")
-    async def test_load_multi_row_to_db(self, mock_engine, mock_logger):
+    async def test_load_multi_row_to_db(self, mock_logger):
+        mock_engine = MagicMock()
         mock_connection = MagicMock()
         mock_cursor = MagicMock()
         mock_logger_error = MagicMock()
@@ -230,6 +250,98 @@ class UnitTestETLTask(unittest.IsolatedAsyncioTestCase):
         mock_connection.commit.assert_called_once()
         mock_connection.close.assert_called_once()
 
+    @patch("src.movie_etl.tasks.etl_task.get_existing_node_ids")
+    @patch("src.movie_etl.tasks.etl_task.get_run_logger")
+    async def test_filter_loaded_movie_ids(self, mock_logger, mock_existing_node_ids):
+        mock_driver = MagicMock()
+        mock_existing_node_ids.return_value = {1072342, 972433}
+
+        movie_ids = await filter_loaded_movie_ids.fn(
+            movie_ids=[1211957, 1072342, 972433, 836972],
+            driver=mock_driver
+        )
+
+        mock_existing_node_ids.assert_called_once()
+        self.assertListEqual(movie_ids, [1211957, 836972])
+
+        forced_movie_ids = await filter_loaded_movie_ids.fn(
+            movie_ids=[1211957, 1072342, 972433, 836972],
+            driver=mock_driver,
+            force=True
+        )
+
+        mock_existing_node_ids.assert_called_once()
+        self.assertListEqual(forced_movie_ids, [1211957, 1072342, 972433, 836972])
+
+        with self.assertRaises(ValueError):
+            await filter_loaded_movie_ids.fn(movie_ids=[1211957], driver=mock_driver, skip_source="neo4j")
+        with self.assertRaises(ValueError):
+            await filter_loaded_movie_ids.fn(movie_ids=[1211957], engine=MagicMock(), stale_after_days=7, skip_source="db")
+
+    async def test_load_entity_batch_to_kg(self):
+        mock_driver = MagicMock()
+        mock_session = MagicMock()
+        mock_driver.session.return_value.__enter__.return_value = mock_session
+
+        with open("./tests/unit_tests/expected_results/clean_person_details_2524.json", "r") as fp:
+            person_details = json.load(fp)
+
+        await load_entity_batch_to_kg.fn(
+            node_label="Person",
+            primary_key="person_id",
+            node_properties=[person_details],
+            driver=mock_driver,
+            date_keys=["birthday", "deathday"]
+        )
+
+        mock_session.run.assert_called_once()
+        actual_query = mock_session.run.call_args[0][0]
+
+        self.assertIn("UNWIND $rows AS row", actual_query)
+        self.assertIn("MERGE (n:Person {person_id: row.person_id})", actual_query)
+        self.assertIn("n.birthday = datetime(row.birthday)", actual_query)
+        self.assertIn("n.biography = row.biography", actual_query)
+        self.assertNotIn("n.person_id =", actual_query)
+        self.assertEqual(mock_session.run.call_args[1]["parameters"], {"rows": [person_details]})
+
+    @patch("src.movie_etl.tasks.kg_task.pace", new_callable=AsyncMock)
+    @patch("src.movie_etl.tasks.kg_task.get_run_logger")
+    async def test_load_relationship_to_kg(self, mock_logger, mock_pace):
+        mock_driver = MagicMock()
+        mock_session = MagicMock()
+        mock_driver.session.return_value.__enter__.return_value = mock_session
+
+        await load_relationship_to_kg.fn(
+            relationship_label="ACTED_IN",
+            head_label="Person",
+            tail_label="Movie",
+            head_property_id={"person_id": 2524},
+            tail_property_id={"movie_id": 912649},
+            driver=mock_driver,
+            relationship_property={"roles": ["Maui"]}
+        )
+
+        actual_query = mock_session.run.call_args[0][0]
+        self.assertIn("MERGE (h)-[r:ACTED_IN {relationship_id: $relationship_id}]->(t)", actual_query)
+        self.assertIn("SET r += {roles: $roles}, h.updated_at = datetime()", actual_query)
+        self.assertEqual(mock_session.run.call_args[1]["parameters"]["relationship_id"], "2524-912649")
+
+        # deferred roles are added to the edge of the roles kept on the first load
+        await load_relationship_to_kg.fn(
+            relationship_label="ACTED_IN",
+            head_label="Person",
+            tail_label="Movie",
+            head_property_id={"person_id": 2524},
+            tail_property_id={"movie_id": 912649},
+            driver=mock_driver,
+            relationship_property={"roles": ["Maui (voice)"]},
+            append_keys=["roles"]
+        )
+
+        actual_query = mock_session.run.call_args[0][0]
+        self.assertIn("SET r.roles = coalesce(r.roles, []) + [value IN $roles WHERE NOT value IN coalesce(r.roles, [])], h.updated_at", actual_query)
+        self.assertNotIn("r +=", actual_query)
+
     async def test_exception_load_single_row_to_db_(self):
         pass
 
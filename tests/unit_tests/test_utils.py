@@ -0,0 +1,627 @@
+import unittest
+import asyncio
+import sys
+import pathlib
+import os
+import json
+import signal
+import time
+import tempfile
+import subprocess
+from unittest.mock import patch, MagicMock
+from datetime import date
+
+sys.path.append(str(pathlib.Path(os.path.dirname(os.path.realpath(__file__)), "src")))
+
+from src.movie_etl.utils.etl import split_date_range, aggregate_casts, aggregate_crews, split_credits, diff_provider_edges, get_existing_node_ids, get_unenriched_person_ids
+from src.movie_etl.utils.buffer import RowBuffer
+from src.movie_etl.utils.execution import run_step, run_pipeline, run_worker_pool, lightweight_mode, step_timings
+from src.movie_etl.utils.shard import partition_movie_ids, get_shard_index
+from src.movie_etl.utils.checkpoint import CheckpointStore
+from src.movie_etl.utils.cache import CollectionCache
+from src.movie_etl.utils.scheduler import Scheduler
+from src.movie_etl.utils.metrics import (
+    ProgressReporter,
+    Histogram,
+    increment,
+    observe,
+    snapshot_metrics,
+    get_metrics_summary,
+    format_prometheus
+)
+from src.movie_etl.utils.reference import ReferenceData
+from src.movie_etl.utils.profiling import get_profile_settings, start_profiling, stop_profiling
+from src.movie_etl.utils.graph_stats import QueryStats, get_query_template, run_write, format_query_report_markdown
+from src.movie_etl.utils.connections import LazyResource
+from src.movie_etl.utils.archive import RawArchive, get_request_key
+from src.movie_etl.utils.export import PartWriter, load_graph_schema, resolve_edges, build_csr
+
+class UnitTestETLUtils(unittest.IsolatedAsyncioTestCase):
+    @patch("src.movie_etl.utils.buffer.insert_rows")
+    async def test_row_buffer_flush_by_row_count(self, mock_insert_rows):
+        mock_engine = MagicMock()
+        row_buffer = RowBuffer(mock_engine, max_rows=2, max_seconds=60)
+
+        await row_buffer.add("imdb_details", {"imdb_id": "tt1", "user_score": 70, "movie_id": 1})
+        mock_insert_rows.assert_not_called()
+
+        await row_buffer.add("imdb_details", {"imdb_id": "tt2", "user_score": 80, "movie_id": 2})
+        mock_insert_rows.assert_called_once_with(
+            "imdb_details",
+            ["imdb_id", "user_score", "movie_id"],
+            [("tt1", 70, 1), ("tt2", 80, 2)],
+            mock_engine
+        )
+
+    @patch("src.movie_etl.utils.buffer.insert_rows")
+    async def test_row_buffer_drain_on_close(self, mock_insert_rows):
+        mock_engine = MagicMock()
+        row_buffer = RowBuffer(mock_engine, max_rows=100, max_seconds=60)
+        row_buffer.start()
+
+        await row_buffer.add("imdb_details", {"imdb_id": "tt1", "movie_id": 1})
+        await row_buffer.add("metacritic_details", {"metacritic_id": "movie/a", "movie_id": 1})
+        mock_insert_rows.assert_not_called()
+
+        await row_buffer.close()
+        self.assertEqual(mock_insert_rows.call_count, 2)
+
+    @patch("src.movie_etl.utils.buffer.insert_rows")
+    async def test_row_buffer_retries_then_dead_letters(self, mock_insert_rows):
+        mock_insert_rows.side_effect = [ConnectionError("server closed the connection"), None]
+        row_buffer = RowBuffer(MagicMock(), max_rows=1, max_seconds=60, retry_delay_seconds=0)
+
+        await row_buffer.add("imdb_details", {"imdb_id": "tt1", "movie_id": 1})
+        self.assertEqual(mock_insert_rows.call_count, 2)
+
+        mock_insert_rows.side_effect = ConnectionError("server closed the connection")
+        row_buffer.max_rows = 2
+        await row_buffer.add("imdb_details", {"imdb_id": "tt2", "movie_id": 2})
+        await row_buffer.add("imdb_details", {"imdb_id": "tt3", "movie_id": 3})
+        self.assertEqual(mock_insert_rows.call_count, 5)
+
+        dead_letters = await row_buffer.close()
+        self.assertListEqual([row["movie_id"] for _, row, _ in dead_letters], [2, 3])
+        self.assertListEqual(row_buffer.dead_letters, [])
+
+    @patch("src.movie_etl.utils.buffer.insert_rows")
+    async def test_row_buffer_calls_back_once_written(self, mock_insert_rows):
+        row_buffer = RowBuffer(MagicMock(), max_rows=100, max_seconds=60, retries=0)
+        marked_movie_ids = []
+
+        await row_buffer.add("imdb_details", {"imdb_id": "tt1", "movie_id": 1})
+        await row_buffer.add("metacritic_details", {"metacritic_id": "movie/a", "movie_id": 1})
+        await row_buffer.add("imdb_details", {"imdb_id": "tt2", "movie_id": 2})
+        row_buffer.when_written(1, lambda: marked_movie_ids.append(1))
+        row_buffer.when_written(2, lambda: marked_movie_ids.append(2))
+        row_buffer.when_written(3, lambda: marked_movie_ids.append(3))
+        self.assertListEqual(marked_movie_ids, [3])
+
+        await row_buffer.flush("imdb_details")
+        self.assertListEqual(marked_movie_ids, [3, 2])
+
+        mock_insert_rows.side_effect = ConnectionError("server closed the connection")
+        await row_buffer.flush()
+        self.assertListEqual(marked_movie_ids, [3, 2])
+
+    async def test_run_step_lightweight_mode(self):
+        mock_step = MagicMock()
+        mock_step.name = "Clean Movie Genres"
+        mock_step.retries = 1
+        mock_step.retry_delay_seconds = 0
+
+        async def clean_genres(movie_genres, movie_id):
+            return [(movie_id, genre_id) for genre_id in movie_genres]
+        mock_step.fn = clean_genres
+
+        timings = {"Clean Movie Genres": []}
+        mode_token = lightweight_mode.set(True)
+        timings_token = step_timings.set(timings)
+        try:
+            genres = await run_step(mock_step, [28, 12], 912649)
+        finally:
+            lightweight_mode.reset(mode_token)
+            step_timings.reset(timings_token)
+
+        mock_step.assert_not_called()
+        self.assertListEqual(genres, [(912649, 28), (912649, 12)])
+        self.assertEqual(len(timings["Clean Movie Genres"]), 1)
+
+    def test_partition_movie_ids(self):
+        movie_ids = [1211957, 1072342, 1213997, 1136347, 1072876, 972433, 1223050, 1214490, 836972]
+
+        shards = partition_movie_ids(movie_ids, 3)
+
+        self.assertEqual(len(shards), 3)
+        self.assertCountEqual([movie_id for shard in shards for movie_id in shard], movie_ids)
+        for shard_index, shard in enumerate(shards):
+            for movie_id in shard:
+                self.assertEqual(get_shard_index(movie_id, 3), shard_index)
+
+    def test_checkpoint_store(self):
+        checkpoint_store = CheckpointStore(":memory:")
+
+        self.assertIsNone(checkpoint_store.get_run("weekly-2024-10-01"))
+        checkpoint_store.save_run("weekly-2024-10-01", {"vote_count_minimum": 10}, [912649, 558216])
+        self.assertDictEqual(
+            checkpoint_store.get_run("weekly-2024-10-01"),
+            {"parameters": {"vote_count_minimum": 10}, "movie_ids": [912649, 558216]}
+        )
+
+        checkpoint_store.mark_stage("weekly-2024-10-01", 912649, "fetched", {"id": 912649})
+        checkpoint_store.mark_stage("weekly-2024-10-01", 912649, "cleaned", {"movie_id": 912649})
+        checkpoint_store.drop_payload("weekly-2024-10-01", 912649, "fetched")
+
+        self.assertSetEqual(checkpoint_store.get_completed_stages("weekly-2024-10-01", 912649), {"fetched", "cleaned"})
+        self.assertSetEqual(checkpoint_store.get_completed_stages("weekly-2024-10-01", 558216), set())
+        self.assertIsNone(checkpoint_store.get_payload("weekly-2024-10-01", 912649, "fetched"))
+        self.assertDictEqual(checkpoint_store.get_payload("weekly-2024-10-01", 912649, "cleaned"), {"movie_id": 912649})
+
+        checkpoint_store.close()
+
+    def test_collection_cache_ttl(self):
+        collection_cache = CollectionCache()
+        collection_cache.configure(":memory:", ttl_days=30)
+
+        self.assertIsNone(collection_cache.get_details(10))
+        collection_cache.save_details(10, {"collection_id": 10, "name": "Star Wars Collection", "overview": None})
+        self.assertDictEqual(
+            collection_cache.get_details(10),
+            {"collection_id": 10, "name": "Star Wars Collection", "overview": None}
+        )
+
+        collection_cache._connection.execute("UPDATE collections SET fetched_at = '2000-01-01T00:00:00+00:00'")
+        self.assertIsNone(collection_cache.get_details(10))
+
+        self.assertFalse(collection_cache.is_loaded(10))
+        collection_cache.mark_loaded(10)
+        self.assertTrue(collection_cache.is_loaded(10))
+
+        collection_cache.configure()
+        self.assertFalse(collection_cache.is_loaded(10))
+        self.assertIsNone(collection_cache.get_details(10))
+
+    async def test_scheduler_budget_limit(self):
+        scheduler = Scheduler()
+        scheduler.configure({"neo4j": 2, "scrape": 1})
+        peak_in_flight = {"neo4j": 0, "scrape:www.imdb.com": 0}
+
+        async def write(resource):
+            async with scheduler.acquire(resource):
+                budget = scheduler.get_budget(resource)
+                peak_in_flight[resource] = max(peak_in_flight[resource], budget.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*[write("neo4j") for _ in range(10)], *[write("scrape:www.imdb.com") for _ in range(5)])
+
+        self.assertEqual(peak_in_flight["neo4j"], 2)
+        self.assertEqual(peak_in_flight["scrape:www.imdb.com"], 1)
+        self.assertEqual(scheduler.get_budget("neo4j").in_flight, 0)
+
+    async def test_run_pipeline_backpressure(self):
+        loaded_movie_ids = []
+        in_flight = {"current": 0, "peak": 0}
+
+        async def fetch(movie_id):
+            return {"movie_id": movie_id}
+
+        async def load(movie):
+            in_flight["current"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["current"])
+            await asyncio.sleep(0.001)
+            in_flight["current"] -= 1
+
+            if movie["movie_id"] == 972433:
+                raise ValueError("Neo4j write failed")
+            loaded_movie_ids.append(movie["movie_id"])
+
+        movie_ids = [1211957, 1072342, 1213997, 1136347, 1072876, 972433, 1223050, 1214490, 836972]
+        failures = await run_pipeline(
+            movie_ids,
+            stages=[("fetch", fetch, 3), ("load", load, 2)],
+            queue_size=1
+        )
+
+        self.assertCountEqual(loaded_movie_ids, [movie_id for movie_id in movie_ids if movie_id != 972433])
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(failures[0][0]["movie_id"], 972433)
+        self.assertEqual(failures[0][1], "load")
+        self.assertLessEqual(in_flight["peak"], 2)
+
+        pulled_movie_ids = []
+        release = asyncio.Event()
+
+        def discover_movie_ids():
+            for movie_id in movie_ids:
+                pulled_movie_ids.append(movie_id)
+                yield movie_id
+
+        async def stalled_fetch(movie_id):
+            await release.wait()
+            return {"movie_id": movie_id}
+
+        pipeline = asyncio.create_task(run_pipeline(
+            discover_movie_ids(),
+            stages=[("fetch", stalled_fetch, 1), ("load", load, 2)],
+            queue_size=2
+        ))
+        for _ in range(20):
+            await asyncio.sleep(0)
+
+        # one movie in the fetch worker, two in its queue and one waiting in put()
+        self.assertEqual(len(pulled_movie_ids), 4)
+
+        release.set()
+        await pipeline
+        self.assertEqual(len(pulled_movie_ids), len(movie_ids))
+
+    async def test_run_worker_pool_pulls_lazily(self):
+        pulled_movie_ids = []
+        in_flight = {"current": 0, "peak": 0}
+
+        def discover_movie_ids():
+            for movie_id in [1211957, 1072342, 1213997, 1136347, 1072876, 972433]:
+                pulled_movie_ids.append(movie_id)
+                yield movie_id
+
+        async def process_movie(movie_id):
+            in_flight["current"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["current"])
+            self.assertLessEqual(len(pulled_movie_ids) - pulled_movie_ids.index(movie_id), 2)
+            await asyncio.sleep(0.001)
+            in_flight["current"] -= 1
+
+            if movie_id == 1136347:
+                raise ValueError("TMDB request failed")
+
+        failures = await run_worker_pool(discover_movie_ids(), process_movie, 2)
+
+        self.assertEqual(in_flight["peak"], 2)
+        self.assertEqual(len(pulled_movie_ids), 6)
+        self.assertEqual([movie_id for movie_id, _ in failures], [1136347])
+
+    def test_split_date_range(self):
+        windows = split_date_range(date(2024, 1, 1), date(2024, 3, 1), 30)
+
+        self.assertListEqual(windows, [
+            ("2024-01-01", "2024-01-30"),
+            ("2024-01-31", "2024-02-29"),
+            ("2024-03-01", "2024-03-01")
+        ])
+
+        with self.assertRaises(ValueError):
+            split_date_range(date(2024, 1, 1), date(2024, 3, 1), 0)
+
+    def test_progress_reporter(self):
+        progress_reporter = ProgressReporter(total_movies=4)
+
+        increment("movies_loaded")
+        increment("api_calls", 5)
+        increment("edges_written", 12)
+
+        progress = progress_reporter.get_progress()
+        self.assertEqual(progress["movies_done"], 1)
+        self.assertEqual(progress["total_movies"], 4)
+        self.assertGreater(progress["api_calls_per_minute"], 0)
+        self.assertIsNotNone(progress["eta_minutes"])
+
+    def test_aggregate_crews(self):
+        crews = [
+            {"person_id": 1, "name": "A", "gender": "Female", "job": "Producer", "department": "Production"},
+            {"person_id": 1, "name": "A", "gender": "Female", "job": "Executive Producer", "department": "Production"},
+            {"person_id": 1, "name": "A", "gender": "Female", "job": "Director", "department": "Directing"},
+            {"person_id": 2, "name": "B", "gender": "Male", "job": "", "department": "Sound"}
+        ]
+
+        aggregated_crews = aggregate_crews(crews)
+
+        self.assertCountEqual(aggregated_crews, [
+            {"person_id": 1, "name": "A", "gender": "Female", "department": "Production", "jobs": ["Producer", "Executive Producer"]},
+            {"person_id": 1, "name": "A", "gender": "Female", "department": "Directing", "jobs": ["Director"]},
+            {"person_id": 2, "name": "B", "gender": "Male", "department": "Sound", "jobs": []}
+        ])
+
+    def test_aggregate_casts(self):
+        with open("./tests/unit_tests/expected_results/clean_movie_details_912649.json", "r") as fp:
+            casts = json.load(fp)["casts"]
+
+        aggregated_casts = aggregate_casts(casts)
+
+        self.assertEqual(len(aggregated_casts), len({cast["person_id"] for cast in casts}))
+        for cast in aggregated_casts:
+            self.assertCountEqual(
+                cast["characters"],
+                {c["character"] for c in casts if c["person_id"] == cast["person_id"] and c["character"] != ""}
+            )
+
+    def test_split_credits(self):
+        casts = [
+            {"person_id": 1, "name": "A", "gender": "Female", "character": "Lead", "order": 0},
+            {"person_id": 2, "name": "B", "gender": "Male", "character": "Support", "order": 1},
+            {"person_id": 3, "name": "C", "gender": "Male", "character": "Extra", "order": 2}
+        ]
+        crews = [
+            {"person_id": 4, "name": "D", "gender": "Female", "job": "Director", "department": "Directing"},
+            {"person_id": 5, "name": "E", "gender": "Male", "job": "Boom Operator", "department": "Sound"}
+        ]
+
+        kept_credits, deferred_credits = split_credits(casts, crews, cast_limit=2, crew_departments=["Directing"])
+
+        self.assertListEqual([cast["person_id"] for cast in kept_credits["casts"]], [1, 2])
+        self.assertListEqual([crew["person_id"] for crew in kept_credits["crews"]], [4])
+        self.assertListEqual([cast["person_id"] for cast in deferred_credits["casts"]], [3])
+        self.assertListEqual([crew["person_id"] for crew in deferred_credits["crews"]], [5])
+
+        kept_credits, deferred_credits = split_credits(casts, crews)
+
+        self.assertEqual(len(kept_credits["casts"]), 3)
+        self.assertEqual(len(kept_credits["crews"]), 2)
+        self.assertDictEqual(deferred_credits, {"casts": [], "crews": []})
+
+    def test_diff_provider_edges(self):
+        stored_edges = {
+            1: {8: {"subscription": ["DE", "US"]}, 2: {"buy": ["US"]}, 3: {"rent": ["AT"]}},
+            2: {}
+        }
+        fresh_edges = {
+            1: {8: {"subscription": ["DE", "US"]}, 2: {"buy": ["US"], "rent": ["US"]}},
+            2: {337: {"subscription": ["FR"]}}
+        }
+
+        upserts, removals = diff_provider_edges(stored_edges, fresh_edges)
+
+        self.assertCountEqual(upserts, [
+            {"head_id": 1, "tail_id": 2, "buy": ["US"], "rent": ["US"], "subscription": None},
+            {"head_id": 2, "tail_id": 337, "buy": None, "rent": None, "subscription": ["FR"]}
+        ])
+        self.assertListEqual(removals, [{"head_id": 1, "tail_id": 3}])
+
+    def test_reference_data_validate(self):
+        mock_driver = MagicMock()
+        mock_session = mock_driver.session.return_value.__enter__.return_value
+        mock_session.run.side_effect = [
+            [{"property_id": 28}, {"property_id": 12}],
+            [{"property_id": "en"}],
+            [{"property_id": "US"}],
+            [{"property_id": 8}]
+        ]
+
+        reference_data = ReferenceData()
+        reference_data.load(mock_driver)
+        reference_data.load(mock_driver)
+
+        self.assertEqual(mock_session.run.call_count, 4)
+
+        known_ids, unknown_ids = reference_data.validate("Genre", [28, 99, 12])
+        self.assertListEqual(known_ids, [28, 12])
+        self.assertListEqual(unknown_ids, [99])
+
+        reference_data.validate("WatchProvider", [8, 1899])
+        self.assertDictEqual(reference_data.get_unknown_ids(), {"Genre": [99], "WatchProvider": [1899]})
+
+    def test_histogram_percentile(self):
+        histogram = Histogram([0.1, 1.0, float("inf")])
+        for value in [0.05] * 50 + [0.5] * 40 + [5.0] * 10:
+            histogram.observe(value)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.get_percentile(50), 0.1)
+        self.assertAlmostEqual(histogram.get_percentile(70), 0.1 + 0.9 * 20 / 40)
+        self.assertEqual(histogram.get_percentile(99), 1.0)
+
+    def test_metrics_summary_since_snapshot(self):
+        increment("api_calls", labels={"endpoint": "company", "status": 200})
+        snapshot = snapshot_metrics()
+
+        increment("api_calls", 2, labels={"endpoint": "company", "status": 200})
+        observe("tmdb_request_seconds", 0.2, {"endpoint": "company"})
+        summary = get_metrics_summary(since=snapshot)
+
+        self.assertEqual(summary["labeled_counters"]["api_calls"]["endpoint=company,status=200"], 2)
+        self.assertEqual(summary["latency"]["tmdb_request_seconds"]["endpoint=company"]["count"], 1)
+        self.assertIn('movie_etl_api_calls_total{endpoint="company",status="200"} 3', format_prometheus())
+        self.assertIn('movie_etl_tmdb_request_seconds_bucket{endpoint="company",le="0.25"}', format_prometheus())
+
+    @patch.dict(os.environ, {"MOVIE_ETL_PROFILE": "cpu", "MOVIE_ETL_PROFILE_PER_MOVIE": "1"})
+    def test_profile_settings(self):
+        self.assertDictEqual(
+            get_profile_settings(profile_dir="/tmp/profiles"),
+            {"modes": {"cpu"}, "output_dir": "/tmp/profiles", "per_movie": True}
+        )
+        self.assertSetEqual(get_profile_settings(profile="")["modes"], set())
+        self.assertIsNone(start_profiling("off", set(), "/tmp/profiles"))
+
+        with self.assertRaises(ValueError):
+            get_profile_settings(profile="gpu")
+
+    async def test_profiler_writes_collapsed_stacks(self):
+        async def single_movie_flow(movie_id):
+            profiler.record_frame(sys._getframe(), "MainThread")
+            await asyncio.sleep(0)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            profiler = start_profiling("test", {"cpu"}, output_dir, per_movie=True)
+            self.assertEqual(signal.getsignal(signal.SIGPROF), profiler.handle_signal)
+
+            await asyncio.gather(single_movie_flow(1), single_movie_flow(2))
+            paths = stop_profiling(profiler)
+
+            self.assertNotEqual(signal.getsignal(signal.SIGPROF), profiler.handle_signal)
+            self.assertListEqual(paths, [os.path.join(output_dir, "test-cpu.collapsed")])
+            with open(os.path.join(output_dir, "test-movies", "1-cpu.collapsed"), "r") as fp:
+                lines = fp.read().splitlines()
+
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in lines))
+        self.assertTrue(any(line.startswith("MainThread;") and "single_movie_flow" in line for line in lines))
+
+    def test_profiler_signal_samples_loop_thread(self):
+        def single_movie_flow(movie_id):
+            # SIGPROF is delivered per interval of CPU time, so spin until it lands here
+            deadline = time.process_time() + 5
+            while sum(profiler.movie_stacks[movie_id].values()) == 0 and time.process_time() < deadline:
+                [i * i for i in range(10000)]
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            profiler = start_profiling("test", {"cpu"}, output_dir, per_movie=True)
+            single_movie_flow(1)
+            stop_profiling(profiler)
+
+        self.assertGreater(sum(profiler.movie_stacks[1].values()), 0)
+        self.assertTrue(all(stack.startswith("MainThread;") for stack in profiler.movie_stacks[1]))
+
+    def test_query_stats_zero_effect_and_slow_log(self):
+        def get_summary(nodes_created, server_ms):
+            summary = MagicMock(result_available_after=server_ms, result_consumed_after=0)
+            summary.counters = MagicMock(
+                nodes_created=nodes_created,
+                nodes_deleted=0,
+                relationships_created=0,
+                relationships_deleted=0,
+                properties_set=nodes_created * 3,
+                contains_updates=nodes_created > 0
+            )
+            return summary
+
+        stats = QueryStats(slow_query_ms=100, slow_query_log_size=2)
+        query = "MATCH (n:Movie {movie_id: 912649})\n  SET n.title = $title"
+        for nodes_created, server_ms in [(1, 10), (0, 150), (0, 300), (2, 200)]:
+            stats.record(query, {"title": "Moana 2"}, get_summary(nodes_created, server_ms), 0.001)
+        report = stats.get_report()
+
+        self.assertEqual(get_query_template(query), "MATCH (n:Movie {movie_id: ?}) SET n.title = $title")
+        self.assertEqual(report["statements"], 4)
+        self.assertEqual(report["zero_effect_writes"], 2)
+        self.assertEqual(report["templates"][0]["nodes_created"], 3)
+        self.assertListEqual([entry["server_ms"] for entry in report["slow_queries"]], [300, 200])
+
+        # a batch where one of three rows matched nothing still updates, so only missed_rows shows it
+        mock_session = MagicMock()
+        mock_session.run.return_value.single.return_value = {"matched": 2}
+        mock_session.run.return_value.consume.return_value = get_summary(2, 10)
+        with patch("src.movie_etl.utils.graph_stats.query_stats", QueryStats()) as batch_stats:
+            run_write(mock_session, "UNWIND $rows AS row MATCH (h:Movie {movie_id: row.head_id}) RETURN count(h) AS matched", {"rows": [1, 2, 3]}, rows=3)
+            batch_report = batch_stats.get_report()
+
+        self.assertEqual(batch_report["zero_effect_writes"], 0)
+        self.assertEqual(batch_report["missed_rows"], 1)
+        self.assertIn("1 batch rows matched nothing", format_query_report_markdown(batch_report))
+
+    def test_lazy_resource_created_once(self):
+        factory = MagicMock(side_effect=lambda: object())
+        resource = LazyResource(factory)
+
+        self.assertFalse(resource.created)
+        instance = resource.get()
+        self.assertIs(resource.get(), instance)
+        factory.assert_called_once()
+
+        fake = object()
+        with resource.override(fake):
+            self.assertIs(resource.get(), fake)
+        self.assertIs(resource.get(), instance)
+
+    async def test_movies_flow_rejects_unknown_granularity(self):
+        from main import movies_flow, sharded_movies_flow
+
+        with self.assertRaises(ValueError):
+            await movies_flow.fn(granularity="task")
+        with self.assertRaises(ValueError):
+            await sharded_movies_flow.fn(granularity="task")
+
+    def test_entry_point_import_is_lazy(self):
+        code = (
+            "import sys, main; "
+            "from src.movie_etl.utils.connections import postgres_engine, neo4j_driver; "
+            "print(postgres_engine.created, neo4j_driver.created, 'numpy' in sys.modules, 'pandas' in sys.modules)"
+        )
+        completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+        self.assertListEqual(completed.stdout.split()[-4:], ["False", "False", "False", "False"])
+
+    def test_raw_archive_replays_latest_response(self):
+        archive = RawArchive()
+        request_key = get_request_key("/movie/912649", {"append_to_response": "credits"})
+
+        with tempfile.TemporaryDirectory() as root_dir:
+            archive.configure(root_dir, "record")
+            archive.save("tmdb/movie", 912649, request_key, b'{"title": "Moana"}')
+            archive.save("tmdb/movie", 912649, request_key, b'{"title": "Moana 2"}')
+            archive.save("tmdb/watch providers", 912649, "/movie/912649/watch/providers", b"{}")
+
+            archive.configure(root_dir, "replay")
+            self.assertTrue(archive.replaying)
+            self.assertEqual(archive.load(request_key), b'{"title": "Moana 2"}')
+            self.assertIsNone(archive.load("/movie/1"))
+            self.assertTrue(archive.contains(request_key))
+            self.assertFalse(archive.contains("/movie/1"))
+            self.assertListEqual(archive.get_entity_ids("tmdb/movie"), ["912649"])
+            self.assertEqual(len(os.listdir(os.path.join(root_dir, "tmdb", "watch_providers"))), 1)
+            archive.close()
+
+        with self.assertRaises(ValueError):
+            archive.configure(None, "replay")
+
+    def test_get_existing_node_ids_requires_timestamp(self):
+        mock_driver = MagicMock()
+        mock_session = mock_driver.session.return_value.__enter__.return_value
+        # movie 2 has a Movie node but no loaded_at, so the query leaves it out
+        mock_session.run.return_value = [{"property_id": 1}]
+
+        loaded_ids = get_existing_node_ids("Movie", "movie_id", [1, 2], mock_driver)
+
+        self.assertSetEqual(loaded_ids, {1})
+        self.assertIn("AND n.loaded_at IS NOT NULL", mock_session.run.call_args[0][0])
+        self.assertDictEqual(mock_session.run.call_args[1]["parameters"], {"property_ids": [1, 2], "loaded_after": None})
+
+    def test_get_unenriched_person_ids_of_run_movies(self):
+        mock_driver = MagicMock()
+        mock_session = mock_driver.session.return_value.__enter__.return_value
+        mock_session.run.return_value = [{"person_id": 2524}]
+
+        person_ids = get_unenriched_person_ids([912649], mock_driver)
+
+        self.assertListEqual(person_ids, [2524])
+        self.assertIn("MATCH (m:Movie)--(p:Person) WHERE m.movie_id IN $movie_ids", mock_session.run.call_args[0][0])
+        self.assertDictEqual(mock_session.run.call_args[1]["parameters"], {"movie_ids": [912649], "enriched_after": None})
+
+    def test_load_graph_schema(self):
+        schema = load_graph_schema()
+
+        self.assertEqual(schema["node_keys"]["WatchProvider"], "provider_id")
+        self.assertEqual(len(schema["node_keys"]), 8)
+        self.assertIn("AVAILABLE_ON", schema["relationship_types"])
+        self.assertEqual(schema["relationship_types"].count("PRODUCED_BY"), 1)
+
+    def test_part_writer_keeps_sparse_columns(self):
+        import pyarrow.parquet as pq
+
+        with tempfile.TemporaryDirectory() as export_dir:
+            writer = PartWriter(export_dir, "nodes", "test")
+            writer.add("Movie", {"movie_id": 1, "title": "Moana"})
+            writer.add("Movie", {"movie_id": 2, "loaded_at": "2024-11-27T00:00:00Z", "credits_deferred": True})
+            writer.flush()
+
+            rows = pq.read_table(os.path.join(export_dir, writer.get_summary()["Movie"]["files"][0])).to_pylist()
+
+        self.assertListEqual(rows, [
+            {"movie_id": 1, "title": "Moana", "loaded_at": None, "credits_deferred": None},
+            {"movie_id": 2, "title": None, "loaded_at": "2024-11-27T00:00:00Z", "credits_deferred": True}
+        ])
+
+    def test_incremental_edges_to_csr(self):
+        movie, company, genre = ("Movie", 1), ("Company", 5), ("Genre", 18)
+        exports = [
+            {"heads": {movie, company, genre}, "edges": [(movie, "HAS_GENRE", genre), (movie, "PRODUCED_BY", company)]},
+            # the movie changed and lost its genre, so its edges are replaced
+            {"heads": {movie}, "edges": [(movie, "PRODUCED_BY", company)]}
+        ]
+        nodes, edges = resolve_edges(exports)
+        csr = build_csr(nodes, edges, ["HAS_GENRE", "PRODUCED_BY"])
+
+        self.assertListEqual(csr["nodes"], [company, genre, movie])
+        self.assertListEqual(csr["indptr"].tolist(), [0, 0, 0, 1])
+        self.assertListEqual(csr["indices"].tolist(), [0])
+        self.assertListEqual(csr["edge_types"].tolist(), [1])
+
+if __name__ == '__main__':
+    unittest.main()